@@ -1,8 +1,11 @@
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
 from .admin_forms import CustomUserForm, TaskAdminForm
 from .models import Task
+from .sharding import DEFAULT_SHARD, fan_out, save_task
 
 User = get_user_model()
 
@@ -12,6 +15,10 @@ class CustomUserAdmin(UserAdmin):
         (None, {"fields": ("username", "password")}),
         ("Personal Info", {"fields": ("first_name", "last_name", "email", "manager")}),
         ("Permissions", {"fields": ("is_active", "is_superuser")}),
+        (
+            "Collection",
+            {"fields": ("next_task_ordering", "threshold", "threshold_days")},
+        ),
     )
     add_fieldsets = (
         (
@@ -37,15 +44,68 @@ class CustomUserAdmin(UserAdmin):
     form = CustomUserForm
 
 
+class ShardListFilter(admin.SimpleListFilter):
+    """
+    Database whose tasks are listed, `default` (the pool and unsharded teams) unless
+    another shard is picked. A changelist pages through a single queryset, so shards
+    are listed one at a time with their task count.
+    """
+
+    title = "shard"
+    parameter_name = "shard"
+
+    def lookups(self, request, model_admin):
+        counts = fan_out(lambda shard: Task.objects.count())
+        return [(shard, f"{shard} ({count})") for shard, count in counts.items()]
+
+    def choices(self, changelist):
+        # no "All", a queryset can not span databases
+        for lookup, title in self.lookup_choices:
+            yield {
+                "selected": (self.value() or DEFAULT_SHARD) == lookup,
+                "query_string": changelist.get_query_string(
+                    {self.parameter_name: lookup}
+                ),
+                "display": title,
+            }
+
+    def queryset(self, request, queryset):
+        shard = self.value() or DEFAULT_SHARD
+        if shard not in settings.SHARDS:
+            return queryset.none()
+        return queryset.using(shard)
+
+
 class TaskAdmin(admin.ModelAdmin):
     form = TaskAdminForm
     readonly_fields = ["is_collected", "collected_at", "remaining_amount"]
+    list_filter = [ShardListFilter]
+
+    def get_object(self, request, object_id, from_field=None):
+        # the task lives on its collector's shard
+        queryset = self.get_queryset(request)
+        field = (
+            self.model._meta.get_field(from_field)
+            if from_field
+            else self.model._meta.pk
+        )
+        try:
+            object_id = field.to_python(object_id)
+        except (ValidationError, ValueError):
+            return None
+        found = fan_out(
+            lambda shard: queryset.using(shard)
+            .filter(**{field.name: object_id})
+            .first()
+        )
+        return next((task for task in found.values() if task is not None), None)
 
     def save_model(self, request, obj, form, change):
         # Calculate the remaining amount based on the amount being added
         remaining_amount = obj.amount
         obj.remaining_amount = remaining_amount
-        super().save_model(request, obj, form, change)
+        # on the collector's shard, moved there when reassigned to another team
+        save_task(obj)
 
     # in case we need to send manager inside request to see only his managed cash collectors
 
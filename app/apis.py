@@ -1,5 +1,8 @@
-import os
+import hashlib
+import json
 from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router, transaction
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
@@ -10,38 +13,120 @@ from rest_framework.generics import (
     CreateAPIView,
 )
 from rest_framework.response import Response
-from .models import Task
+from . import outbox, push
+from .assignment import assign_tasks
+from .models import Payment, Task
+from .overdue import overdue_tasks
+from .pagination import DueDateCursorPagination
+from .permissions import IsManager
+from .settlement import settle
 from .serializers import (
     ReadTaskSerializer,
     EmptySerializer,
     IsFrozenSerializer,
     PaySomeCollectedSerializer,
     CustomCollectSerializer,
+    SyncCollectSerializer,
+    SyncCollectResponseSerializer,
+    AssignTasksSerializer,
+    SettlementSerializer,
+    SettlementResultSerializer,
+    AssignmentResultSerializer,
+    LocationSerializer,
+    TeamMemberSerializer,
+    OverdueTaskSerializer,
+    OverdueFilterSerializer,
+    HomeScreenQuerySerializer,
+    HomeScreenSerializer,
+)
+from .sharding import get_shard
+from .thresholds import get_threshold_policy
+from .utility import (
+    is_frozen,
+    collect_next_task,
+    get_done_tasks,
+    get_home_screen,
+    get_next_task,
+    sync_collected_tasks,
+    with_open_tasks,
 )
-from .utility import is_frozen, collect_next_task, get_task, get_next_task
 
 User = get_user_model()
 
 
-class GetDoneTasks(ListAPIView):
+def get_location(data) -> dict:
+    """
+    Validate the optional `latitude`/`longitude` pair sent by the client.
+
+    Returns:
+        dict: The validated location, or None when no location was sent.
+    """
+    serializer = LocationSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data or None
+
+
+def get_requested_fields(query_params, serializer_class):
+    """
+    Validate the optional `fields` query parameter against a serializer's fields.
+
+    Returns:
+        list: The requested field names, or None when no `fields` was sent.
+
+    Raises:
+        ValidationError: If a field is not part of the serializer.
+    """
+    fields = query_params.get("fields")
+    if fields is None:
+        return None
+    fields = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = set(fields) - set(serializer_class().fields)
+    if unknown:
+        raise ValidationError(
+            {"fields": f"Unknown fields: {', '.join(sorted(unknown))}"}
+        )
+    return fields
+
+
+class SparseFieldsMixin:
+    """
+    `?fields=id,amount` narrows the response, and the columns read, to those fields.
+    """
+
+    def get_requested_fields(self):
+        if not hasattr(self, "_requested_fields"):
+            self._requested_fields = get_requested_fields(
+                self.request.query_params, self.serializer_class
+            )
+        return self._requested_fields
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault("fields", self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+
+class GetDoneTasks(SparseFieldsMixin, ListAPIView):
     """
     Retrieve the tasks that have been collected by the user.
 
-    API endpoint to retrieve the tasks that have been collected by the authenticated user.
+    API endpoint to retrieve the tasks that have been collected by the authenticated user,
+    including the ones already archived. `?fields=` limits the fields returned.
     """
 
     permission_classes = [IsAuthenticated]
     serializer_class = ReadTaskSerializer
 
     def get_queryset(self):
-        return get_task(self.request.user, is_collected=True)
+        return get_done_tasks(self.request.user, self.get_requested_fields())
 
 
-class GetNextTask(RetrieveAPIView):
+class GetNextTask(SparseFieldsMixin, RetrieveAPIView):
     """
     Retrieve the next task assigned to the user.
 
-    API endpoint to retrieve the next task assigned to the authenticated user.
+    API endpoint to retrieve the next task assigned to the authenticated user,
+    or the nearest one when `latitude` and `longitude` query parameters are sent.
+    `?fields=` limits the fields returned.
     """
 
     permission_classes = [IsAuthenticated]
@@ -49,14 +134,19 @@ class GetNextTask(RetrieveAPIView):
     queryset = Task.objects.all()
 
     def get_object(self):
-        return get_next_task(self.request.user)
+        return get_next_task(
+            self.request.user,
+            get_location(self.request.query_params),
+            self.get_requested_fields(),
+        )
 
 
 class CollectTask(UpdateAPIView):
     """
     Collect Task API endpoint.
 
-    API endpoint for collecting the next task if it exists and the user is not frozen.
+    API endpoint for collecting the next task if it exists and the user is not frozen,
+    the nearest one when `latitude` and `longitude` are sent in the body.
     """
 
     permission_classes = [IsAuthenticated]
@@ -65,10 +155,11 @@ class CollectTask(UpdateAPIView):
     user = None
 
     def get_object(self):
-        return get_next_task(self.request.user)
+        return get_next_task(self.request.user, get_location(self.request.data))
 
     def update(self, request, *args, **kwargs):
         collect_next_task(self.get_object(), request.user)
+        push.publish_state([request.user.pk])
         return Response(status=status.HTTP_200_OK)
 
 
@@ -83,12 +174,46 @@ class CustomCollectTask(CollectTask):
     serializer_class = CustomCollectSerializer
 
     def update(self, request, *args, **kwargs):
-        data = request.data
-        self.serializer_class(data=data).is_valid(raise_exception=True)
-        collect_next_task(self.get_object(), request.user, data.get("collect_date"))
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        collect_next_task(
+            self.get_object(), request.user, serializer.validated_data["collect_date"]
+        )
+        push.publish_state([request.user.pk])
         return Response(status=status.HTTP_200_OK)
 
 
+class SyncCollectedTasks(CreateAPIView):
+    """
+    Sync Collected Tasks API endpoint.
+
+    API endpoint for uploading the tasks a user collected while offline, as a batch of
+    (task, collect_date) events that are replayed in chronological order.
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = SyncCollectSerializer
+    queryset = None
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = sync_collected_tasks(
+            request.user, serializer.validated_data["events"]
+        )
+        push.publish_state([request.user.pk])
+        return Response(
+            SyncCollectResponseSerializer(
+                {
+                    "results": results,
+                    "collected": request.user.collected,
+                    "is_frozen": is_frozen(request.user),
+                }
+            ).data,
+            status=status.HTTP_200_OK,
+        )
+
+
 class CheckStatus(RetrieveAPIView):
     """
     Check User Status API endpoint.
@@ -106,6 +231,33 @@ class CheckStatus(RetrieveAPIView):
         )
 
 
+class HomeScreen(RetrieveAPIView):
+    """
+    Home Screen API endpoint.
+
+    API endpoint returning the freeze status, collected balance, next task and the
+    latest `recent` collected tasks of the authenticated user in one request. The
+    `version` is also sent as ETag, a matching `If-None-Match` gets a 304.
+    """
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = HomeScreenSerializer
+    queryset = None
+
+    def retrieve(self, request, *args, **kwargs):
+        query = HomeScreenQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        home = get_home_screen(request.user, query.validated_data["recent"])
+        data = self.get_serializer({**home, "version": ""}).data
+        data["version"] = hashlib.sha1(
+            json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True).encode()
+        ).hexdigest()[:16]
+        etag = f'"{data["version"]}"'
+        if etag in request.headers.get("If-None-Match", ""):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return Response(data, status=status.HTTP_200_OK, headers={"ETag": etag})
+
+
 class PayAllCollected(CreateAPIView):
     """
     Pay All Collected API endpoint.
@@ -117,12 +269,18 @@ class PayAllCollected(CreateAPIView):
     queryset = None
 
     def create(self, request, *args, **kwargs):
-        request.user.collected = 0
-        request.user.reached_limit_date = None
-        request.user.save(update_fields=["collected", "reached_limit_date"])
-        Task.objects.filter(remaining_amount__gt=0, assigned_to=request.user).update(
-            remaining_amount=0
-        )
+        with transaction.atomic(using=router.db_for_write(User, instance=request.user)):
+            paid = request.user.collected
+            request.user.collected = 0
+            request.user.reached_limit_date = None
+            request.user.save(update_fields=["collected", "reached_limit_date"])
+            Task.objects.filter(
+                remaining_amount__gt=0, assigned_to=request.user
+            ).update(remaining_amount=0)
+            outbox.cancel_freeze(request.user)
+            Payment.objects.create(user=request.user, amount=paid)
+            outbox.enqueue(outbox.PAYMENT, request.user, paid=paid, collected=0)
+            push.publish_state([request.user.pk])
         return Response(status=status.HTTP_200_OK)
 
 
@@ -138,7 +296,7 @@ class PaySomeOfCollected(CreateAPIView):
     queryset = None
 
     @classmethod
-    def get_freeze_task_date(cls, task_id):
+    def get_freeze_task_date(cls, task_id, threshold):
         # Get remaining tasks with IDs greater than the given task_id
         remaining_tasks = Task.objects.filter(pk__gt=task_id)
         total_amount = 0
@@ -146,7 +304,7 @@ class PaySomeOfCollected(CreateAPIView):
         for task in remaining_tasks:
             total_amount += task.amount
             # Check if the task amount equals the threshold amount
-            if task.amount == os.environ.get("THRESHOLD", 5000):
+            if task.amount == threshold:
                 # Return the collected_at date of the task that reached the threshold
                 # to count the freeze time after
                 return task.collected_at
@@ -167,9 +325,12 @@ class PaySomeOfCollected(CreateAPIView):
                 task.remaining_amount -= collected
 
                 # Check if user's total collected amount reaches or exceeds the threshold
-                if user.collected >= os.environ.get("THRESHOLD", 5000):
+                threshold = get_threshold_policy(user).amount
+                if user.collected >= threshold:
                     # Set the reached_limit_date to the date of the task that reached the threshold
-                    user.reached_limit_date = self.get_freeze_task_date(task.id)
+                    user.reached_limit_date = self.get_freeze_task_date(
+                        task.id, threshold
+                    )
                 break
         return updated_tasks
 
@@ -181,18 +342,127 @@ class PaySomeOfCollected(CreateAPIView):
         # Check if the collected amount is valid
         if request.user.collected == 0 or collected > request.user.collected:
             raise ValidationError("Invalid collected amount")
-        # Deduct the collected amount from the user's total collected amount
-        request.user.collected -= collected
-        # Get all tasks with remaining amounts and assigned to the user
-        tasks = Task.objects.filter(
-            remaining_amount__gt=0, assigned_to=request.user
-        ).order_by("id")
-        # Update the tasks' remaining amounts based on the collected amount
-        updated_tasks = self.pay_some_tasks(request.user, tasks, collected)
-        # Reset reached_limit_date if user's collected amount falls below the threshold
-        if request.user.collected < os.environ.get("THRESHOLD", 5000):
-            request.user.reached_limit_date = None
-        request.user.save()
-        # Bulk update the remaining amounts of tasks
-        Task.objects.bulk_update(updated_tasks, ["remaining_amount"])
+        with transaction.atomic(using=router.db_for_write(User, instance=request.user)):
+            reached_limit_date = request.user.reached_limit_date
+            # Deduct the collected amount from the user's total collected amount
+            request.user.collected -= collected
+            # Get all tasks with remaining amounts and assigned to the user
+            tasks = Task.objects.filter(
+                remaining_amount__gt=0, assigned_to=request.user
+            ).order_by("id")
+            # Update the tasks' remaining amounts based on the collected amount
+            updated_tasks = self.pay_some_tasks(request.user, tasks, collected)
+            # Reset reached_limit_date if user's collected amount falls below the threshold
+            if request.user.collected < get_threshold_policy(request.user).amount:
+                request.user.reached_limit_date = None
+            # the pending frozen event follows the new date
+            if request.user.reached_limit_date != reached_limit_date:
+                outbox.reschedule_freeze(request.user)
+            request.user.save(update_fields=["collected", "reached_limit_date"])
+            # Bulk update the remaining amounts of tasks
+            Task.objects.bulk_update(updated_tasks, ["remaining_amount"])
+            Payment.objects.create(user=request.user, amount=collected)
+            outbox.enqueue(
+                outbox.PAYMENT,
+                request.user,
+                paid=collected,
+                collected=request.user.collected,
+            )
+            push.publish_state([request.user.pk])
         return Response(status=status.HTTP_200_OK)
+
+
+class AssignTasks(CreateAPIView):
+    """
+    Assign Tasks API endpoint.
+
+    API endpoint for managers to distribute unassigned tasks across their cash collectors,
+    balanced by outstanding amount and task count.
+    """
+
+    permission_classes = [IsManager]
+    serializer_class = AssignTasksSerializer
+    queryset = None
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = assign_tasks(
+            request.user,
+            task_ids=serializer.validated_data.get("task_ids"),
+            dry_run=serializer.validated_data["dry_run"],
+        )
+        return Response(
+            AssignmentResultSerializer(results, many=True).data,
+            status=status.HTTP_200_OK,
+        )
+
+
+class SettleTeam(CreateAPIView):
+    """
+    Settle Team API endpoint.
+
+    API endpoint for managers to pay out many cash collectors at once, either
+    `{"all": true}` or `{"payments": [{"collector": 1, "amount": 100}]}`, in one
+    transaction.
+    """
+
+    permission_classes = [IsManager]
+    serializer_class = SettlementSerializer
+    queryset = None
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        payments = serializer.validated_data.get("payments")
+        results = settle(
+            request.user,
+            payments=(
+                None
+                if payments is None
+                else {payment["collector"]: payment["amount"] for payment in payments}
+            ),
+        )
+        return Response(
+            SettlementResultSerializer(results, many=True).data,
+            status=status.HTTP_200_OK,
+        )
+
+
+class TeamReport(ListAPIView):
+    """
+    Team Report API endpoint.
+
+    API endpoint for managers to list their cash collectors with their collected
+    balance, freeze status and open tasks.
+    """
+
+    permission_classes = [IsManager]
+    serializer_class = TeamMemberSerializer
+
+    def get_queryset(self):
+        return with_open_tasks(User.objects.filter(manager=self.request.user)).order_by(
+            "id"
+        )
+
+
+class OverdueTasks(ListAPIView):
+    """
+    Overdue Tasks API endpoint.
+
+    API endpoint for managers to list the uncollected tasks of their team past their due
+    date, earliest first, with cursor pagination. `collector` restricts the feed to one
+    collector, `manager` lists another manager's team.
+    """
+
+    permission_classes = [IsManager]
+    serializer_class = OverdueTaskSerializer
+    pagination_class = DueDateCursorPagination
+
+    def get_queryset(self):
+        serializer = OverdueFilterSerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        manager_id = serializer.validated_data.get("manager", self.request.user.pk)
+        return overdue_tasks(
+            manager_id, collector_id=serializer.validated_data.get("collector")
+        ).using(get_shard(manager_id))
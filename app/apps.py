@@ -1,6 +1,12 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
 
 
 class AppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "app"
+
+    def ready(self):
+        from app import checks, signals  # noqa: F401
+
+        if apps.is_installed("drf_spectacular"):
+            from app import openapi  # noqa: F401
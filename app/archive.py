@@ -0,0 +1,58 @@
+"""
+Hot/cold archival of settled tasks
+
+Collected tasks with nothing left to pay are moved from `Task` to `ArchivedTask` so
+the live table and its indexes stay sized by the open workload.
+"""
+
+from django.db import router, transaction
+
+from app.models import ArchivedTask, Task
+
+# columns copied to the archive and read back by the done tasks list
+ARCHIVED_FIELDS = (
+    "assigned_to_id",
+    "name",
+    "description",
+    "amount",
+    "due_date",
+    "collected_at",
+    "remaining_amount",
+    "priority",
+    "latitude",
+    "longitude",
+)
+
+
+def archive_batch(cutoff, batch_size: int) -> int:
+    """
+    Move up to `batch_size` tasks settled before `cutoff` to the archive.
+
+    The copy and the delete share one short transaction, so batches can be stopped and
+    resumed at any point without losing or duplicating tasks.
+
+    Args:
+        cutoff (datetime): Only tasks collected before it are archived.
+        batch_size (int): Maximum number of tasks to move.
+
+    Returns:
+        int: Number of tasks archived, 0 when nothing is left to archive.
+    """
+    with transaction.atomic(using=router.db_for_write(Task)):
+        tasks = list(
+            Task.objects.select_for_update()
+            .filter(is_collected=True, remaining_amount=0, collected_at__lt=cutoff)
+            .order_by("collected_at")
+            .only("id", *ARCHIVED_FIELDS)[:batch_size]
+        )
+        if not tasks:
+            return 0
+        ArchivedTask.objects.bulk_create(
+            ArchivedTask(
+                task_id=task.id,
+                **{field: getattr(task, field) for field in ARCHIVED_FIELDS},
+            )
+            for task in tasks
+        )
+        Task.objects.filter(pk__in=[task.id for task in tasks]).delete()
+    return len(tasks)
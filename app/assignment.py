@@ -0,0 +1,131 @@
+"""
+Automatic task assignment
+
+Hands the pool of unassigned tasks out to a manager's cash collectors. The pool lives
+on `default`, tasks handed to a team placed on a shard are moved there.
+"""
+
+import heapq
+import os
+
+from django.contrib.auth import get_user_model
+from django.db import router, transaction
+from rest_framework.exceptions import ValidationError
+
+from app.models import Task
+from app.overdue import refresh_overdue_counts
+from app.push import publish_state
+from app.sharding import DEFAULT_SHARD, move_tasks
+from app.thresholds import get_threshold_policy
+from app.utility import is_frozen, with_open_tasks
+
+User = get_user_model()
+
+# keep `IN (...)` lists below SQLite's bound parameter limit
+UPDATE_BATCH_SIZE = 900
+
+
+def get_eligible_collectors(manager: User) -> list:
+    """
+    Retrieve the manager's collectors that can take more tasks, with their current load.
+
+    Collectors who are frozen, or whose collected cash is within
+    `ASSIGN_THRESHOLD_RATIO` of their threshold, are left out as they are about to freeze.
+
+    Args:
+        manager (User): The manager whose collectors should be loaded.
+
+    Returns:
+        list: Users annotated with `open_amount` and `open_count` of their uncollected tasks.
+    """
+    ratio = float(os.environ.get("ASSIGN_THRESHOLD_RATIO", 0.9))
+    collectors = with_open_tasks(
+        User.objects.filter(manager=manager, is_superuser=False, is_active=True)
+    )
+    return [
+        collector
+        for collector in collectors
+        if not collector.reached_limit_date
+        and collector.collected < get_threshold_policy(collector).amount * ratio
+        and not is_frozen(collector)
+    ]
+
+
+def assign_tasks(manager: User, task_ids=None, dry_run=False) -> list:
+    """
+    Distribute unassigned tasks across the manager's collectors, balancing their load.
+
+    Tasks are handed out largest amount first, each to the collector with the lowest
+    (outstanding amount, open task count) at that point, tracked in a min-heap.
+
+    Args:
+        manager (User): The manager whose collectors receive the tasks.
+        task_ids (list, optional): Restrict the pool to these task ids (default: all
+            unassigned, uncollected tasks).
+        dry_run (bool): Compute the assignment without saving it (default: False).
+
+    Returns:
+        list: Per collector dicts with `id`, `username`, `tasks` and `amount` assigned.
+
+    Raises:
+        ValidationError: If the manager has no collector able to take tasks.
+    """
+    # the manager's team, the current shard
+    shard = router.db_for_write(Task) or DEFAULT_SHARD
+    with transaction.atomic(using=DEFAULT_SHARD), transaction.atomic(using=shard):
+        pool = (
+            Task.objects.using(DEFAULT_SHARD)
+            .select_for_update()
+            .filter(assigned_to__isnull=True, is_collected=False)
+        )
+        if task_ids is not None:
+            pool = pool.filter(pk__in=task_ids)
+        pool = list(pool.order_by("-amount", "id").values_list("id", "amount"))
+        if not pool:
+            return []
+
+        collectors = get_eligible_collectors(manager)
+        if not collectors:
+            raise ValidationError("No collectors available for assignment")
+
+        heap = [
+            (collector.open_amount, collector.open_count, collector.id)
+            for collector in collectors
+        ]
+        heapq.heapify(heap)
+        assigned_ids = {collector.id: [] for collector in collectors}
+        assigned_amount = dict.fromkeys(assigned_ids, 0.0)
+        for task_id, amount in pool:
+            open_amount, open_count, collector_id = heap[0]
+            heapq.heapreplace(
+                heap, (open_amount + amount, open_count + 1, collector_id)
+            )
+            assigned_ids[collector_id].append(task_id)
+            assigned_amount[collector_id] += amount
+
+        if not dry_run:
+            # one UPDATE ... WHERE id IN (...) per collector, bulk_update would build
+            # a CASE branch per task which is far slower for pools this size
+            for collector_id, ids in assigned_ids.items():
+                for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+                    Task.objects.using(DEFAULT_SHARD).filter(
+                        pk__in=ids[start : start + UPDATE_BATCH_SIZE]
+                    ).update(assigned_to_id=collector_id)
+            assigned_collectors = [
+                collector_id for collector_id, ids in assigned_ids.items() if ids
+            ]
+            if shard != DEFAULT_SHARD:
+                move_tasks(assigned_collectors, DEFAULT_SHARD, shard)
+            refresh_overdue_counts(User.objects.filter(pk__in=assigned_collectors))
+            publish_state(assigned_collectors)
+
+    return [
+        {
+            "id": collector.id,
+            "username": collector.get_username(),
+            "tasks": len(assigned_ids[collector.id]),
+            "amount": assigned_amount[collector.id],
+        }
+        for collector in collectors
+        if assigned_ids[collector.id]
+    ]
@@ -0,0 +1,122 @@
+"""
+Async read endpoints
+
+Native async counterparts of `GetDoneTasks`, `GetNextTask` and `CheckStatus` for
+ASGI deployments (`ASYNC_VIEWS=1`), the request waits on the database without
+holding a worker thread. DRF views are sync only, so `AsyncAPIView` does the part of
+their request cycle these endpoints need: JWT authentication, the read throttle and
+rendering the data, errors included, the way DRF does.
+"""
+
+from django.http import HttpResponseBase, JsonResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, Throttled
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from app.apis import get_location, get_requested_fields
+from app.authentication import ShardedJWTAuthentication
+from app.serializers import ReadTaskSerializer
+from app.throttles import ReadRateThrottle
+from app.utility import aget_next_task, ais_frozen, get_done_tasks
+
+
+def render(data, status_code=status.HTTP_200_OK) -> JsonResponse:
+    # compact separators, as DRF's JSONRenderer
+    return JsonResponse(
+        data,
+        status=status_code,
+        encoder=JSONEncoder,
+        safe=False,
+        json_dumps_params={"separators": (",", ":")},
+    )
+
+
+class AsyncAPIView(View):
+    """
+    Base of the async read views, `get` returns the data to render.
+    """
+
+    authentication_class = ShardedJWTAuthentication
+    throttle_class = ReadRateThrottle
+    http_method_names = ["get"]
+
+    async def dispatch(self, request, *args, **kwargs):
+        authentication = self.authentication_class()
+        try:
+            credentials = await authentication.aauthenticate(request)
+            if credentials is None:
+                raise NotAuthenticated()
+            request.user, request.auth = credentials
+            throttle = self.throttle_class()
+            if not throttle.allow_request(request, self):
+                raise Throttled(throttle.wait())
+            self.request = Request(request)
+            data = await super().dispatch(request, *args, **kwargs)
+            if isinstance(data, HttpResponseBase):
+                return data
+        except APIException as exc:
+            response = render(
+                (
+                    exc.detail
+                    if isinstance(exc.detail, (list, dict))
+                    else {"detail": exc.detail}
+                ),
+                status_code=exc.status_code,
+            )
+            if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+                response["WWW-Authenticate"] = authentication.authenticate_header(
+                    request
+                )
+            if getattr(exc, "wait", None):
+                response["Retry-After"] = str(int(exc.wait))
+            return response
+        return render(data)
+
+
+class AsyncGetDoneTasks(AsyncAPIView):
+    """
+    Async `GetDoneTasks`.
+    """
+
+    async def get(self, request):
+        fields = get_requested_fields(self.request.query_params, ReadTaskSerializer)
+        tasks = get_done_tasks(request.user, fields)
+        paginator = LimitOffsetPagination()
+        paginator.request = self.request
+        paginator.limit = paginator.get_limit(self.request)
+        paginator.offset = paginator.get_offset(self.request)
+        paginator.count = await tasks.acount()
+        page = [
+            task
+            async for task in tasks[
+                paginator.offset : paginator.offset + paginator.limit
+            ]
+        ]
+        return paginator.get_paginated_response(
+            ReadTaskSerializer(page, many=True, fields=fields).data
+        ).data
+
+
+class AsyncGetNextTask(AsyncAPIView):
+    """
+    Async `GetNextTask`.
+    """
+
+    async def get(self, request):
+        fields = get_requested_fields(self.request.query_params, ReadTaskSerializer)
+        task = await aget_next_task(
+            request.user, get_location(self.request.query_params), fields
+        )
+        return ReadTaskSerializer(task, fields=fields).data
+
+
+class AsyncCheckStatus(AsyncAPIView):
+    """
+    Async `CheckStatus`.
+    """
+
+    async def get(self, request):
+        return {"is_frozen": await ais_frozen(request.user)}
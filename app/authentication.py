@@ -0,0 +1,72 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from app.sharding import aget_shard, current_shard, get_shard
+
+
+class ShardedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that loads the user from their team's shard.
+
+    The shard is kept as the current shard for the rest of the request, so the views'
+    queries are routed to it by `app.sharding.ShardRouter`.
+    """
+
+    def get_user(self, validated_token):
+        shard = None
+        if api_settings.USER_ID_CLAIM in validated_token:
+            shard = get_shard(validated_token[api_settings.USER_ID_CLAIM])
+        current_shard.set(shard)
+        return super().get_user(validated_token)
+
+    async def aauthenticate(self, request):
+        """
+        Async `authenticate` for the async views, the shard and the user are read
+        with the async cache and ORM APIs.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        """
+        Async `get_user`, with the same checks as simplejwt's.
+        """
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification")
+            ) from e
+        current_shard.set(await aget_shard(user_id))
+
+        try:
+            user = await self.user_model.objects.aget(
+                **{api_settings.USER_ID_FIELD: user_id}
+            )
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(
+                _("User not found"), code="user_not_found"
+            ) from e
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
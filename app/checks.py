@@ -0,0 +1,43 @@
+"""
+System checks of the app's settings
+
+Run by `manage.py check`, `migrate` and `runserver`, so a bad value stops the
+deployment instead of failing the requests that read it.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Warning, register
+
+from app.models import NextTaskOrdering
+
+
+@register()
+def check_next_task_ordering(app_configs, **kwargs):
+    if settings.NEXT_TASK_ORDERING not in NextTaskOrdering.values:
+        return [
+            Error(
+                f"NEXT_TASK_ORDERING is {settings.NEXT_TASK_ORDERING!r}.",
+                hint=f"Use one of {', '.join(NextTaskOrdering.values)}.",
+                id="app.E001",
+            )
+        ]
+    return []
+
+
+@register()
+def check_shard_cache(app_configs, **kwargs):
+    if len(settings.SHARDS) > 1 and isinstance(
+        caches[settings.SHARD_CACHE], LocMemCache
+    ):
+        return [
+            Warning(
+                f"SHARD_CACHE {settings.SHARD_CACHE!r} is kept in each process's memory.",
+                hint="Point it to a cache shared by all workers, otherwise the other "
+                "workers route a moved team to its old shard for up to "
+                "SHARD_CACHE_TIMEOUT seconds.",
+                id="app.W001",
+            )
+        ]
+    return []
@@ -0,0 +1,71 @@
+"""
+Spatial grid used to find the nearest task
+
+The world is cut into square cells of `GRID_CELL_SIZE` degrees, numbered row by row,
+so the cells of one grid row are a contiguous range of `Task.grid_cell` values.
+"""
+
+import math
+
+# ~1.1 km at the equator, changing it requires recomputing `Task.grid_cell`
+GRID_CELL_SIZE = 0.01
+GRID_COLUMNS = round(360 / GRID_CELL_SIZE)
+GRID_ROWS = round(180 / GRID_CELL_SIZE)
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def cell_position(latitude: float, longitude: float) -> tuple:
+    """
+    Return the (row, column) of the grid cell containing a point.
+    """
+    row = min(int((latitude + 90) / GRID_CELL_SIZE), GRID_ROWS - 1)
+    column = min(int((longitude + 180) / GRID_CELL_SIZE), GRID_COLUMNS - 1)
+    return row, column
+
+
+def grid_cell(latitude: float, longitude: float) -> int:
+    """
+    Return the grid cell number of a point.
+    """
+    row, column = cell_position(latitude, longitude)
+    return row * GRID_COLUMNS + column
+
+
+def square_ranges(latitude: float, longitude: float, radius: int) -> list:
+    """
+    Cell number ranges covering the square of cells `radius` cells around a point.
+
+    Returns:
+        list: Inclusive (first, last) grid cell ranges, one per grid row.
+    """
+    row, column = cell_position(latitude, longitude)
+    first_column = max(column - radius, 0)
+    last_column = min(column + radius, GRID_COLUMNS - 1)
+    return [
+        (r * GRID_COLUMNS + first_column, r * GRID_COLUMNS + last_column)
+        for r in range(max(row - radius, 0), min(row + radius, GRID_ROWS - 1) + 1)
+    ]
+
+
+def square_min_distance(latitude: float, radius: int) -> float:
+    """
+    Lower bound, in km, of the distance from a point to anything outside its square.
+
+    Cells are narrowest along the longitude, so the bound uses the cell width at the
+    point's latitude.
+    """
+    width = GRID_CELL_SIZE * KM_PER_DEGREE * math.cos(math.radians(latitude))
+    return radius * min(width, GRID_CELL_SIZE * KM_PER_DEGREE)
+
+
+def distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """
+    Great-circle (haversine) distance between two points in km.
+    """
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
@@ -0,0 +1,50 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+
+from app.archive import archive_batch
+from app.sharding import fan_out
+
+
+class Command(BaseCommand):
+    help = "Move settled tasks older than the retention window to the archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=int(os.environ.get("ARCHIVE_RETENTION_DAYS", 90)),
+            help="archive tasks collected more than this many days ago",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.1,
+            help="seconds to pause between batches to let other writers in",
+        )
+        parser.add_argument(
+            "--max-batches",
+            type=int,
+            default=None,
+            help="stop after this many batches per shard, rerun to resume",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = datetime.now() - timedelta(days=options["days"])
+
+        def archive_shard(shard):
+            archived = batches = 0
+            while options["max_batches"] is None or batches < options["max_batches"]:
+                moved = archive_batch(cutoff, options["batch_size"])
+                if not moved:
+                    break
+                archived += moved
+                batches += 1
+                time.sleep(options["sleep"])
+            return archived
+
+        for shard, archived in fan_out(archive_shard).items():
+            self.stdout.write(f"{shard}: archived {archived} tasks")
@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from app.assignment import assign_tasks
+from app.sharding import get_shard, use_shard
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Distribute unassigned tasks across a manager's cash collectors"
+
+    def add_arguments(self, parser):
+        parser.add_argument("manager", help="username of the manager")
+        parser.add_argument(
+            "--task",
+            type=int,
+            action="append",
+            dest="task_ids",
+            help="only assign this task id (repeatable)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="show the assignment without saving it",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            manager = User.objects.get(username=options["manager"], is_superuser=True)
+        except User.DoesNotExist:
+            raise CommandError(f"Manager {options['manager']} does not exist")
+        # the team and its pool live on the manager's shard
+        with use_shard(get_shard(manager.pk)):
+            try:
+                results = assign_tasks(
+                    manager, task_ids=options["task_ids"], dry_run=options["dry_run"]
+                )
+            except ValidationError as e:
+                raise CommandError(e.detail[0])
+        for result in results:
+            self.stdout.write(
+                f"{result['username']}: {result['tasks']} tasks, {result['amount']}"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Assigned {sum(result['tasks'] for result in results)} tasks"
+            )
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from app.schema import write_schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the OpenAPI schema served by StaticSchemaView (needs drf_spectacular)"
+    )
+
+    def handle(self, *args, **options):
+        from django.conf import settings
+        from drf_spectacular.generators import SchemaGenerator
+        from drf_spectacular.renderers import OpenApiJsonRenderer
+
+        schema = SchemaGenerator().get_schema(request=None, public=True)
+        write_schema(OpenApiJsonRenderer().render(schema, renderer_context={}))
+        self.stdout.write(
+            self.style.SUCCESS(f"Schema written to {settings.OPENAPI_SCHEMA_PATH}")
+        )
@@ -0,0 +1,67 @@
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from app.reports import COLUMNAR, CSV, DAILY, MONTHLY, generate_reports
+
+
+class Command(BaseCommand):
+    help = "Write the per collector and per manager collections reports"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--start",
+            type=date.fromisoformat,
+            default=None,
+            help="first day, YYYY-MM-DD (default: 30 days before --end)",
+        )
+        parser.add_argument(
+            "--end",
+            type=date.fromisoformat,
+            default=None,
+            help="last day, YYYY-MM-DD (default: yesterday)",
+        )
+        parser.add_argument(
+            "--period",
+            choices=[DAILY, MONTHLY, "both"],
+            default="both",
+        )
+        parser.add_argument(
+            "--format",
+            choices=[CSV, COLUMNAR],
+            action="append",
+            dest="formats",
+            help="output format, can be repeated (default: csv)",
+        )
+        parser.add_argument("--output", type=Path, default=Path("reports"))
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="processes aggregating collector chunks in parallel",
+        )
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="only rewrite the partitions whose data changed since the last run",
+        )
+
+    def handle(self, *args, **options):
+        end = options["end"] or date.today() - timedelta(days=1)
+        start = options["start"] or end - timedelta(days=30)
+        periods = (
+            (DAILY, MONTHLY) if options["period"] == "both" else (options["period"],)
+        )
+        written = generate_reports(
+            start,
+            end,
+            options["output"],
+            periods=periods,
+            formats=tuple(options["formats"] or [CSV]),
+            workers=options["workers"],
+            chunk_size=options["chunk_size"],
+            incremental=options["incremental"],
+        )
+        self.stdout.write(f"wrote {len(written)} files to {options['output']}")
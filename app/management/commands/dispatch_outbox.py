@@ -0,0 +1,76 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.outbox import dispatch_batch
+from app.sharding import fan_out
+
+
+class Command(BaseCommand):
+    help = "Deliver pending outbox notifications to the manager webhook"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            default=os.environ.get("OUTBOX_WEBHOOK_URL"),
+            help="webhook receiving the events (default: OUTBOX_WEBHOOK_URL)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=int(os.environ.get("OUTBOX_BATCH_SIZE", 100)),
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=int(os.environ.get("OUTBOX_CONCURRENCY", 10)),
+            help="maximum webhook requests in flight",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 8)),
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="seconds to sleep when nothing is due",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="drain what is due now and exit",
+        )
+
+    def handle(self, *args, **options):
+        if not options["url"]:
+            raise CommandError("No webhook, set OUTBOX_WEBHOOK_URL or pass --url")
+
+        def drain(shard):
+            delivered = failed = 0
+            while True:
+                batch = dispatch_batch(
+                    options["url"],
+                    options["batch_size"],
+                    options["concurrency"],
+                    options["max_attempts"],
+                )
+                delivered += batch[0]
+                failed += batch[1]
+                if sum(batch) < options["batch_size"]:
+                    return delivered, failed
+
+        while True:
+            busy = False
+            for shard, (delivered, failed) in fan_out(drain).items():
+                if delivered or failed:
+                    busy = True
+                    self.stdout.write(
+                        f"{shard}: {delivered} delivered, {failed} failed"
+                    )
+            if options["once"]:
+                return
+            if not busy:
+                time.sleep(options["interval"])
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.profiling import HEADER, make_token
+
+
+class Command(BaseCommand):
+    help = "Sign a token that gets the requests sending it profiled"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "label",
+            nargs="?",
+            default="",
+            help="added to the profile names, e.g. the collector's username",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{HEADER}: {make_token(options['label'])}")
+        self.stdout.write(
+            f"valid for {settings.PROFILE_TOKEN_MAX_AGE} seconds, "
+            "the server needs PROFILING=1"
+        )
@@ -0,0 +1,98 @@
+import heapq
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from app.models import Task
+from app.sharding import DEFAULT_SHARD, fan_out, get_shard, place_team
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Spread manager teams across the database shards by open task count"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--manager", help="username of a single manager to place on --shard"
+        )
+        parser.add_argument("--shard", help="database alias to place --manager on")
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="show the moves without making them",
+        )
+
+    def get_team_loads(self) -> dict:
+        """
+        Open task count per manager id, summed over every shard.
+        """
+        collectors = dict(
+            User.objects.using(DEFAULT_SHARD)
+            .filter(manager__isnull=False)
+            .values_list("id", "manager_id")
+        )
+        loads = {
+            manager_id: 0
+            for manager_id in User.objects.using(DEFAULT_SHARD)
+            .filter(is_superuser=True)
+            .values_list("id", flat=True)
+        }
+
+        def count_open_tasks(shard):
+            return (
+                Task.objects.filter(is_collected=False, assigned_to__isnull=False)
+                .values_list("assigned_to_id")
+                .annotate(count=Count("id"))
+                .order_by()
+            )
+
+        for counts in fan_out(count_open_tasks).values():
+            for user_id, count in counts:
+                manager_id = collectors.get(user_id, user_id)
+                if manager_id in loads:
+                    loads[manager_id] += count
+        return loads
+
+    def plan(self) -> dict:
+        """
+        Greedy placement, biggest team first onto the least loaded shard.
+        """
+        heap = [(0, shard) for shard in settings.SHARDS]
+        placement = {}
+        loads = self.get_team_loads()
+        for manager_id, load in sorted(loads.items(), key=lambda item: -item[1]):
+            shard_load, shard = heapq.heappop(heap)
+            placement[manager_id] = shard
+            heapq.heappush(heap, (shard_load + load, shard))
+        return placement
+
+    def handle(self, *args, **options):
+        if bool(options["manager"]) != bool(options["shard"]):
+            raise CommandError("--manager and --shard must be used together")
+        if options["shard"] and options["shard"] not in settings.SHARDS:
+            raise CommandError(f"Unknown shard {options['shard']}")
+
+        if options["manager"]:
+            try:
+                manager = User.objects.using(DEFAULT_SHARD).get(
+                    username=options["manager"], is_superuser=True
+                )
+            except User.DoesNotExist:
+                raise CommandError(f"Manager {options['manager']} does not exist")
+            placement = {manager.pk: options["shard"]}
+        else:
+            placement = self.plan()
+
+        moves = 0
+        for manager_id, shard in placement.items():
+            current = get_shard(manager_id)
+            if current == shard:
+                continue
+            moves += 1
+            self.stdout.write(f"manager {manager_id}: {current} -> {shard}")
+            if not options["dry_run"]:
+                place_team(manager_id, shard)
+        self.stdout.write(self.style.SUCCESS(f"Moved {moves} teams"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from app.models import User
+from app.overdue import refresh_overdue_counts
+from app.sharding import fan_out
+
+
+class Command(BaseCommand):
+    help = "Recount every collector's overdue tasks, run it periodically"
+
+    def handle(self, *args, **options):
+        counted = fan_out(
+            lambda shard: refresh_overdue_counts(
+                User.objects.filter(is_superuser=False)
+            )
+        )
+        for shard, users in counted.items():
+            self.stdout.write(f"{shard}: refreshed {users} collectors")
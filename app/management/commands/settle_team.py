@@ -0,0 +1,76 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from app.settlement import settle
+from app.sharding import get_shard, use_shard
+
+User = get_user_model()
+
+
+def payment(value: str) -> tuple:
+    username, _, amount = value.rpartition("=")
+    try:
+        return username, float(amount)
+    except ValueError:
+        raise ValueError(f"expected <collector username>=<amount>, got {value}")
+
+
+class Command(BaseCommand):
+    help = "Pay out a manager's cash collectors in one transaction"
+
+    def add_arguments(self, parser):
+        parser.add_argument("manager", help="username of the manager")
+        parser.add_argument(
+            "--pay",
+            type=payment,
+            action="append",
+            dest="payments",
+            metavar="USERNAME=AMOUNT",
+            help="pay this amount for this collector (repeatable), "
+            "default: everything every collector collected",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            manager = User.objects.get(username=options["manager"], is_superuser=True)
+        except User.DoesNotExist:
+            raise CommandError(f"Manager {options['manager']} does not exist")
+        # the team lives on the manager's shard
+        with use_shard(get_shard(manager.pk)):
+            payments = None
+            if options["payments"]:
+                amounts = dict(options["payments"])
+                ids = dict(
+                    User.objects.filter(
+                        manager=manager, username__in=amounts
+                    ).values_list("username", "id")
+                )
+                missing = set(amounts) - set(ids)
+                if missing:
+                    raise CommandError(
+                        f"Not collectors of {manager}: {', '.join(sorted(missing))}"
+                    )
+                payments = {
+                    ids[username]: amount for username, amount in amounts.items()
+                }
+            try:
+                results = settle(manager, payments)
+            except ValidationError as e:
+                raise CommandError(
+                    ", ".join(
+                        f"collector {collector_id}: {error}"
+                        for collector_id, error in e.detail.items()
+                    )
+                )
+        for result in results:
+            self.stdout.write(
+                f"{result['username']}: paid {result['paid']}, "
+                f"{result['collected']} left"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Settled {len(results)} collectors, "
+                f"{sum(result['paid'] for result in results)} paid"
+            )
+        )
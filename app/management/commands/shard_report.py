@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q, Sum
+
+from app.models import Task, User
+from app.sharding import fan_out
+
+
+class Command(BaseCommand):
+    help = "Show users, teams and open tasks on every database shard"
+
+    def handle(self, *args, **options):
+        def summarize(shard):
+            summary = Task.objects.aggregate(
+                open_tasks=Count("id", filter=Q(is_collected=False)),
+                outstanding=Sum("remaining_amount"),
+            )
+            summary["users"] = User.objects.count()
+            summary["teams"] = User.objects.filter(is_superuser=True).count()
+            return summary
+
+        for shard, summary in fan_out(summarize).items():
+            self.stdout.write(
+                f"{shard}: {summary['teams']} teams, {summary['users']} users, "
+                f"{summary['open_tasks']} open tasks, "
+                f"{summary['outstanding'] or 0} outstanding"
+            )
@@ -0,0 +1,163 @@
+import gzip
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+
+from app import profiling
+from app.sharding import current_shard
+
+try:
+    import brotli
+except ImportError:  # optional, responses are only gzipped without it
+    brotli = None
+
+# dynamic responses, favour speed over ratio
+BROTLI_QUALITY = 5
+GZIP_LEVEL = 6
+
+
+class AsyncCapableMiddleware:
+    """
+    Base for middleware running in both stacks, so an ASGI worker serving the async
+    views never has to hop to a thread for them. Subclasses wrap `get_response`
+    in `wrap_response` (sync) and `awrap_response` (async).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.awrap_response(request)
+        return self.wrap_response(request)
+
+
+class ShardMiddleware(AsyncCapableMiddleware):
+    """
+    Start every request on the default database and forget the shard afterwards.
+    """
+
+    def wrap_response(self, request):
+        token = current_shard.set(None)
+        try:
+            return self.get_response(request)
+        finally:
+            current_shard.reset(token)
+
+    async def awrap_response(self, request):
+        token = current_shard.set(None)
+        try:
+            return await self.get_response(request)
+        finally:
+            current_shard.reset(token)
+
+
+def accepted_encodings(header: str) -> set:
+    """
+    The content codings of an `Accept-Encoding` header that are not refused (`q=0`).
+    """
+    encodings = set()
+    for item in header.split(","):
+        coding, _, params = item.partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        encodings.add(coding.strip().lower())
+    return encodings
+
+
+def is_json(response) -> bool:
+    media_type = response.get("Content-Type", "").partition(";")[0].strip().lower()
+    return media_type == "application/json" or media_type.endswith("+json")
+
+
+class CompressionMiddleware(AsyncCapableMiddleware):
+    """
+    Compress JSON responses of at least `COMPRESSION_MIN_SIZE` bytes with brotli, when
+    installed and accepted by the client, or gzip.
+
+    Only the API's JSON is compressed: it is sent to clients authenticating with a
+    bearer token, which a third party site can not make a browser send. The HTML
+    pages (admin, login) are authenticated by the session cookie and carry the CSRF
+    token, compressing them would let such a site guess the token from the response
+    sizes (BREACH). Streaming responses (the event streams) and responses already
+    encoded (the prebuilt schema) are left alone.
+    """
+
+    def wrap_response(self, request):
+        return self.compress(request, self.get_response(request))
+
+    async def awrap_response(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if (
+            response.streaming
+            or not is_json(response)
+            or response.has_header("Content-Encoding")
+            or len(response.content) < settings.COMPRESSION_MIN_SIZE
+        ):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        if brotli is not None and "br" in accepted:
+            encoding = "br"
+            content = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        elif "gzip" in accepted:
+            encoding = "gzip"
+            content = gzip.compress(response.content, GZIP_LEVEL, mtime=0)
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+        response.content = content
+        response["Content-Length"] = str(len(content))
+        response["Content-Encoding"] = encoding
+        # the representation changed, a strong ETag would now be wrong
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        return response
+
+
+class ProfilingMiddleware(AsyncCapableMiddleware):
+    """
+    Profile the views of requests with a valid `X-Profile` token or picked by
+    `PROFILE_SAMPLE_RATE`, see `app.profiling`. Only loaded with `PROFILING=1`.
+
+    The view is called from `process_view`, so this must be the last middleware
+    with one. Async views are not profiled.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING:
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+
+    def wrap_response(self, request):
+        return self.get_response(request)
+
+    async def awrap_response(self, request):
+        return await self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if iscoroutinefunction(view_func):
+            return None
+        token = request.headers.get(profiling.HEADER)
+        label = profiling.read_token(token) if token else None
+        if label is None and random.random() < settings.PROFILE_SAMPLE_RATE:
+            label = "sampled"
+        if label is None:
+            return None
+        return profiling.profile(request, view_func, view_args, view_kwargs, label)
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0002_alter_task_description"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="task",
+            name="assigned_to",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="tasks",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
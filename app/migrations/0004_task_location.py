@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0003_task_assigned_to_nullable"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="task",
+            name="grid_cell",
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="task",
+            name="latitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="task",
+            name="longitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["assigned_to", "is_collected", "grid_cell"],
+                name="task_open_grid_cell_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0004_task_location"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="task",
+            name="task_open_grid_cell_idx",
+        ),
+        migrations.AddField(
+            model_name="task",
+            name="priority",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="next_task_ordering",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("id", "Oldest first"),
+                    ("due_date", "Due date first"),
+                    ("amount", "Largest amount first"),
+                    ("priority", "Highest priority first"),
+                ],
+                max_length=20,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                condition=models.Q(("is_collected", False)),
+                fields=["assigned_to", "id"],
+                name="task_open_id_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                condition=models.Q(("is_collected", False)),
+                fields=["assigned_to", "due_date", "id"],
+                name="task_open_due_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                condition=models.Q(("is_collected", False)),
+                fields=["assigned_to", "-amount", "id"],
+                name="task_open_amount_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                condition=models.Q(("is_collected", False)),
+                fields=["assigned_to", "-priority", "id"],
+                name="task_open_priority_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                condition=models.Q(("is_collected", False)),
+                fields=["assigned_to", "grid_cell"],
+                name="task_open_grid_cell_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0005_next_task_ordering"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShardMap",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("user_id", models.BigIntegerField(unique=True)),
+                ("shard", models.CharField(max_length=50)),
+            ],
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0006_shard_map"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedTask",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("task_id", models.BigIntegerField()),
+                ("name", models.CharField(max_length=100)),
+                ("description", models.TextField(null=True)),
+                ("amount", models.FloatField()),
+                ("due_date", models.DateTimeField()),
+                ("collected_at", models.DateTimeField(null=True)),
+                ("remaining_amount", models.FloatField(default=0)),
+                ("priority", models.PositiveSmallIntegerField(default=0)),
+                ("latitude", models.FloatField(null=True)),
+                ("longitude", models.FloatField(null=True)),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                condition=models.Q(("is_collected", True), ("remaining_amount", 0)),
+                fields=["collected_at"],
+                name="task_settled_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="archivedtask",
+            name="assigned_to",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="archived_tasks",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedtask",
+            index=models.Index(
+                fields=["assigned_to", "task_id"], name="archived_task_assigned_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0008_outbox_event"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="overdue_as_of",
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="overdue_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                condition=models.Q(("is_collected", False)),
+                fields=["due_date", "id"],
+                name="task_overdue_idx",
+            ),
+        ),
+    ]
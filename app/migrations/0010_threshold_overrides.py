@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0009_overdue_feed"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="threshold",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="threshold_days",
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
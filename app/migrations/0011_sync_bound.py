@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0010_threshold_overrides"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="synced_until",
+            field=models.DateTimeField(null=True),
+        ),
+    ]
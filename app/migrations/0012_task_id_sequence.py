@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:13
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_task_sequence(apps, schema_editor):
+    """
+    Start the shared task ids after the highest one of the database being migrated,
+    `default` is migrated first and holds the sequence.
+    """
+    Task = apps.get_model("app", "Task")
+    ArchivedTask = apps.get_model("app", "ArchivedTask")
+    IdSequence = apps.get_model("app", "IdSequence")
+    alias = schema_editor.connection.alias
+    highest = max(
+        Task.objects.using(alias).aggregate(id=Max("id"))["id"] or 0,
+        ArchivedTask.objects.using(alias).aggregate(id=Max("task_id"))["id"] or 0,
+    )
+    sequence, created = IdSequence.objects.using("default").get_or_create(
+        name="task", defaults={"next_id": highest + 1}
+    )
+    if sequence.next_id <= highest:
+        sequence.next_id = highest + 1
+        sequence.save(update_fields=["next_id"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0011_sync_bound"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IdSequence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, unique=True)),
+                ("next_id", models.BigIntegerField()),
+            ],
+        ),
+        migrations.RunPython(seed_task_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:03
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def backfill_payments(apps, schema_editor):
+    """
+    Record the payments of the `payment` outbox events of the database being migrated,
+    on their dates.
+    """
+    OutboxEvent = apps.get_model("app", "OutboxEvent")
+    Payment = apps.get_model("app", "Payment")
+    alias = schema_editor.connection.alias
+    events = (
+        OutboxEvent.objects.using(alias)
+        .filter(kind="payment")
+        .order_by("id")
+        .values_list("user_id", "payload", "created_at")
+    )
+    batch = []
+    for user_id, payload, created_at in events.iterator(BATCH_SIZE):
+        batch.append(
+            Payment(user_id=user_id, amount=payload["paid"], created_at=created_at)
+        )
+        if len(batch) == BATCH_SIZE:
+            Payment.objects.using(alias).bulk_create(batch)
+            batch = []
+    Payment.objects.using(alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0012_task_id_sequence"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Payment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("amount", models.FloatField()),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="payments",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["user", "created_at"], name="payment_user_idx")
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_payments, migrations.RunPython.noop),
+    ]
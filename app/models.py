@@ -1,16 +1,60 @@
 from django.contrib.auth.models import AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
+
+from app import geo
+
+
+class NextTaskOrdering(models.TextChoices):
+    ID = "id", "Oldest first"
+    DUE_DATE = "due_date", "Due date first"
+    AMOUNT = "amount", "Largest amount first"
+    PRIORITY = "priority", "Highest priority first"
 
 
 class User(AbstractUser):
     manager = models.ForeignKey("self", on_delete=models.SET_NULL, null=True)
     reached_limit_date = models.DateTimeField(null=True)
     collected = models.FloatField(default=0)
+    # set on managers, orders their collectors' next task (blank: deployment default)
+    next_task_ordering = models.CharField(
+        max_length=20, choices=NextTaskOrdering.choices, blank=True
+    )
+    # threshold overrides, set on a manager for their collectors or on a collector,
+    # blank falls back to the next level up (see `app.thresholds`)
+    threshold = models.FloatField(null=True, blank=True)
+    threshold_days = models.PositiveSmallIntegerField(null=True, blank=True)
+    # open tasks due before `overdue_as_of`, kept up to date by `app.overdue`
+    overdue_count = models.PositiveIntegerField(default=0)
+    overdue_as_of = models.DateTimeField(null=True)
+    # latest collect date accepted from an offline sync, earlier events are refused
+    synced_until = models.DateTimeField(null=True)
+
+
+class TaskQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        from app.overdue import count_created_tasks
+        from app.sharding import allocate_task_ids
+
+        objs = list(objs)
+        new = [obj for obj in objs if obj.pk is None]
+        for obj, task_id in zip(new, allocate_task_ids(len(new))):
+            obj.pk = task_id
+        created = super().bulk_create(objs, *args, **kwargs)
+        # tasks with an id are moved between shards, their counts move with the users
+        count_created_tasks(new, self.db)
+        return created
 
 
 class Task(models.Model):
+    # ids are allocated across all shards (see `app.sharding.allocate_task_ids`) so a
+    # task keeps its id when its team moves, `save` and `bulk_create` set them
+    objects = TaskQuerySet.as_manager()
+
+    # unassigned tasks form the pool handed out by `app.assignment.assign_tasks`
     assigned_to = models.ForeignKey(
-        User, on_delete=models.PROTECT, related_name="tasks"
+        User, on_delete=models.PROTECT, related_name="tasks", null=True, blank=True
     )
     name = models.CharField(max_length=100)
     description = models.TextField(null=True)
@@ -19,6 +63,182 @@ class Task(models.Model):
     collected_at = models.DateTimeField(null=True)
     is_collected = models.BooleanField(default=False)
     remaining_amount = models.FloatField(default=0)
+    priority = models.PositiveSmallIntegerField(default=0)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    # spatial index cell derived from the coordinates, see `app.geo`
+    grid_cell = models.BigIntegerField(null=True, editable=False)
+
+    class Meta:
+        # partial indexes over the open tasks, one per next task ordering (see
+        # `app.ordering`) so the lookup is an index seek whatever the policy and never
+        # a sort of the collector's backlog, plus the nearest task grid
+        indexes = [
+            models.Index(
+                fields=["assigned_to", "id"],
+                condition=models.Q(is_collected=False),
+                name="task_open_id_idx",
+            ),
+            models.Index(
+                fields=["assigned_to", "due_date", "id"],
+                condition=models.Q(is_collected=False),
+                name="task_open_due_date_idx",
+            ),
+            models.Index(
+                fields=["assigned_to", "-amount", "id"],
+                condition=models.Q(is_collected=False),
+                name="task_open_amount_idx",
+            ),
+            models.Index(
+                fields=["assigned_to", "-priority", "id"],
+                condition=models.Q(is_collected=False),
+                name="task_open_priority_idx",
+            ),
+            models.Index(
+                fields=["assigned_to", "grid_cell"],
+                condition=models.Q(is_collected=False),
+                name="task_open_grid_cell_idx",
+            ),
+            # the managers' overdue feed, walked in due date order (see `app.overdue`)
+            models.Index(
+                fields=["due_date", "id"],
+                condition=models.Q(is_collected=False),
+                name="task_overdue_idx",
+            ),
+            # settled tasks waiting to be archived, see `archive_tasks`
+            models.Index(
+                fields=["collected_at"],
+                condition=models.Q(is_collected=True, remaining_amount=0),
+                name="task_settled_idx",
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        task = super().from_db(db, field_names, values)
+        # as stored, `app.signals.task_saved` tells from it whom a save took the task from
+        task._loaded_values = {
+            name: value
+            for name, value in zip(field_names, values)
+            if value is not models.DEFERRED
+        }
+        return task
+
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            from app.sharding import allocate_task_ids
+
+            self.pk = allocate_task_ids(1)[0]
+            kwargs["force_insert"] = True
+        # bulk_create and update() bypass this, set grid_cell there yourself
+        if self.latitude is not None and self.longitude is not None:
+            self.grid_cell = geo.grid_cell(self.latitude, self.longitude)
+        else:
+            self.grid_cell = None
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and (
+            {"latitude", "longitude"} & set(update_fields)
+        ):
+            kwargs["update_fields"] = {*update_fields, "grid_cell"}
+        super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"{self.assigned_to.get_username()} - {self.name} ({self.id})"
+        username = self.assigned_to.get_username() if self.assigned_to else "unassigned"
+        return f"{username} - {self.name} ({self.id})"
+
+
+class ArchivedTask(models.Model):
+    """
+    A settled task moved out of `Task` by the `archive_tasks` command.
+
+    `task_id` keeps the id the task had while live, the done tasks list reads it as `id`.
+    """
+
+    task_id = models.BigIntegerField()
+    assigned_to = models.ForeignKey(
+        User, on_delete=models.PROTECT, related_name="archived_tasks", null=True
+    )
+    name = models.CharField(max_length=100)
+    description = models.TextField(null=True)
+    amount = models.FloatField()
+    due_date = models.DateTimeField()
+    collected_at = models.DateTimeField(null=True)
+    remaining_amount = models.FloatField(default=0)
+    priority = models.PositiveSmallIntegerField(default=0)
+    latitude = models.FloatField(null=True)
+    longitude = models.FloatField(null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["assigned_to", "task_id"], name="archived_task_assigned_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.task_id}, archived)"
+
+
+class Payment(models.Model):
+    """
+    Cash handed over by a collector, the ledger the collections reports read (see
+    `app.reports`), kept for good unlike the outbox events.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.PROTECT, related_name="payments")
+    amount = models.FloatField()
+    # a default rather than auto_now_add so the backfill keeps the events' dates
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "created_at"], name="payment_user_idx"),
+        ]
+
+
+class OutboxEvent(models.Model):
+    """
+    A notification to managers, written in the same transaction as the state change.
+
+    Delivered later, in batches, by the `dispatch_outbox` command (see `app.outbox`).
+    """
+
+    kind = models.CharField(max_length=30)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # not delivered before this time, used for retries and scheduled freezes
+    deliver_after = models.DateTimeField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    delivered_at = models.DateTimeField(null=True)
+    failed_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["deliver_after", "id"],
+                condition=models.Q(delivered_at__isnull=True, failed_at__isnull=True),
+                name="outbox_pending_idx",
+            ),
+        ]
+
+
+class ShardMap(models.Model):
+    """
+    Which database a user's team lives on, kept on `default` only (see `app.sharding`).
+    """
+
+    user_id = models.BigIntegerField(unique=True)
+    shard = models.CharField(max_length=50)
+
+
+class IdSequence(models.Model):
+    """
+    Next id to hand out of a sequence shared by every shard, kept on `default` only
+    (see `app.sharding.allocate_task_ids`).
+    """
+
+    name = models.CharField(max_length=50, unique=True)
+    next_id = models.BigIntegerField()
@@ -0,0 +1,14 @@
+"""
+drf_spectacular extensions, imported by `AppConfig.ready` only when drf_spectacular
+is installed.
+"""
+
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+
+
+class ShardedJWTScheme(SimpleJWTScheme):
+    """
+    Same bearer security scheme as simplejwt's `JWTAuthentication`.
+    """
+
+    target_class = "app.authentication.ShardedJWTAuthentication"
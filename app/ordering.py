@@ -0,0 +1,100 @@
+"""
+Next task ordering policies
+
+Which uncollected task `get_next_task` hands out first. The deployment default comes
+from `settings.NEXT_TASK_ORDERING`, a manager can override it for their collectors.
+Every policy has a matching composite index on `Task`.
+
+Manager overrides are cached in the `POLICY_CACHE` cache for `POLICY_CACHE_TIMEOUT`
+seconds, a change reaches every worker at once when that cache is shared and when
+their entry expires otherwise.
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+
+from app.models import NextTaskOrdering, User
+
+ORDER_BY = {
+    NextTaskOrdering.ID: ("id",),
+    NextTaskOrdering.DUE_DATE: ("due_date", "id"),
+    NextTaskOrdering.AMOUNT: ("-amount", "id"),
+    NextTaskOrdering.PRIORITY: ("-priority", "id"),
+}
+CACHE_KEY = "next_task_ordering:%s"
+
+
+def get_cache():
+    return caches[settings.POLICY_CACHE]
+
+
+def get_manager_ordering(manager_id: int) -> str:
+    """
+    Retrieve a manager's ordering override, cached so the next task lookup stays one query.
+
+    Returns:
+        str: The manager's ordering, or "" when they use the deployment default.
+    """
+    cache = get_cache()
+    key = CACHE_KEY % manager_id
+    ordering = cache.get(key)
+    if ordering is None:
+        ordering = (
+            User.objects.filter(pk=manager_id)
+            .values_list("next_task_ordering", flat=True)
+            .first()
+            or ""
+        )
+        cache.set(key, ordering, settings.POLICY_CACHE_TIMEOUT)
+    return ordering
+
+
+async def aget_manager_ordering(manager_id: int) -> str:
+    """
+    Async `get_manager_ordering`.
+    """
+    cache = get_cache()
+    key = CACHE_KEY % manager_id
+    ordering = await cache.aget(key)
+    if ordering is None:
+        ordering = (
+            await User.objects.filter(pk=manager_id)
+            .values_list("next_task_ordering", flat=True)
+            .afirst()
+            or ""
+        )
+        await cache.aset(key, ordering, settings.POLICY_CACHE_TIMEOUT)
+    return ordering
+
+
+def invalidate_manager_ordering(manager_id: int) -> None:
+    """
+    Drop a manager's cached ordering override after it changed.
+    """
+    get_cache().delete(CACHE_KEY % manager_id)
+
+
+def get_ordering(user) -> tuple:
+    """
+    Resolve the `order_by` fields of the next task for a user.
+
+    Args:
+        user (User): The collector asking for their next task.
+
+    Returns:
+        tuple: Fields to pass to `order_by`.
+    """
+    ordering = ""
+    if user.manager_id:
+        ordering = get_manager_ordering(user.manager_id)
+    return ORDER_BY[ordering or settings.NEXT_TASK_ORDERING]
+
+
+async def aget_ordering(user) -> tuple:
+    """
+    Async `get_ordering`.
+    """
+    ordering = ""
+    if user.manager_id:
+        ordering = await aget_manager_ordering(user.manager_id)
+    return ORDER_BY[ordering or settings.NEXT_TASK_ORDERING]
@@ -0,0 +1,255 @@
+"""
+Transactional outbox for manager notifications
+
+State changes (limit reached, frozen, payments) add an `OutboxEvent` inside their own
+transaction, so a notification exists exactly when the change was committed and the
+request never waits on the webhook. The `dispatch_outbox` command drains the table in
+batches and POSTs the events over asyncio with bounded concurrency, retrying failures
+with exponential backoff.
+"""
+
+import asyncio
+import json
+import ssl
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router, transaction
+
+from app.models import OutboxEvent
+from app.thresholds import get_threshold_policy
+
+LIMIT_REACHED = "limit_reached"
+FROZEN = "frozen"
+PAYMENT = "payment"
+
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 3600
+DELIVERY_TIMEOUT_SECONDS = 10
+# a claimed batch must be delivered within this or it is handed out again
+LEASE_SECONDS = 300
+
+
+def enqueue(kind: str, user, deliver_after=None, **data) -> OutboxEvent:
+    """
+    Add a notification about `user` to the outbox, call it inside the state change's
+    transaction.
+
+    Args:
+        kind (str): One of `LIMIT_REACHED`, `FROZEN` or `PAYMENT`.
+        user (User): The cash collector the event is about.
+        deliver_after (datetime, optional): Hold the event until then (default: now).
+        **data: Extra payload fields.
+
+    Returns:
+        OutboxEvent: The saved event.
+    """
+    return OutboxEvent.objects.using(
+        router.db_for_write(OutboxEvent, instance=user)
+    ).create(
+        kind=kind,
+        user=user,
+        payload={"user_id": user.pk, "manager_id": user.manager_id, **data},
+        deliver_after=deliver_after or datetime.now(),
+    )
+
+
+def enqueue_many(kind: str, events: list) -> list:
+    """
+    Add one notification per `(user, data)` pair of `events` in a single INSERT, see
+    `enqueue`.
+    """
+    if not events:
+        return []
+    now = datetime.now()
+    return OutboxEvent.objects.using(
+        router.db_for_write(OutboxEvent, instance=events[0][0])
+    ).bulk_create(
+        OutboxEvent(
+            kind=kind,
+            user=user,
+            payload={"user_id": user.pk, "manager_id": user.manager_id, **data},
+            deliver_after=now,
+        )
+        for user, data in events
+    )
+
+
+def schedule_freeze(user) -> None:
+    """
+    Queue the limit reached event now and the frozen event for when the freeze starts.
+    """
+    enqueue(
+        LIMIT_REACHED,
+        user,
+        reached_limit_date=user.reached_limit_date,
+        collected=user.collected,
+    )
+    enqueue_frozen(user)
+
+
+def enqueue_frozen(user) -> None:
+    frozen_at = user.reached_limit_date + get_threshold_policy(user).freeze_delay
+    enqueue(FROZEN, user, deliver_after=frozen_at, frozen_at=frozen_at)
+
+
+def reschedule_freeze(user) -> None:
+    """
+    Replace the not yet delivered frozen event of a user whose `reached_limit_date`
+    changed, by one counted from the new date or by none when it was cleared.
+    """
+    cancel_freeze(user)
+    if user.reached_limit_date is not None:
+        enqueue_frozen(user)
+
+
+def cancel_freeze(user) -> None:
+    """
+    Drop the not yet delivered frozen event of a user whose limit was lifted.
+    """
+    cancel_freezes([user])
+
+
+def cancel_freezes(users: list) -> None:
+    """
+    `cancel_freeze` for several users in one DELETE.
+    """
+    OutboxEvent.objects.using(
+        router.db_for_write(OutboxEvent, instance=users[0])
+    ).filter(
+        user__in=users, kind=FROZEN, delivered_at__isnull=True, failed_at__isnull=True
+    ).delete()
+
+
+def claim_due_events(batch_size: int) -> list:
+    """
+    Claim the oldest pending events that are due, on the current shard.
+
+    Claimed events are leased by pushing `deliver_after` past the delivery timeout, so
+    concurrent dispatchers skip them and a crashed dispatcher's events come back.
+    """
+    now = datetime.now()
+    with transaction.atomic(using=router.db_for_write(OutboxEvent)):
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(
+                delivered_at__isnull=True,
+                failed_at__isnull=True,
+                deliver_after__lte=now,
+            )
+            .order_by("deliver_after", "id")[:batch_size]
+        )
+        OutboxEvent.objects.filter(pk__in=[event.id for event in events]).update(
+            deliver_after=now + timedelta(seconds=LEASE_SECONDS)
+        )
+    return events
+
+
+def event_body(event: OutboxEvent) -> bytes:
+    return json.dumps(
+        {
+            "id": event.id,
+            "kind": event.kind,
+            "created_at": event.created_at,
+            **event.payload,
+        },
+        cls=DjangoJSONEncoder,
+    ).encode()
+
+
+async def post(url: str, body: bytes) -> None:
+    """
+    POST a JSON body with a bare asyncio HTTP/1.1 client.
+
+    Raises:
+        OSError: On connection errors or a non 2xx response.
+    """
+    parts = urlsplit(url)
+    secure = parts.scheme == "https"
+    port = parts.port or (443 if secure else 80)
+    reader, writer = await asyncio.open_connection(
+        parts.hostname, port, ssl=ssl.create_default_context() if secure else None
+    )
+    try:
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        writer.write(
+            (
+                f"POST {path} HTTP/1.1\r\n"
+                f"Host: {parts.netloc}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode()
+            + body
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise OSError(f"Invalid response {status_line!r}")
+        if not 200 <= status < 300:
+            raise OSError(f"Webhook answered {status}")
+    finally:
+        writer.close()
+
+
+async def deliver(events: list, url: str, concurrency: int) -> list:
+    """
+    Deliver events concurrently, at most `concurrency` requests in flight.
+
+    Returns:
+        list: None per delivered event, the error message per failed one.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def deliver_one(event):
+        async with semaphore:
+            try:
+                await asyncio.wait_for(
+                    post(url, event_body(event)), DELIVERY_TIMEOUT_SECONDS
+                )
+            except (OSError, asyncio.TimeoutError) as e:
+                return str(e) or e.__class__.__name__
+            return None
+
+    return await asyncio.gather(*(deliver_one(event) for event in events))
+
+
+def dispatch_batch(url: str, batch_size: int, concurrency: int, max_attempts: int):
+    """
+    Deliver one batch of due events from the current shard and record the outcome.
+
+    Returns:
+        tuple: (delivered, failed) counts, (0, 0) when nothing was due.
+    """
+    events = claim_due_events(batch_size)
+    if not events:
+        return 0, 0
+    errors = asyncio.run(deliver(events, url, concurrency))
+    now = datetime.now()
+    delivered, failed = [], []
+    for event, error in zip(events, errors):
+        event.attempts += 1
+        if error is None:
+            event.delivered_at = now
+            delivered.append(event)
+            continue
+        event.last_error = error
+        if event.attempts >= max_attempts:
+            event.failed_at = now
+        else:
+            backoff = BACKOFF_BASE_SECONDS * 2 ** (event.attempts - 1)
+            event.deliver_after = now + timedelta(
+                seconds=min(backoff, BACKOFF_MAX_SECONDS)
+            )
+        failed.append(event)
+    with transaction.atomic(using=router.db_for_write(OutboxEvent)):
+        OutboxEvent.objects.bulk_update(
+            delivered + failed,
+            ["attempts", "delivered_at", "last_error", "failed_at", "deliver_after"],
+        )
+    return len(delivered), len(failed)
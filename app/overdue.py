@@ -0,0 +1,129 @@
+"""
+Overdue tasks
+
+The managers' feed of uncollected tasks past their due date, read in due date order
+from the `task_overdue_idx` partial index, and the per collector `overdue_count`.
+
+A task becomes overdue by time passing, which no write sees, so the count is defined
+against the collector's `overdue_as_of`: open tasks due before that time. Creating
+(one by one or in bulk), reassigning, rescheduling and collecting tasks keep it
+exact, `refresh_overdue_counts` (the `refresh_overdue_counts` command, run
+periodically) moves `overdue_as_of` forward.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+
+from django.db.models import Count, F, IntegerField, OuterRef, QuerySet, Subquery
+from django.db.models.functions import Coalesce
+
+from app.models import Task, User
+
+
+def overdue_tasks(manager_id: int, collector_id: int = None, now=None) -> QuerySet:
+    """
+    Uncollected tasks of a manager's team due before `now`.
+
+    Args:
+        manager_id (int): The manager whose collectors' tasks are listed.
+        collector_id (int, optional): Restrict to one collector of the team.
+        now (datetime, optional): Defaults to the current datetime.
+
+    Returns:
+        QuerySet: Tasks, earliest due date first.
+    """
+    tasks = Task.objects.filter(
+        is_collected=False,
+        due_date__lt=now or datetime.now(),
+        assigned_to__manager_id=manager_id,
+    )
+    if collector_id is not None:
+        tasks = tasks.filter(assigned_to_id=collector_id)
+    return tasks.order_by("due_date", "id")
+
+
+def is_counted(task: Task, user: User) -> bool:
+    """
+    Whether an open task of `user` is part of their `overdue_count`.
+    """
+    return user.overdue_as_of is not None and task.due_date < user.overdue_as_of
+
+
+def count_created_task(task: Task, using: str) -> None:
+    """
+    Add a task created already overdue to its collector's count.
+    """
+    if task.assigned_to_id is None or task.is_collected:
+        return
+    User.objects.using(using).filter(
+        pk=task.assigned_to_id, overdue_as_of__gt=task.due_date
+    ).update(overdue_count=F("overdue_count") + 1)
+
+
+def count_created_tasks(tasks: list, using: str) -> None:
+    """
+    `count_created_task` for tasks created together, one UPDATE per collector.
+    """
+    due_dates = defaultdict(list)
+    for task in tasks:
+        if task.assigned_to_id is not None and not task.is_collected:
+            due_dates[task.assigned_to_id].append(task.due_date)
+    if not due_dates:
+        return
+    users = User.objects.using(using)
+    as_of = users.filter(pk__in=due_dates, overdue_as_of__isnull=False).values_list(
+        "pk", "overdue_as_of"
+    )
+    for user_id, overdue_as_of in as_of:
+        count = sum(due_date < overdue_as_of for due_date in due_dates[user_id])
+        if count:
+            users.filter(pk=user_id).update(overdue_count=F("overdue_count") + count)
+
+
+def uncount_collected_task(user: User) -> None:
+    """
+    Remove a task that was part of its collector's count, relative to the stored
+    count so a concurrent `count_created_task` is kept.
+    """
+    User.objects.filter(pk=user.pk).update(overdue_count=F("overdue_count") - 1)
+    user.overdue_count -= 1
+
+
+def count_overdue(before) -> Coalesce:
+    """
+    Number of open tasks of the outer user due before `before`.
+    """
+    overdue = (
+        Task.objects.filter(
+            assigned_to=OuterRef("pk"), is_collected=False, due_date__lt=before
+        )
+        .order_by()
+        .values("assigned_to")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    return Coalesce(Subquery(overdue, output_field=IntegerField()), 0)
+
+
+def refresh_overdue_counts(users: QuerySet, now=None) -> int:
+    """
+    Recount the overdue tasks of `users` in one UPDATE and move `overdue_as_of` to `now`.
+
+    Returns:
+        int: Number of users updated.
+    """
+    now = now or datetime.now()
+    return users.update(overdue_count=count_overdue(now), overdue_as_of=now)
+
+
+def recount_overdue_tasks(users: QuerySet) -> int:
+    """
+    Recount the overdue tasks of `users` as of their `overdue_as_of`, for a task moved
+    into or out of their count (reassigned or rescheduled).
+
+    Returns:
+        int: Number of users updated.
+    """
+    return users.filter(overdue_as_of__isnull=False).update(
+        overdue_count=count_overdue(OuterRef("overdue_as_of"))
+    )
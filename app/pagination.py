@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+
+class DueDateCursorPagination(CursorPagination):
+    """
+    Keyset pagination by due date, pages stay an index range scan however deep.
+    """
+
+    ordering = ("due_date", "id")
@@ -0,0 +1,10 @@
+from rest_framework.permissions import BasePermission
+
+
+class IsManager(BasePermission):
+    """
+    Allow only managers, managers are the superusers that cash collectors report to.
+    """
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_superuser)
@@ -0,0 +1,195 @@
+"""
+Request profiling
+
+Opt-in (`PROFILING=1`) profiling of single requests in production: a request is
+profiled when it carries a valid `X-Profile` token (`manage.py profile_token`) or
+is picked by `PROFILE_SAMPLE_RATE`. The view runs under the profiler with every SQL
+query logged, then two files named after the request land in `PROFILE_DIR`:
+
+- `<name>.folded` with the sampled stacks in the collapsed format read by
+  `flamegraph.pl` and speedscope (`PROFILER=sample`, the default), or `<name>.prof`
+  with `cProfile` stats for snakeviz and `pstats` (`PROFILER=cprofile`),
+- `<name>.sql` with one line per query: duration, database and statement.
+
+Sampling adds little to the request but needs views running for tens of
+milliseconds to get a useful picture, use `cprofile` for shorter ones. Only the
+latest `PROFILE_MAX_FILES` requests are kept, the response names its files in the
+`X-Profile-Id` header. Query logs include the parameters, keep `PROFILE_DIR` as
+private as the database.
+"""
+
+import cProfile
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+
+HEADER = "X-Profile"
+SALT = "app.profiling"
+
+
+class Sampler:
+    """
+    Sampling profiler of one thread, counts its stacks every `interval` seconds
+    from a background thread.
+    """
+
+    def __init__(self, interval: float, thread_id: int = None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                # ";" separates frames in the collapsed format
+                stack.append(
+                    f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})".replace(
+                        ";", ","
+                    )
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path: Path) -> None:
+        path.write_text(
+            "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+        )
+
+
+class DeterministicProfiler(cProfile.Profile):
+    def write(self, path: Path) -> None:
+        self.dump_stats(path)
+
+
+class QueryLog:
+    """
+    Execute wrapper recording the queries of every database, see `capture`.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def wrapper(self, alias: str):
+        def execute(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                self.queries.append(
+                    (time.perf_counter() - start, alias, sql, params, many)
+                )
+
+        return execute
+
+    @contextmanager
+    def capture(self):
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(self.wrapper(alias))
+                )
+            yield self
+
+    def write(self, path: Path) -> None:
+        lines = [
+            f"{duration * 1000:8.2f} ms {alias} {sql} {'many' if many else params!r}\n"
+            for duration, alias, sql, params, many in self.queries
+        ]
+        total = sum(query[0] for query in self.queries)
+        lines.append(f"{total * 1000:8.2f} ms total, {len(self.queries)} queries\n")
+        path.write_text("".join(lines))
+
+
+def make_token(label: str = "") -> str:
+    """
+    Sign a token that gets a request profiled for `PROFILE_TOKEN_MAX_AGE` seconds.
+
+    Args:
+        label (str): Added to the names of the profiles it triggers, e.g. the
+            collector it was handed to.
+    """
+    return signing.TimestampSigner(salt=SALT).sign(label)
+
+
+def read_token(token: str):
+    """
+    The label of a valid `X-Profile` token, None when it is not.
+    """
+    try:
+        return signing.TimestampSigner(salt=SALT).unsign(
+            token, max_age=settings.PROFILE_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return None
+
+
+def profile_name(request, label: str = "") -> str:
+    # sortable by time, the rotation removes the first ones
+    parts = [
+        datetime.now().strftime("%Y%m%d-%H%M%S-%f"),
+        request.method,
+        request.path.strip("/"),
+        label,
+        uuid.uuid4().hex[:8],
+    ]
+    return re.sub(r"[^\w-]+", "_", "-".join(part for part in parts if part))
+
+
+def rotate(directory: Path, keep: int) -> None:
+    """
+    Remove the files of all but the latest `keep` profiled requests.
+    """
+    names = sorted({path.stem for path in directory.iterdir() if path.is_file()})
+    for name in names[: max(len(names) - keep, 0)]:
+        for path in directory.glob(f"{name}.*"):
+            path.unlink(missing_ok=True)
+
+
+def profile(request, view_func, args, kwargs, label: str = ""):
+    """
+    Call the view under the profiler and write its profile and query log.
+    """
+    directory = Path(settings.PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    name = profile_name(request, label)
+    if settings.PROFILER == "cprofile":
+        profiler, suffix = DeterministicProfiler(), ".prof"
+    else:
+        profiler, suffix = Sampler(settings.PROFILE_INTERVAL), ".folded"
+    log = QueryLog()
+    try:
+        with log.capture(), profiler:
+            response = view_func(request, *args, **kwargs)
+            if hasattr(response, "render") and callable(response.render):
+                # DRF responses are rendered after the view, count it in
+                response = response.render()
+    finally:
+        profiler.write(directory / f"{name}{suffix}")
+        log.write(directory / f"{name}.sql")
+        rotate(directory, settings.PROFILE_MAX_FILES)
+    response["X-Profile-Id"] = name
+    return response
@@ -0,0 +1,241 @@
+"""
+Push channel
+
+A collector's state (freeze status, balance, next task) is published when a write
+changes it and streamed to their open `/api/v1/events/` connections as server-sent
+events, so the apps do not have to poll `/status/` and `/next-task/`.
+
+Streams are plain coroutines waiting on the event loop, an idle connection costs a
+subscription object and no thread. Messages go through the broker named by
+`settings.PUSH_BROKER`. `LocalBroker` only reaches the streams of the process that
+made the change, deployments with several workers (or assigning from the command
+line) plug in a broker shared between processes.
+"""
+
+import asyncio
+import json
+import threading
+from contextlib import contextmanager
+from functools import cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router, transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from app.authentication import ShardedJWTAuthentication
+from app.serializers import ReadTaskSerializer
+from app.sharding import current_shard, get_shard, use_shard
+from app.thresholds import get_threshold_policy
+from app.utility import get_next_task, is_frozen
+
+User = get_user_model()
+
+
+class Subscription:
+    """
+    One stream's mailbox, only the latest message is kept.
+
+    Messages are full state snapshots so a slow client skips the ones it missed
+    instead of queueing them.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.message = None
+        self.ready = asyncio.Event()
+
+    def put(self, message: str) -> None:
+        # runs on the subscriber's event loop
+        self.message = message
+        self.ready.set()
+
+    async def get(self) -> str:
+        await self.ready.wait()
+        self.ready.clear()
+        return self.message
+
+
+class Broker:
+    """
+    Delivers messages published on a channel to its subscriptions.
+
+    `publish` is called from any thread (sync views, commands), `subscribe` from the
+    event loop running the streams.
+    """
+
+    def wants(self, channel: str) -> bool:
+        """
+        Whether a message on `channel` may be delivered, lets publishers skip
+        building it. Brokers that can not tell return True.
+        """
+        return True
+
+    def publish(self, channel: str, message: str) -> None:
+        raise NotImplementedError
+
+    def subscribe(self, channel: str):
+        """
+        Context manager yielding a `Subscription` to `channel`.
+        """
+        raise NotImplementedError
+
+
+class LocalBroker(Broker):
+    """
+    In-process broker, reaches the streams held by the current process.
+    """
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def wants(self, channel):
+        return channel in self._subscriptions
+
+    def publish(self, channel, message):
+        for subscription in tuple(self._subscriptions.get(channel, ())):
+            subscription.loop.call_soon_threadsafe(subscription.put, message)
+
+    @contextmanager
+    def subscribe(self, channel):
+        subscription = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                subscriptions = self._subscriptions[channel]
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[channel]
+
+
+@cache
+def get_broker() -> Broker:
+    return import_string(settings.PUSH_BROKER)()
+
+
+def user_channel(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def user_state(user: User) -> dict:
+    """
+    The state pushed to a collector's streams.
+
+    `frozen_at` tells the app when a pending freeze starts, no write happens then.
+    """
+    try:
+        next_task = ReadTaskSerializer(get_next_task(user)).data
+    except ValidationError:
+        next_task = None
+    frozen_at = None
+    if user.reached_limit_date:
+        frozen_at = user.reached_limit_date + get_threshold_policy(user).freeze_delay
+    return {
+        "is_frozen": is_frozen(user),
+        "frozen_at": frozen_at,
+        "collected": user.collected,
+        "next_task": next_task,
+    }
+
+
+def dump_state(user: User) -> str:
+    return json.dumps(user_state(user), cls=DjangoJSONEncoder)
+
+
+def publish_state(user_ids, using=None) -> None:
+    """
+    Push the state of `user_ids` to their streams once the current transaction commits.
+
+    Nothing is read when none of them has a stream open (as far as the broker knows).
+    Each state is read on the user's shard.
+
+    Args:
+        user_ids (list): Collectors whose state changed.
+        using (str, optional): Database of the transaction that changed it (default:
+            the current shard's).
+    """
+
+    def publish():
+        broker = get_broker()
+        channels = {user_id: user_channel(user_id) for user_id in user_ids}
+        for user_id, channel in channels.items():
+            if not broker.wants(channel):
+                continue
+            with use_shard(get_shard(user_id)):
+                user = User.objects.filter(pk=user_id).first()
+                if user is not None:
+                    broker.publish(channel, dump_state(user))
+
+    transaction.on_commit(publish, using=using or router.db_for_write(User))
+
+
+def load_state(user_id: int, shard: str) -> str:
+    with use_shard(shard):
+        return dump_state(User.objects.get(pk=user_id))
+
+
+async def state_events(user_id: int, shard: str):
+    """
+    Server-sent events of a collector's state: the current one, then every change.
+
+    A comment line goes out every `PUSH_KEEPALIVE_SECONDS` so proxies keep the idle
+    connection open.
+    """
+    with get_broker().subscribe(user_channel(user_id)) as subscription:
+        # subscribed first, a change made while the state loads is not lost
+        state = await sync_to_async(load_state)(user_id, shard)
+        yield f"event: state\ndata: {state}\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(
+                    subscription.get(), settings.PUSH_KEEPALIVE_SECONDS
+                )
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: state\ndata: {message}\n\n"
+
+
+def authenticate(request):
+    """
+    The user and shard of a JWT sent as bearer token, or in `?token=` as
+    `EventSource` can not set headers.
+    """
+    authentication = ShardedJWTAuthentication()
+    raw_token = request.GET.get("token")
+    if raw_token is None:
+        header = authentication.get_header(request)
+        raw_token = header and authentication.get_raw_token(header)
+    if not raw_token:
+        raise AuthenticationFailed("Authentication credentials were not provided.")
+    user = authentication.get_user(authentication.get_validated_token(raw_token))
+    return user, current_shard.get()
+
+
+async def state_stream(request):
+    """
+    Stream the authenticated collector's state changes as server-sent events.
+
+    Needs an ASGI server (`cash_collector.asgi`), under WSGI the stream would never
+    be sent.
+    """
+    try:
+        user, shard = await sync_to_async(authenticate)(request)
+    except (AuthenticationFailed, InvalidToken, TokenError) as error:
+        return JsonResponse({"detail": str(error)}, status=401)
+    response = StreamingHttpResponse(
+        state_events(user.pk, shard), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    # do not let nginx buffer the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,571 @@
+"""
+Periodic collections reports
+
+Per collector and per manager totals for every day (or month) of a date range:
+collected amount and count, payments, outstanding cash at the end of the period and
+frozen days. Collectors are split in chunks that are aggregated in a process pool with
+grouped SQL, the per day series are then post-processed as NumPy matrices
+(collectors x days).
+
+Payments come from the `Payment` ledger. Outstanding cash is the running collected
+minus paid balance, a collector counts as frozen on the days that come their threshold
+days or more after their balance reached their threshold amount without dropping
+below it, as `is_frozen` does (see `app.thresholds`).
+"""
+
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
+
+from app.models import ArchivedTask, Payment, Task, User
+from app.sharding import fan_out, use_shard
+from app.thresholds import get_threshold_policy
+
+DAILY = "daily"
+MONTHLY = "monthly"
+CSV = "csv"
+# columnar binary output, one compressed array per column (numpy .npz)
+COLUMNAR = "npz"
+
+COLLECTOR_COLUMNS = (
+    "period",
+    "manager_id",
+    "collector_id",
+    "collected",
+    "collected_count",
+    "paid",
+    "outstanding",
+    "frozen_days",
+)
+MANAGER_COLUMNS = (
+    "period",
+    "manager_id",
+    "collectors",
+    "collected",
+    "collected_count",
+    "paid",
+    "outstanding",
+    "frozen_days",
+)
+
+
+def get_collector_chunks(chunk_size: int) -> list:
+    """
+    Split every shard's collectors in chunks of at most `chunk_size`.
+
+    Returns:
+        list: (shard, collector ids) tuples.
+    """
+
+    def chunks(shard):
+        ids = list(
+            User.objects.filter(is_superuser=False)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        return [ids[i : i + chunk_size] for i in range(0, len(ids), chunk_size)]
+
+    return [
+        (shard, ids)
+        for shard, shard_chunks in fan_out(chunks).items()
+        for ids in shard_chunks
+    ]
+
+
+def sources():
+    """
+    (queryset, user field, date field, value) of every source of collections and payments.
+    """
+    return {
+        "collected": [
+            (
+                Task.objects.filter(is_collected=True),
+                "assigned_to_id",
+                "collected_at",
+                "amount",
+            ),
+            (ArchivedTask.objects.all(), "assigned_to_id", "collected_at", "amount"),
+        ],
+        "paid": [(Payment.objects.all(), "user_id", "created_at", "amount")],
+    }
+
+
+def compute_chunk(shard: str, collector_ids: list, start: date, days: int) -> dict:
+    """
+    Aggregate one chunk of collectors over `days` days from `start`.
+
+    Runs in a worker process. Every source is read with one grouped query per day
+    range plus one for the opening balance before `start`.
+
+    Returns:
+        dict: `collector_ids`, `manager_ids`, `threshold` and `threshold_days` arrays,
+            `collected`, `collected_count`, `paid` matrices (collectors x days) and the
+            `opening` balance per collector.
+    """
+    since = datetime.combine(start, time.min)
+    until = since + timedelta(days=days)
+    row = {collector_id: i for i, collector_id in enumerate(collector_ids)}
+    shape = (len(collector_ids), days)
+    result = {
+        "collected": np.zeros(shape),
+        "collected_count": np.zeros(shape, dtype=np.int64),
+        "paid": np.zeros(shape),
+        "opening": np.zeros(len(collector_ids)),
+    }
+    with use_shard(shard):
+        result["collector_ids"] = np.array(collector_ids, dtype=np.int64)
+        collectors = User.objects.only(
+            "id", "manager_id", "threshold", "threshold_days"
+        ).in_bulk(collector_ids)
+        result["manager_ids"] = np.array(
+            [
+                collectors[collector_id].manager_id or 0
+                for collector_id in collector_ids
+            ],
+            dtype=np.int64,
+        )
+        policies = [
+            get_threshold_policy(collectors[collector_id])
+            for collector_id in collector_ids
+        ]
+        result["threshold"] = np.array([policy.amount for policy in policies])
+        result["threshold_days"] = np.array(
+            [policy.days for policy in policies], dtype=np.int64
+        )
+        for key, key_sources in sources().items():
+            sign = 1 if key == "collected" else -1
+            for queryset, user_field, date_field, value in key_sources:
+                queryset = queryset.filter(**{f"{user_field}__in": collector_ids})
+                rows = (
+                    queryset.filter(
+                        **{f"{date_field}__gte": since, f"{date_field}__lt": until}
+                    )
+                    .annotate(day=TruncDate(date_field))
+                    .values_list(user_field, "day")
+                    .annotate(total=Sum(value), count=Count("id"))
+                    .order_by()
+                )
+                rows = list(rows)
+                if rows:
+                    users, days_, totals, counts = zip(*rows)
+                    rows_index = np.array([row[user] for user in users])
+                    day_index = np.array([(day - start).days for day in days_])
+                    np.add.at(result[key], (rows_index, day_index), totals)
+                    if key == "collected":
+                        np.add.at(
+                            result["collected_count"], (rows_index, day_index), counts
+                        )
+                opening = (
+                    queryset.filter(**{f"{date_field}__lt": since})
+                    .values_list(user_field)
+                    .annotate(total=Sum(value))
+                    .order_by()
+                )
+                for user, total in opening:
+                    result["opening"][row[user]] += sign * (total or 0)
+    return result
+
+
+def _compute_chunk(args):
+    return compute_chunk(*args)
+
+
+def _init_worker():
+    # forked workers must open their own database connections
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cash_collector.settings")
+    django.setup()
+
+
+def build_report(
+    start: date, end: date, workers: int = 1, chunk_size: int = 500
+) -> dict:
+    """
+    Compute the per collector daily series from `start` to `end` (inclusive).
+
+    The range is extended back by the longest threshold days of any collector so
+    freezes that started before `start` are counted, and trimmed again before
+    returning.
+
+    Args:
+        start (date): First day of the report.
+        end (date): Last day of the report.
+        workers (int): Worker processes, 1 computes in this process (default: 1).
+        chunk_size (int): Collectors per chunk (default: 500).
+
+    Returns:
+        dict: `days` (list of dates), `collector_ids`, `manager_ids` arrays and the
+            `collected`, `collected_count`, `paid`, `outstanding`, `frozen` matrices.
+    """
+    overrides = fan_out(
+        lambda shard: User.objects.aggregate(days=Max("threshold_days"))["days"]
+    )
+    lead = max(settings.THRESHOLD_DAYS, *(days or 0 for days in overrides.values()))
+    first = start - timedelta(days=lead)
+    days = (end - first).days + 1
+    jobs = [
+        (shard, ids, first, days) for shard, ids in get_collector_chunks(chunk_size)
+    ]
+    if workers > 1 and len(jobs) > 1:
+        connections.close_all()
+        with ProcessPoolExecutor(workers, initializer=_init_worker) as executor:
+            chunks = list(executor.map(_compute_chunk, jobs))
+    else:
+        chunks = [compute_chunk(*job) for job in jobs]
+
+    if chunks:
+        report = {
+            key: np.concatenate([chunk[key] for chunk in chunks]) for key in chunks[0]
+        }
+    else:
+        report = {
+            "collector_ids": np.zeros(0, dtype=np.int64),
+            "manager_ids": np.zeros(0, dtype=np.int64),
+            "collected": np.zeros((0, days)),
+            "collected_count": np.zeros((0, days), dtype=np.int64),
+            "paid": np.zeros((0, days)),
+            "opening": np.zeros(0),
+            "threshold": np.zeros(0),
+            "threshold_days": np.zeros(0, dtype=np.int64),
+        }
+
+    # running balance at the end of every day
+    outstanding = report.pop("opening")[:, None] + np.cumsum(
+        report["collected"] - report["paid"], axis=1
+    )
+    # length of the run of days at or above the threshold ending on each day
+    over = outstanding >= report.pop("threshold")[:, None]
+    day_index = np.arange(days)
+    last_under = np.maximum.accumulate(np.where(over, -1, day_index), axis=1)
+    report["outstanding"] = outstanding
+    report["frozen"] = (
+        day_index - last_under > report.pop("threshold_days")[:, None]
+    ).astype(np.int64)
+
+    for key in ("collected", "collected_count", "paid", "outstanding", "frozen"):
+        report[key] = report[key][:, lead:]
+    report["days"] = [start + timedelta(days=i) for i in range(days - lead)]
+    return report
+
+
+def group_periods(report: dict, period: str) -> tuple:
+    """
+    Roll the daily matrices up to `period`.
+
+    Returns:
+        tuple: (period labels, dict of collectors x periods matrices).
+    """
+    days = report["days"]
+    if period == DAILY:
+        labels = [day.isoformat() for day in days]
+        starts = np.arange(len(days))
+    else:
+        labels, starts = [], []
+        for i, day in enumerate(days):
+            if not labels or day.strftime("%Y-%m") != labels[-1]:
+                labels.append(day.strftime("%Y-%m"))
+                starts.append(i)
+        starts = np.array(starts, dtype=np.int64)
+    if not len(days):
+        return labels, {}
+    ends = np.append(starts[1:], len(days)) - 1
+    grouped = {
+        key: np.add.reduceat(report[key], starts, axis=1)
+        for key in ("collected", "collected_count", "paid", "frozen")
+    }
+    # balances are not summed, the period ends with its last day's balance
+    grouped["outstanding"] = report["outstanding"][:, ends]
+    return labels, grouped
+
+
+def manager_totals(report: dict, grouped: dict) -> tuple:
+    """
+    Sum the collectors x periods matrices per manager.
+
+    Returns:
+        tuple: (manager ids, collectors per manager, dict of managers x periods matrices).
+    """
+    manager_ids, rows, collectors = np.unique(
+        report["manager_ids"], return_inverse=True, return_counts=True
+    )
+    totals = {}
+    for key, matrix in grouped.items():
+        totals[key] = np.zeros((len(manager_ids), matrix.shape[1]), dtype=matrix.dtype)
+        np.add.at(totals[key], rows, matrix)
+    return manager_ids, collectors, totals
+
+
+def write_table(path, columns: dict, formats) -> list:
+    """
+    Write one table as csv and/or columnar npz files next to each other.
+
+    Returns:
+        list: Paths written.
+    """
+    written = []
+    if CSV in formats:
+        csv_path = path.with_suffix(".csv")
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(zip(*columns.values()))
+        written.append(csv_path)
+    if COLUMNAR in formats:
+        npz_path = path.with_suffix(".npz")
+        np.savez_compressed(
+            npz_path, **{name: np.asarray(values) for name, values in columns.items()}
+        )
+        written.append(npz_path)
+    return written
+
+
+def write_report(
+    report: dict, output_dir, period: str, formats, first: date = None
+) -> list:
+    """
+    Write one collectors and one managers file per period label.
+
+    Args:
+        report (dict): Result of `build_report`.
+        output_dir (Path): Directory receiving a `<period>/` sub directory.
+        period (str): `DAILY` or `MONTHLY`.
+        formats (iterable): `CSV` and/or `COLUMNAR`.
+        first (date, optional): Skip the periods ending before this day (default:
+            write all of them).
+
+    Returns:
+        list: Paths written.
+    """
+    labels, grouped = group_periods(report, period)
+    manager_ids, collectors, totals = manager_totals(report, grouped)
+    directory = output_dir / period
+    directory.mkdir(parents=True, exist_ok=True)
+    # labels are ISO days or months, they compare like the periods
+    skip = (
+        (first.isoformat() if period == DAILY else first.strftime("%Y-%m"))
+        if first
+        else ""
+    )
+    written = []
+    for i, label in enumerate(labels):
+        if label < skip:
+            continue
+        written += write_table(
+            directory / f"collectors-{label}",
+            {
+                "period": [label] * len(report["collector_ids"]),
+                "manager_id": report["manager_ids"],
+                "collector_id": report["collector_ids"],
+                **{
+                    key: grouped[key][:, i]
+                    for key in ("collected", "collected_count", "paid", "outstanding")
+                },
+                "frozen_days": grouped["frozen"][:, i],
+            },
+            formats,
+        )
+        written += write_table(
+            directory / f"managers-{label}",
+            {
+                "period": [label] * len(manager_ids),
+                "manager_id": manager_ids,
+                "collectors": collectors,
+                **{
+                    key: totals[key][:, i]
+                    for key in ("collected", "collected_count", "paid", "outstanding")
+                },
+                "frozen_days": totals["frozen"][:, i],
+            },
+            formats,
+        )
+    return written
+
+
+def fingerprint_sources(shard: str):
+    """
+    (name, queryset, date field, value) of every source, named after the shard.
+    """
+    for key, key_sources in sources().items():
+        for n, (queryset, user_field, date_field, value) in enumerate(key_sources):
+            yield f"{shard}:{key}:{n}", queryset, date_field, value
+
+
+def history_fingerprint(start: date) -> list:
+    """
+    Cheap summary of everything recorded before `start`, which feeds the opening
+    balances.
+
+    Returns:
+        list: Sorted [source, count, total] entries.
+    """
+    since = datetime.combine(start, time.min)
+
+    def fingerprint(shard):
+        entries = []
+        for name, queryset, date_field, value in fingerprint_sources(shard):
+            before = queryset.filter(**{f"{date_field}__lt": since}).aggregate(
+                count=Count("id"), total=Sum(value)
+            )
+            entries.append([name, before["count"], round(before["total"] or 0, 6)])
+        return entries
+
+    return sorted(
+        entry for entries in fan_out(fingerprint).values() for entry in entries
+    )
+
+
+def day_fingerprints(start: date, end: date) -> dict:
+    """
+    Cheap per day summary of every source, used to find the days that changed.
+
+    Everything recorded before `start` is summed under the `"before"` key (see
+    `history_fingerprint`).
+
+    Returns:
+        dict: ISO day (or `"before"`) to a sorted list of [source, count, total].
+    """
+    since = datetime.combine(start, time.min)
+    until = datetime.combine(end + timedelta(days=1), time.min)
+
+    def fingerprint(shard):
+        result = {}
+        for name, queryset, date_field, value in fingerprint_sources(shard):
+            rows = (
+                queryset.filter(
+                    **{f"{date_field}__gte": since, f"{date_field}__lt": until}
+                )
+                .annotate(day=TruncDate(date_field))
+                .values_list("day")
+                .annotate(count=Count("id"), total=Sum(value))
+                .order_by()
+            )
+            for day, count, total in rows:
+                result.setdefault(day.isoformat(), []).append(
+                    [name, count, round(total or 0, 6)]
+                )
+        return result
+
+    fingerprints = {}
+    for result in fan_out(fingerprint).values():
+        for day, entries in result.items():
+            fingerprints.setdefault(day, []).extend(entries)
+    fingerprints = {day: sorted(entries) for day, entries in fingerprints.items()}
+    fingerprints["before"] = history_fingerprint(start)
+    return fingerprints
+
+
+def first_changed_day(start: date, end: date, fingerprints: dict, state: dict):
+    """
+    First day from `start` whose partitions are stale compared to a previous run's
+    `state`.
+
+    `fingerprints` must start on the previous run's first day, or `start` when it is
+    later. Days the previous run did not write are stale, and so is every day after a
+    change since it moves their balances.
+
+    Returns:
+        date | None: `start` when the previous run is unusable, began after `start` or
+            the history before it changed, None when nothing changed.
+    """
+    if (
+        "days" not in state
+        or date.fromisoformat(state["start"]) > start
+        or state["before"] != fingerprints.get("before")
+    ):
+        return start
+    previous = state["days"]
+    changed = [
+        date.fromisoformat(day)
+        for day in set(previous) | set(fingerprints)
+        if day != "before" and previous.get(day) != fingerprints.get(day)
+    ]
+    changed.append(date.fromisoformat(state["end"]) + timedelta(days=1))
+    since = max(start, min(changed))
+    return since if since <= end else None
+
+
+def generate_reports(
+    start: date,
+    end: date,
+    output_dir,
+    periods=(DAILY, MONTHLY),
+    formats=(CSV,),
+    workers: int = 1,
+    chunk_size: int = 500,
+    incremental: bool = False,
+) -> list:
+    """
+    Build and write the reports, in incremental mode only the stale partitions.
+
+    A change on one day moves every later outstanding balance, so the partitions are
+    rewritten from the first changed day (from the start of its month for monthly
+    partitions) up to `end`. The fingerprints are kept per day in `state.json` in
+    `output_dir`, a window sliding forward like the command's default one reuses the
+    days it shares with the previous run, only its first month is rewritten then.
+
+    Returns:
+        list: Paths written.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    state_path = output_dir / "state.json"
+    state = {}
+    if incremental and state_path.exists():
+        state = json.loads(state_path.read_text())
+        if state.get("periods") != list(periods) or state.get("formats") != list(
+            formats
+        ):
+            state = {}
+    first = min(start, date.fromisoformat(state["start"])) if "days" in state else start
+    fingerprints = day_fingerprints(first, end)
+    since = first_changed_day(start, end, fingerprints, state) if state else start
+
+    written = []
+    if since is not None:
+        report_start = max(start, since.replace(day=1)) if MONTHLY in periods else since
+        report = build_report(report_start, end, workers=workers, chunk_size=chunk_size)
+        for period in periods:
+            written += write_report(report, output_dir, period, formats, first=since)
+    # the first month's partition covers the days from `start`, which moved
+    first_month_end = (start.replace(day=28) + timedelta(days=4)).replace(
+        day=1
+    ) - timedelta(days=1)
+    if (
+        MONTHLY in periods
+        and state.get("start", start.isoformat()) != start.isoformat()
+        and (since is None or since > first_month_end)
+    ):
+        report = build_report(
+            start, min(end, first_month_end), workers=workers, chunk_size=chunk_size
+        )
+        written += write_report(report, output_dir, MONTHLY, formats)
+
+    state_path.write_text(
+        json.dumps(
+            {
+                "start": start.isoformat(),
+                "end": end.isoformat(),
+                "periods": list(periods),
+                "formats": list(formats),
+                "before": (
+                    fingerprints["before"]
+                    if first == start
+                    else history_fingerprint(start)
+                ),
+                "days": {
+                    day: entries
+                    for day, entries in fingerprints.items()
+                    if day != "before" and day >= start.isoformat()
+                },
+            }
+        )
+    )
+    return written
@@ -0,0 +1,65 @@
+"""
+Prebuilt OpenAPI schema
+
+`manage.py build_schema` writes the schema once at build time, `StaticSchemaView`
+serves the file (gzipped when the client accepts it) without importing
+drf_spectacular or introspecting a single view.
+"""
+
+import gzip
+import hashlib
+from functools import cache
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.views import View
+
+
+def write_schema(content: bytes) -> None:
+    """
+    Write the schema and its gzipped copy next to each other.
+    """
+    path = settings.OPENAPI_SCHEMA_PATH
+    path.write_bytes(content)
+    path.with_name(path.name + ".gz").write_bytes(gzip.compress(content, mtime=0))
+    load_schema.cache_clear()
+
+
+@cache
+def load_schema() -> tuple:
+    """
+    Read the prebuilt schema once per process.
+
+    Returns:
+        tuple: (raw bytes, gzipped bytes, etag).
+
+    Raises:
+        FileNotFoundError: If `build_schema` has not been run.
+    """
+    path = settings.OPENAPI_SCHEMA_PATH
+    content = path.read_bytes()
+    compressed = path.with_name(path.name + ".gz").read_bytes()
+    return content, compressed, '"%s"' % hashlib.md5(content).hexdigest()
+
+
+class StaticSchemaView(View):
+    """
+    Serve the prebuilt OpenAPI schema.
+    """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            content, compressed, etag = load_schema()
+        except FileNotFoundError:
+            raise Http404("Schema not built, run `manage.py build_schema`")
+        if request.headers.get("If-None-Match") == etag:
+            return HttpResponseNotModified(headers={"ETag": etag})
+        if "gzip" in request.headers.get("Accept-Encoding", ""):
+            response = HttpResponse(compressed, content_type="application/json")
+            response["Content-Encoding"] = "gzip"
+        else:
+            response = HttpResponse(content, content_type="application/json")
+        response["ETag"] = etag
+        response["Vary"] = "Accept-Encoding"
+        response["Cache-Control"] = "public, max-age=3600"
+        return response
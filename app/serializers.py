@@ -3,14 +3,57 @@ from django.shortcuts import render
 # Create your views here.
 from rest_framework import serializers
 
+from .utility import is_frozen
 
-class ReadTaskSerializer(serializers.Serializer):
+
+class SparseFieldsSerializer(serializers.Serializer):
+    """
+    Serializer taking a `fields` argument, the names of the fields to keep.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class ReadTaskSerializer(SparseFieldsSerializer):
     id = serializers.IntegerField()
     description = serializers.CharField()
     amount = serializers.FloatField()
     due_date = serializers.DateTimeField()
     collected_at = serializers.DateTimeField()
     remaining_amount = serializers.IntegerField()
+    priority = serializers.IntegerField()
+    latitude = serializers.FloatField()
+    longitude = serializers.FloatField()
+
+
+class OverdueTaskSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    assigned_to = serializers.IntegerField(source="assigned_to_id")
+    amount = serializers.FloatField()
+    due_date = serializers.DateTimeField()
+    priority = serializers.IntegerField()
+
+
+class OverdueFilterSerializer(serializers.Serializer):
+    manager = serializers.IntegerField(required=False)
+    collector = serializers.IntegerField(required=False)
+
+
+class HomeScreenQuerySerializer(serializers.Serializer):
+    recent = serializers.IntegerField(min_value=0, max_value=50, default=5)
+
+
+class HomeScreenSerializer(serializers.Serializer):
+    is_frozen = serializers.BooleanField()
+    collected = serializers.FloatField()
+    next_task = ReadTaskSerializer(allow_null=True)
+    recent_tasks = ReadTaskSerializer(many=True)
+    version = serializers.CharField()
 
 
 class EmptySerializer(serializers.Serializer):
@@ -27,3 +70,94 @@ class PaySomeCollectedSerializer(serializers.Serializer):
 
 class CustomCollectSerializer(serializers.Serializer):
     collect_date = serializers.DateTimeField()
+
+
+class SyncEventSerializer(serializers.Serializer):
+    task = serializers.IntegerField()
+    collect_date = serializers.DateTimeField()
+
+
+class SyncCollectSerializer(serializers.Serializer):
+    events = SyncEventSerializer(many=True, allow_empty=False, max_length=500)
+
+
+class SyncResultSerializer(serializers.Serializer):
+    task = serializers.IntegerField()
+    result = serializers.CharField()
+
+
+class SyncCollectResponseSerializer(serializers.Serializer):
+    results = SyncResultSerializer(many=True)
+    collected = serializers.FloatField()
+    is_frozen = serializers.BooleanField()
+
+
+class AssignTasksSerializer(serializers.Serializer):
+    task_ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, allow_empty=False
+    )
+    dry_run = serializers.BooleanField(default=False)
+
+
+class AssignmentResultSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    username = serializers.CharField()
+    tasks = serializers.IntegerField()
+    amount = serializers.FloatField()
+
+
+class SettlementPaymentSerializer(serializers.Serializer):
+    collector = serializers.IntegerField()
+    amount = serializers.FloatField()
+
+    def validate_amount(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Ensure this value is greater than 0.")
+        return value
+
+
+class SettlementSerializer(serializers.Serializer):
+    all = serializers.BooleanField(default=False)
+    payments = SettlementPaymentSerializer(many=True, required=False, allow_empty=False)
+
+    def validate(self, attrs):
+        if attrs["all"] == ("payments" in attrs):
+            raise serializers.ValidationError("send either all or payments, not both")
+        collectors = [payment["collector"] for payment in attrs.get("payments", ())]
+        if len(set(collectors)) != len(collectors):
+            raise serializers.ValidationError("a collector can only be paid once")
+        return attrs
+
+
+class SettlementResultSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    username = serializers.CharField()
+    paid = serializers.FloatField()
+    collected = serializers.FloatField()
+    reached_limit_date = serializers.DateTimeField(allow_null=True)
+
+
+class LocationSerializer(serializers.Serializer):
+    latitude = serializers.FloatField(min_value=-90, max_value=90, required=False)
+    longitude = serializers.FloatField(min_value=-180, max_value=180, required=False)
+
+    def validate(self, attrs):
+        if len(attrs) == 1:
+            raise serializers.ValidationError(
+                "latitude and longitude must be sent together"
+            )
+        return attrs
+
+
+class TeamMemberSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    username = serializers.CharField()
+    collected = serializers.FloatField()
+    is_frozen = serializers.SerializerMethodField()
+    open_count = serializers.IntegerField()
+    open_amount = serializers.FloatField()
+    overdue_count = serializers.IntegerField()
+    overdue_as_of = serializers.DateTimeField()
+
+    def get_is_frozen(self, obj) -> bool:
+        return is_frozen(obj)
@@ -0,0 +1,164 @@
+"""
+Bulk settlement
+
+End of day payouts of a manager's team in one transaction: the same changes as
+`PayAllCollected` / `PaySomeOfCollected` per collector, written with a handful of
+set-based statements whatever the team size.
+"""
+
+from django.contrib.auth import get_user_model
+from django.db import router, transaction
+from rest_framework.exceptions import ValidationError
+
+from app import outbox, push
+from app.assignment import UPDATE_BATCH_SIZE
+from app.models import Payment, Task
+from app.thresholds import get_threshold_policy
+
+User = get_user_model()
+
+
+def batched(items: list):
+    for start in range(0, len(items), UPDATE_BATCH_SIZE):
+        yield items[start : start + UPDATE_BATCH_SIZE]
+
+
+def get_collectors(manager: User, payments: dict = None) -> list:
+    """
+    Lock the collectors to settle and check the payments against their balance.
+
+    Raises:
+        ValidationError: Per collector id, for those outside the team or paying
+            nothing or more than they collected.
+    """
+    team = User.objects.select_for_update().filter(manager=manager, is_superuser=False)
+    if payments is None:
+        return list(team.filter(collected__gt=0).order_by("id"))
+    collectors = team.filter(pk__in=payments).order_by("id").in_bulk()
+    errors = {}
+    for collector_id, amount in payments.items():
+        collector = collectors.get(collector_id)
+        if collector is None:
+            errors[str(collector_id)] = "Not a collector of your team"
+        elif amount <= 0 or collector.collected == 0 or amount > collector.collected:
+            errors[str(collector_id)] = "Invalid collected amount"
+    if errors:
+        raise ValidationError(errors)
+    return list(collectors.values())
+
+
+def pay_tasks(payments: dict) -> None:
+    """
+    Reduce the `remaining_amount` of the collectors' tasks by their payment, oldest
+    task first as `PaySomeOfCollected` does.
+
+    The open balances of the paying collectors are read in one query (per
+    `UPDATE_BATCH_SIZE` collectors), tasks paid in full are zeroed with
+    `UPDATE ... WHERE id IN (...)` and the partly paid ones, one per collector at
+    most, are written with one `bulk_update`.
+    """
+    if not payments:
+        return
+    paid_ids, partly_paid = [], []
+    left = dict(payments)
+    for collector_ids in batched(sorted(left)):
+        tasks = (
+            Task.objects.filter(
+                assigned_to_id__in=collector_ids, remaining_amount__gt=0
+            )
+            .order_by("assigned_to_id", "id")
+            .values_list("id", "assigned_to_id", "remaining_amount")
+        )
+        for task_id, collector_id, remaining_amount in tasks:
+            amount = left[collector_id]
+            if not amount:
+                continue
+            if remaining_amount <= amount:
+                paid_ids.append(task_id)
+                left[collector_id] = amount - remaining_amount
+            else:
+                partly_paid.append(
+                    Task(pk=task_id, remaining_amount=remaining_amount - amount)
+                )
+                left[collector_id] = 0
+    for ids in batched(paid_ids):
+        Task.objects.filter(pk__in=ids).update(remaining_amount=0)
+    Task.objects.bulk_update(partly_paid, ["remaining_amount"], UPDATE_BATCH_SIZE)
+
+
+def settle(manager: User, payments: dict = None) -> list:
+    """
+    Pay out the manager's collectors in one transaction.
+
+    Without `payments` every collector has all their tasks settled and their limit
+    lifted, like `PayAllCollected`. Explicit payments settle the oldest tasks first,
+    even when they cover the whole balance, and lift the limit once the balance is back
+    under the threshold, like `PaySomeOfCollected`. Payment events go to the outbox and the new states to the
+    collectors' streams.
+
+    Args:
+        manager (User): The manager whose team is paid.
+        payments (dict, optional): Amount paid per collector id (default: every
+            collector of the team pays everything collected).
+
+    Returns:
+        list: Per collector dicts with `id`, `username`, `paid`, `collected` and
+            `reached_limit_date` after the payment.
+
+    Raises:
+        ValidationError: If a collector is outside the team or pays more than they
+            collected, nothing is paid then.
+    """
+    with transaction.atomic(using=router.db_for_write(User)):
+        collectors = get_collectors(manager, payments)
+        if not collectors:
+            return []
+        if payments is None:
+            payments = {collector.pk: collector.collected for collector in collectors}
+            for ids in batched(list(payments)):
+                Task.objects.filter(
+                    assigned_to_id__in=ids, remaining_amount__gt=0
+                ).update(remaining_amount=0)
+        else:
+            pay_tasks(payments)
+
+        lifted = []
+        for collector in collectors:
+            collector.collected -= payments[collector.pk]
+            if collector.collected < get_threshold_policy(collector).amount:
+                collector.reached_limit_date = None
+                lifted.append(collector)
+        User.objects.bulk_update(
+            collectors, ["collected", "reached_limit_date"], UPDATE_BATCH_SIZE
+        )
+        for users in batched(lifted):
+            outbox.cancel_freezes(users)
+        Payment.objects.bulk_create(
+            (
+                Payment(user=collector, amount=payments[collector.pk])
+                for collector in collectors
+            ),
+            UPDATE_BATCH_SIZE,
+        )
+        outbox.enqueue_many(
+            outbox.PAYMENT,
+            [
+                (
+                    collector,
+                    {"paid": payments[collector.pk], "collected": collector.collected},
+                )
+                for collector in collectors
+            ],
+        )
+        push.publish_state([collector.pk for collector in collectors])
+
+    return [
+        {
+            "id": collector.pk,
+            "username": collector.get_username(),
+            "paid": payments[collector.pk],
+            "collected": collector.collected,
+            "reached_limit_date": collector.reached_limit_date,
+        }
+        for collector in collectors
+    ]
@@ -0,0 +1,371 @@
+"""
+Sharding of manager teams across databases
+
+The `default` database is the directory: it holds every user (login and admin run
+against it) and the `ShardMap` saying which database a user's team lives on. A team
+placed on a shard has its users copied there and its tasks moved there. Users
+missing from the map live on `default`, and so does the pool of unassigned tasks.
+
+Each field of a placed user has one authoritative copy: the collection state
+(`STATE_FIELDS`) lives on the shard, where the hot path writes it, everything else
+on `default`, where the admin edits it. Saving a user on `default` writes those
+fields through to the shard copy (see `sync_directory_row`), moving users copies
+the state back next to them.
+
+Requests are pinned to the authenticated user's shard by
+`app.authentication.ShardedJWTAuthentication`, `ShardRouter` then sends every query
+on the app models to it. The map is cached in the `SHARD_CACHE` cache, which every
+process must share: a move only drops the entries of that cache, a process reading
+the map through its own memory keeps routing the moved users to their old shard.
+"""
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F, Max
+
+from app.models import ArchivedTask, IdSequence, Payment, ShardMap, Task, User
+
+DEFAULT_SHARD = "default"
+CACHE_KEY = "shard:%s"
+COPY_BATCH_SIZE = 500
+TASK_SEQUENCE = "task"
+# task ids reserved on `default` at once, then handed out from memory
+ID_BLOCK_SIZE = 1000
+
+# {sequence name: [next id, end]}, the block being handed out by this process
+_id_blocks = {}
+_id_lock = threading.Lock()
+
+# the fields of a placed user held by their shard copy, the rest is held by `default`
+STATE_FIELDS = (
+    "collected",
+    "reached_limit_date",
+    "overdue_count",
+    "overdue_as_of",
+    "synced_until",
+)
+
+# database alias of the shard the current request works on, None for `default`
+current_shard = ContextVar("current_shard", default=None)
+
+
+def get_cache():
+    return caches[settings.SHARD_CACHE]
+
+
+def get_shard(user_id: int) -> str:
+    """
+    Retrieve the database alias holding a user's team, cached in `SHARD_CACHE`.
+    """
+    key = CACHE_KEY % user_id
+    cache = get_cache()
+    shard = cache.get(key)
+    if shard is None:
+        shard = (
+            ShardMap.objects.using(DEFAULT_SHARD)
+            .filter(user_id=user_id)
+            .values_list("shard", flat=True)
+            .first()
+        ) or DEFAULT_SHARD
+        cache.set(key, shard, settings.SHARD_CACHE_TIMEOUT)
+    return shard
+
+
+async def aget_shard(user_id: int) -> str:
+    """
+    Async `get_shard`.
+    """
+    key = CACHE_KEY % user_id
+    cache = get_cache()
+    shard = await cache.aget(key)
+    if shard is None:
+        shard = (
+            await ShardMap.objects.using(DEFAULT_SHARD)
+            .filter(user_id=user_id)
+            .values_list("shard", flat=True)
+            .afirst()
+        ) or DEFAULT_SHARD
+        await cache.aset(key, shard, settings.SHARD_CACHE_TIMEOUT)
+    return shard
+
+
+@contextmanager
+def use_shard(shard: str):
+    """
+    Route the app models' queries made inside the block to `shard`.
+    """
+    token = current_shard.set(shard)
+    try:
+        yield
+    finally:
+        current_shard.reset(token)
+
+
+def fan_out(func, shards=None) -> dict:
+    """
+    Run `func` once per shard with queries routed to that shard.
+
+    Args:
+        func (callable): Called with the shard alias.
+        shards (list, optional): Aliases to query (default: `settings.SHARDS`).
+
+    Returns:
+        dict: The result of `func` per shard alias.
+    """
+    results = {}
+    for shard in shards or settings.SHARDS:
+        with use_shard(shard):
+            results[shard] = func(shard)
+    return results
+
+
+def reserve_ids(name: str, count: int) -> int:
+    """
+    Reserve `count` consecutive ids of a sequence shared by every shard.
+
+    A sequence starts after the highest task id found on any shard, live or
+    archived.
+
+    Returns:
+        int: The first reserved id.
+    """
+    sequences = IdSequence.objects.using(DEFAULT_SHARD)
+    with transaction.atomic(using=DEFAULT_SHARD):
+        # the UPDATE takes the write lock before the read
+        if sequences.filter(name=name).update(next_id=F("next_id") + count):
+            return sequences.get(name=name).next_id - count
+        highest = fan_out(
+            lambda shard: max(
+                Task.objects.aggregate(id=Max("id"))["id"] or 0,
+                ArchivedTask.objects.aggregate(id=Max("task_id"))["id"] or 0,
+            )
+        )
+        first = max(highest.values()) + 1
+        try:
+            with transaction.atomic(using=DEFAULT_SHARD):
+                sequences.create(name=name, next_id=first + count)
+            return first
+        except IntegrityError:
+            # created concurrently
+            sequences.filter(name=name).update(next_id=F("next_id") + count)
+            return sequences.get(name=name).next_id - count
+
+
+def allocate_task_ids(count: int) -> list:
+    """
+    Ids for `count` new tasks, unique across every shard so tasks keep them when
+    their team moves.
+
+    Blocks of `ID_BLOCK_SIZE` ids are reserved and handed out from memory. Inside a
+    transaction on `default` only the ids needed are reserved and nothing is kept for
+    later, as the reservation is rolled back with the transaction.
+    """
+    if not count:
+        return []
+    if connections[DEFAULT_SHARD].in_atomic_block:
+        first = reserve_ids(TASK_SEQUENCE, count)
+        return list(range(first, first + count))
+    with _id_lock:
+        block = _id_blocks.get(TASK_SEQUENCE)
+        if block is None or block[1] - block[0] < count:
+            size = max(ID_BLOCK_SIZE, count)
+            first = reserve_ids(TASK_SEQUENCE, size)
+            block = _id_blocks[TASK_SEQUENCE] = [first, first + size]
+        first = block[0]
+        block[0] += count
+    return list(range(first, first + count))
+
+
+def move_tasks(team_ids: list, source: str, target: str) -> int:
+    """
+    Move the tasks assigned to `team_ids`, live and archived, and their payments from
+    one database to another.
+
+    Live tasks keep their ids, archived ones their `task_id`.
+
+    Returns:
+        int: Number of live tasks moved.
+    """
+    moved = 0
+    for model, user_field in (
+        (Task, "assigned_to_id"),
+        (ArchivedTask, "assigned_to_id"),
+        (Payment, "user_id"),
+    ):
+        rows = model.objects.using(source).filter(**{f"{user_field}__in": team_ids})
+        objs = list(rows)
+        if model is not Task:
+            for obj in objs:
+                obj.pk = None
+        model.objects.using(target).bulk_create(objs, batch_size=COPY_BATCH_SIZE)
+        rows.delete()
+        if model is Task:
+            moved = len(objs)
+    return moved
+
+
+def move_users(user_ids: list, shard: str) -> int:
+    """
+    Move users and their tasks to a shard, each from the database currently holding
+    them, and record it in the map.
+
+    The moved copy is the directory row with the user's collection state, tasks keep
+    their ids (see `allocate_task_ids`). Each side is written in its own transaction, a failure between the
+    two commits can leave a copy on both sides so rerun the move after it.
+
+    Args:
+        user_ids (list): Users to move, managers before their collectors.
+        shard (str): Target database alias, one of `settings.SHARDS`.
+
+    Returns:
+        int: Number of tasks moved.
+    """
+    cache = get_cache()
+    cache.delete_many([CACHE_KEY % user_id for user_id in user_ids])
+    sources = {user_id: get_shard(user_id) for user_id in user_ids}
+    directory = User.objects.using(DEFAULT_SHARD).in_bulk(user_ids)
+    with transaction.atomic(using=shard):
+        for user_id in user_ids:
+            source = sources[user_id]
+            if source == shard:
+                continue
+            user = directory[user_id]
+            if source != DEFAULT_SHARD:
+                state = (
+                    User.objects.using(source)
+                    .filter(pk=user_id)
+                    .values(*STATE_FIELDS)
+                    .first()
+                )
+                for field, value in (state or {}).items():
+                    setattr(user, field, value)
+            if shard == DEFAULT_SHARD:
+                User.objects.using(DEFAULT_SHARD).filter(pk=user_id).update(
+                    **{field: getattr(user, field) for field in STATE_FIELDS}
+                )
+            else:
+                user.save(using=shard)
+    moved = 0
+    for source in settings.SHARDS:
+        if source != shard:
+            with transaction.atomic(using=source), transaction.atomic(using=shard):
+                moved += move_tasks(user_ids, source, shard)
+    for source in set(sources.values()) - {DEFAULT_SHARD, shard}:
+        # collectors first, their manager may be moved along
+        users = User.objects.using(source).filter(pk__in=user_ids)
+        users.filter(is_superuser=False).delete()
+        users.delete()
+
+    ShardMap.objects.using(DEFAULT_SHARD).filter(user_id__in=user_ids).delete()
+    if shard != DEFAULT_SHARD:
+        ShardMap.objects.using(DEFAULT_SHARD).bulk_create(
+            ShardMap(user_id=user_id, shard=shard) for user_id in user_ids
+        )
+    cache.delete_many([CACHE_KEY % user_id for user_id in user_ids])
+    return moved
+
+
+def place_team(manager_id: int, shard: str) -> int:
+    """
+    Move a manager's team, their users and tasks, to a shard, see `move_users`.
+
+    Tasks of the team found on any other database (e.g. created from the admin on
+    `default`) are moved as well.
+
+    Returns:
+        int: Number of tasks moved.
+    """
+    return move_users(
+        [
+            manager_id,
+            *User.objects.using(DEFAULT_SHARD)
+            .filter(manager_id=manager_id)
+            .values_list("id", flat=True),
+        ],
+        shard,
+    )
+
+
+def get_task_shard(assigned_to_id) -> str:
+    """
+    Database a task belongs on: its collector's team shard, `default` for the pool of
+    unassigned tasks.
+    """
+    return get_shard(assigned_to_id) if assigned_to_id else DEFAULT_SHARD
+
+
+def save_task(task: Task) -> None:
+    """
+    Save a task on the database it belongs on, moving it there (with its id) when it
+    was handed to a collector of another team or back to the pool.
+
+    For writes made outside a request pinned to a shard, e.g. from the admin.
+    """
+    target = get_task_shard(task.assigned_to_id)
+    source = task._state.db
+    if source is None or source == target:
+        task.save(using=target)
+        return
+    with transaction.atomic(using=source), transaction.atomic(using=target):
+        Task.objects.using(source).filter(pk=task.pk).delete()
+        task.save(using=target, force_insert=True)
+
+
+def sync_directory_row(user: User, update_fields=None) -> None:
+    """
+    Write the fields of a user saved on `default` through to their shard copy.
+
+    A collector whose manager's team lives on another database (a new collector, or
+    one handed to another manager) is moved there once the save commits.
+    """
+    shard = get_shard(user.pk)
+    target = shard
+    if user.manager_id and not user.is_superuser:
+        target = get_shard(user.manager_id)
+    if target != shard:
+        transaction.on_commit(
+            lambda: move_users([user.pk], target), using=DEFAULT_SHARD
+        )
+    elif shard != DEFAULT_SHARD:
+        User.objects.using(shard).filter(pk=user.pk).update(
+            **{
+                field.attname: getattr(user, field.attname)
+                for field in User._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in STATE_FIELDS
+                and (update_fields is None or field.name in update_fields)
+            }
+        )
+
+
+class ShardRouter:
+    """
+    Send the app models to the current shard, everything else to `default`.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != "app" or model in (ShardMap, IdSequence):
+            return None
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return current_shard.get()
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # a user has a copy on `default` and on their team's shard, e.g. the admin
+        # assigns a shard's task to the directory row
+        if isinstance(obj1, User) or isinstance(obj2, User):
+            return True
+        return obj1._state.db == obj2._state.db
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if model_name in ("shardmap", "idsequence"):
+            return db == DEFAULT_SHARD
+        return None
@@ -0,0 +1,64 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from app.models import Task, User
+from app.ordering import invalidate_manager_ordering
+from app.overdue import count_created_task, recount_overdue_tasks
+from app.push import publish_state
+from app.sharding import DEFAULT_SHARD, get_shard, sync_directory_row
+from app.thresholds import invalidate_threshold_policies
+
+THRESHOLD_FIELDS = {"threshold", "threshold_days"}
+# the fields of a task deciding whose overdue count it is part of
+OVERDUE_FIELDS = ("assigned_to_id", "due_date")
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields, using, raw, **kwargs):
+    # the directory copy was edited (admin, login), shard copies follow it
+    if using == DEFAULT_SHARD and not raw:
+        sync_directory_row(instance, update_fields)
+    # managers are superusers, their ordering and threshold overrides may have changed
+    if instance.is_superuser:
+        invalidate_manager_ordering(instance.pk)
+        if update_fields is None or THRESHOLD_FIELDS & set(update_fields):
+            invalidate_threshold_policies()
+
+
+@receiver(post_save, sender=Task)
+def task_saved(sender, instance, created, update_fields, using, raw, **kwargs):
+    if created:
+        count_created_task(instance, using)
+    if raw:
+        return
+    # as loaded, empty for a task built in memory
+    loaded = getattr(instance, "_loaded_values", {})
+    previous = loaded.get("assigned_to_id")
+    if any(
+        field in loaded and loaded[field] != getattr(instance, field)
+        for field in OVERDUE_FIELDS
+    ):
+        # reassigned (maybe from another shard) or rescheduled
+        if previous is not None:
+            recount_overdue_tasks(
+                User.objects.using(get_shard(previous)).filter(pk=previous)
+            )
+        if instance.assigned_to_id is not None:
+            recount_overdue_tasks(
+                User.objects.using(using).filter(pk=instance.assigned_to_id)
+            )
+    # deferred fields are left out, reading them would load them
+    loaded.update(
+        {
+            field: instance.__dict__[field]
+            for field in OVERDUE_FIELDS
+            if field in instance.__dict__
+        }
+    )
+    instance._loaded_values = loaded
+    # saves of chosen fields come from the API views, which publish once they updated
+    # the collector as well
+    if update_fields is None:
+        collectors = {instance.assigned_to_id, previous} - {None}
+        if collectors:
+            publish_state(list(collectors), using=using)
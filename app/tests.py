@@ -1,16 +1,56 @@
-from unittest.mock import patch
+import asyncio
+import csv
+import gzip
+import json
+import pstats
+import tempfile
+import threading
+from importlib import import_module
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import skipUnless
+from unittest.mock import Mock, patch
+from asgiref.sync import sync_to_async
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.db.models import Sum
-from django.test import TestCase
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
-from app.models import Task, User
-from datetime import datetime, timedelta
-from app.utility import is_frozen
+from rest_framework_simplejwt.tokens import RefreshToken
+from app.models import ArchivedTask, OutboxEvent, Payment, Task, User
+from datetime import date, datetime, timedelta
+from app.checks import check_next_task_ordering, check_shard_cache
+from app.assignment import assign_tasks
+from app.async_apis import AsyncCheckStatus, AsyncGetDoneTasks, AsyncGetNextTask
+from app.middleware import brotli
+from app.profiling import make_token
+from app.push import Broker, LocalBroker, publish_state
+from app.reports import COLUMNAR, CSV, DAILY, MONTHLY, generate_reports
+from app.schema import load_schema
+from app.sharding import fan_out, get_shard, place_team, save_task, use_shard
+from app.thresholds import get_threshold_policy, invalidate_threshold_policies
+from app.throttles import (
+    SWEEP_INTERVAL,
+    _blocked_until,
+    _local_buckets,
+    reset_throttles,
+)
+from app.utility import collect_next_task, get_done_tasks, is_frozen
 
 
 class CashCollectorTest(TestCase):
     def setUp(self):
+        reset_throttles()
         self.manager = User.objects.create_superuser(
             "manager", "manager@example.com", "12345678"
         )
@@ -170,3 +210,2010 @@ class CashCollectorTest(TestCase):
         cash_collector_obj = User.objects.get(pk=self.cash_collector_obj.pk)
         self.assertEqual(cash_collector_obj.collected, 0)
         self.assertEqual(cash_collector_obj.reached_limit_date, None)
+
+
+THROTTLE_TEST_SETTINGS = {
+    **settings.REST_FRAMEWORK,
+    "DEFAULT_THROTTLE_RATES": {"read": "3/min", "write": "2/min"},
+}
+
+
+@override_settings(REST_FRAMEWORK=THROTTLE_TEST_SETTINGS)
+class ThrottleTest(TestCase):
+    def setUp(self):
+        reset_throttles()
+        self.cash_collector_obj = User.objects.create(username="cash_collector")
+        self.client = APIClient()
+        self.client.force_authenticate(self.cash_collector_obj)
+
+    def test_read_throttled_with_retry_after(self):
+        for _ in range(3):
+            response = self.client.get(reverse("check-status"))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(reverse("check-status"))
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        # one token refills every 20 seconds
+        self.assertEqual(response["Retry-After"], "20")
+
+    def test_read_and_write_budgets_are_separate(self):
+        for _ in range(3):
+            self.client.get(reverse("check-status"))
+        response = self.client.post(reverse("pay-all"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_budgets_are_per_user(self):
+        for _ in range(3):
+            self.client.get(reverse("check-status"))
+        other = User.objects.create(username="other_collector")
+        self.client.force_authenticate(other)
+        response = self.client.get(reverse("check-status"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_tokens_refill(self):
+        with patch("app.throttles.TokenBucketThrottle.timer") as mock_timer:
+            mock_timer.return_value = 1000.0
+            for _ in range(3):
+                self.client.get(reverse("check-status"))
+            response = self.client.get(reverse("check-status"))
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            mock_timer.return_value = 1021.0
+            response = self.client.get(reverse("check-status"))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_idle_buckets_swept(self):
+        with patch("app.throttles.TokenBucketThrottle.timer") as mock_timer:
+            mock_timer.return_value = 1000.0
+            for _ in range(4):
+                self.client.get(reverse("check-status"))
+            self.assertEqual(len(_local_buckets), 1)
+            self.assertEqual(len(_blocked_until), 1)
+            # the bucket is full again a minute later, an idle client is forgotten
+            mock_timer.return_value = 1000.0 + 2 * SWEEP_INTERVAL
+            self.client.post(reverse("pay-all"))
+            self.assertEqual(
+                list(_local_buckets), ["throttle_write_%s" % self.cash_collector_obj.pk]
+            )
+            self.assertEqual(_blocked_until, {})
+
+    @override_settings(THROTTLE_CACHE="default")
+    def test_shared_budget(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        with patch("app.throttles.TokenBucketThrottle.timer") as mock_timer:
+            mock_timer.return_value = 6000.0
+            for _ in range(3):
+                response = self.client.get(reverse("check-status"))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+            # another worker: nothing process-local, the same shared counter
+            reset_throttles()
+            response = self.client.get(reverse("check-status"))
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertEqual(response["Retry-After"], "60")
+            # half of the previous window still counts, 1.5 of 3 requests
+            mock_timer.return_value = 6090.0
+            reset_throttles()
+            statuses = [
+                self.client.get(reverse("check-status")).status_code for _ in range(2)
+            ]
+            self.assertEqual(
+                statuses, [status.HTTP_200_OK, status.HTTP_429_TOO_MANY_REQUESTS]
+            )
+
+
+# the offline sessions below start 5 days ago
+@override_settings(SYNC_MAX_AGE_HOURS=7 * 24)
+class SyncCollectTest(TestCase):
+    def setUp(self):
+        reset_throttles()
+        self.cash_collector_obj = User.objects.create(username="cash_collector")
+        self.tasks = [
+            Task.objects.create(
+                assigned_to=self.cash_collector_obj,
+                name=f"test-{i}",
+                amount=1000,
+                remaining_amount=1000,
+                due_date=datetime.now(),
+            )
+            for i in range(1, 10)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.cash_collector_obj)
+        self.start = datetime.now() - timedelta(days=5)
+
+    def sync(self, events):
+        return self.client.post(
+            reverse("sync-collect-tasks"), data={"events": events}, format="json"
+        )
+
+    def test_sync_collects_tasks(self):
+        events = [
+            {"task": task.id, "collect_date": self.start + timedelta(hours=i)}
+            for i, task in enumerate(self.tasks[:3])
+        ]
+        response = self.sync(events)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        res_json = response.json()
+        self.assertEqual(
+            [result["result"] for result in res_json["results"]], ["collected"] * 3
+        )
+        self.assertEqual(res_json["collected"], 3000)
+        self.assertEqual(res_json["is_frozen"], False)
+        task = Task.objects.get(pk=self.tasks[2].id)
+        self.assertEqual(task.is_collected, True)
+        self.assertEqual(task.collected_at, self.start + timedelta(hours=2))
+
+    def test_sync_replays_in_chronological_order(self):
+        # sent out of order, the fifth task in time reaches the threshold
+        events = [
+            {"task": task.id, "collect_date": self.start + timedelta(hours=i)}
+            for i, task in enumerate(self.tasks[:5])
+        ][::-1]
+        self.sync(events)
+        cash_collector_obj = User.objects.get(pk=self.cash_collector_obj.pk)
+        self.assertEqual(
+            cash_collector_obj.reached_limit_date, self.start + timedelta(hours=4)
+        )
+
+    def test_sync_freezes_later_events(self):
+        events = [
+            {"task": task.id, "collect_date": self.start + timedelta(hours=i)}
+            for i, task in enumerate(self.tasks[:5])
+        ]
+        events.append(
+            {"task": self.tasks[5].id, "collect_date": self.start + timedelta(days=3)}
+        )
+        response = self.sync(events)
+        res_json = response.json()
+        self.assertEqual(res_json["results"][-1]["result"], "frozen")
+        self.assertEqual(res_json["collected"], 5000)
+        self.assertEqual(res_json["is_frozen"], True)
+        self.assertEqual(Task.objects.get(pk=self.tasks[5].id).is_collected, False)
+
+    def test_sync_rejects_unknown_and_duplicate_tasks(self):
+        other = User.objects.create(username="other_collector")
+        other_task = Task.objects.create(
+            assigned_to=other, name="other", amount=10, due_date=datetime.now()
+        )
+        events = [
+            {"task": self.tasks[0].id, "collect_date": self.start},
+            {"task": self.tasks[0].id, "collect_date": self.start},
+            {"task": other_task.id, "collect_date": self.start},
+        ]
+        response = self.sync(events)
+        self.assertEqual(
+            [result["result"] for result in response.json()["results"]],
+            ["collected", "already_collected", "not_found"],
+        )
+        self.assertEqual(Task.objects.get(pk=other_task.id).is_collected, False)
+
+    def test_sync_requires_events(self):
+        response = self.sync([])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sync_future_date_taken_as_now(self):
+        before = datetime.now()
+        self.sync(
+            [{"task": self.tasks[0].id, "collect_date": before + timedelta(days=30)}]
+        )
+        collected_at = Task.objects.get(pk=self.tasks[0].id).collected_at
+        self.assertTrue(before <= collected_at <= datetime.now())
+
+    @override_settings(SYNC_MAX_AGE_HOURS=24)
+    def test_sync_refuses_old_events(self):
+        response = self.sync(
+            [
+                {"task": self.tasks[0].id, "collect_date": self.start},
+                {"task": self.tasks[1].id, "collect_date": datetime.now()},
+            ]
+        )
+        self.assertEqual(
+            [result["result"] for result in response.json()["results"]],
+            ["stale", "collected"],
+        )
+        self.assertEqual(Task.objects.get(pk=self.tasks[0].id).is_collected, False)
+
+    def test_sync_refuses_events_before_last_sync(self):
+        self.sync([{"task": self.tasks[0].id, "collect_date": self.start}])
+        for i, task in enumerate(self.tasks[1:6], 1):
+            self.sync(
+                [{"task": task.id, "collect_date": self.start + timedelta(hours=i)}]
+            )
+        self.assertTrue(is_frozen(User.objects.get(pk=self.cash_collector_obj.pk)))
+        # back dated to before the limit was reached
+        response = self.sync(
+            [
+                {
+                    "task": self.tasks[6].id,
+                    "collect_date": self.start + timedelta(hours=2),
+                }
+            ]
+        )
+        self.assertEqual(response.json()["results"][0]["result"], "stale")
+        self.assertEqual(Task.objects.get(pk=self.tasks[6].id).is_collected, False)
+
+    def test_sync_query_count(self):
+        tasks = [
+            Task(
+                assigned_to=self.cash_collector_obj,
+                name=f"bulk-{i}",
+                amount=1,
+                due_date=datetime.now(),
+            )
+            for i in range(200)
+        ]
+        Task.objects.bulk_create(tasks)
+        events = [
+            {"task": task.id, "collect_date": self.start + timedelta(minutes=i)}
+            for i, task in enumerate(tasks)
+        ]
+        # savepoint, user, tasks, bulk update, user update, release
+        with self.assertNumQueries(6):
+            response = self.sync(events)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class AssignTasksTest(TestCase):
+    def setUp(self):
+        reset_throttles()
+        self.manager = User.objects.create_superuser(
+            "manager", "manager@example.com", "12345678"
+        )
+        self.collectors = [
+            User.objects.create(username=f"cash_collector-{i}", manager=self.manager)
+            for i in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def create_pool(self, amounts):
+        return [
+            Task.objects.create(
+                name=f"pool-{i}", amount=amount, due_date=datetime.now()
+            )
+            for i, amount in enumerate(amounts)
+        ]
+
+    def test_assign_balances_amount_and_count(self):
+        self.create_pool([300, 200, 100, 100, 100, 100])
+        response = self.client.post(reverse("assign-tasks"), format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Task.objects.filter(assigned_to__isnull=True).count(), 0)
+        loads = sorted(
+            Task.objects.filter(assigned_to=collector).aggregate(
+                total_amount=Sum("amount")
+            )["total_amount"]
+            for collector in self.collectors
+        )
+        self.assertEqual(loads, [300, 300, 300])
+
+    def test_assign_accounts_for_existing_load(self):
+        Task.objects.create(
+            assigned_to=self.collectors[0],
+            name="existing",
+            amount=1000,
+            due_date=datetime.now(),
+        )
+        self.create_pool([100, 100])
+        self.client.post(reverse("assign-tasks"), format="json")
+        self.assertEqual(Task.objects.filter(assigned_to=self.collectors[0]).count(), 1)
+
+    def test_assign_skips_frozen_and_near_threshold(self):
+        self.collectors[0].reached_limit_date = datetime.now() - timedelta(days=3)
+        self.collectors[0].save()
+        self.collectors[1].collected = 4900
+        self.collectors[1].save()
+        self.create_pool([100, 100, 100])
+        response = self.client.post(reverse("assign-tasks"), format="json")
+        self.assertEqual(
+            [result["id"] for result in response.json()], [self.collectors[2].id]
+        )
+        self.assertEqual(Task.objects.filter(assigned_to=self.collectors[2]).count(), 3)
+
+    def test_assign_selected_tasks_dry_run(self):
+        tasks = self.create_pool([100, 100])
+        response = self.client.post(
+            reverse("assign-tasks"),
+            data={"task_ids": [tasks[0].id], "dry_run": True},
+            format="json",
+        )
+        self.assertEqual(sum(result["tasks"] for result in response.json()), 1)
+        self.assertEqual(Task.objects.filter(assigned_to__isnull=True).count(), 2)
+
+    def test_assign_without_collectors(self):
+        User.objects.filter(manager=self.manager).update(is_active=False)
+        self.create_pool([100])
+        response = self.client.post(reverse("assign-tasks"), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), ["No collectors available for assignment"])
+
+    def test_assign_only_for_managers(self):
+        self.client.force_authenticate(self.collectors[0])
+        response = self.client.post(reverse("assign-tasks"), format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_assign_command(self):
+        self.create_pool([100, 100, 100])
+        out = StringIO()
+        call_command("assign_tasks", "manager", stdout=out)
+        self.assertIn("Assigned 3 tasks", out.getvalue())
+        self.assertEqual(Task.objects.filter(assigned_to__isnull=True).count(), 0)
+
+
+class NearestTaskTest(TestCase):
+    def setUp(self):
+        reset_throttles()
+        self.cash_collector_obj = User.objects.create(username="cash_collector")
+        self.client = APIClient()
+        self.client.force_authenticate(self.cash_collector_obj)
+        # around Riyadh, the first task is the furthest away
+        self.tasks = [
+            Task.objects.create(
+                assigned_to=self.cash_collector_obj,
+                name=f"test-{i}",
+                amount=100,
+                due_date=datetime.now(),
+                latitude=latitude,
+                longitude=longitude,
+            )
+            for i, (latitude, longitude) in enumerate(
+                [(24.90, 46.90), (24.7136, 46.6753), (24.72, 46.68), (24.60, 46.60)]
+            )
+        ]
+
+    def test_next_task_nearest(self):
+        response = self.client.get(
+            reverse("get-next-tasks"), {"latitude": 24.7137, "longitude": 46.6754}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["id"], self.tasks[1].id)
+
+    def test_next_task_nearest_outside_own_cell(self):
+        response = self.client.get(
+            reverse("get-next-tasks"), {"latitude": 24.61, "longitude": 46.59}
+        )
+        self.assertEqual(response.json()["id"], self.tasks[3].id)
+
+    def test_next_task_without_location(self):
+        response = self.client.get(reverse("get-next-tasks"))
+        self.assertEqual(response.json()["id"], self.tasks[0].id)
+
+    def test_next_task_falls_back_to_unlocated_tasks(self):
+        Task.objects.filter(latitude__isnull=False).update(is_collected=True)
+        task = Task.objects.create(
+            assigned_to=self.cash_collector_obj,
+            name="no-location",
+            amount=100,
+            due_date=datetime.now(),
+        )
+        response = self.client.get(
+            reverse("get-next-tasks"), {"latitude": 24.61, "longitude": 46.59}
+        )
+        self.assertEqual(response.json()["id"], task.id)
+
+    def test_next_task_requires_both_coordinates(self):
+        response = self.client.get(reverse("get-next-tasks"), {"latitude": 24.61})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_collect_nearest_task(self):
+        response = self.client.put(
+            reverse("collect-tasks"),
+            data={"latitude": 24.601, "longitude": 46.601},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Task.objects.get(pk=self.tasks[3].id).is_collected, True)
+
+    def test_grid_cell_follows_location(self):
+        task = self.tasks[0]
+        task.latitude, task.longitude = 24.60, 46.60
+        task.save(update_fields=["latitude", "longitude"])
+        self.assertEqual(
+            Task.objects.get(pk=task.id).grid_cell, self.tasks[3].grid_cell
+        )
+
+
+class NextTaskOrderingTest(TestCase):
+    def setUp(self):
+        reset_throttles()
+        self.manager = User.objects.create_superuser(
+            "manager", "manager@example.com", "12345678"
+        )
+        self.cash_collector_obj = User.objects.create(
+            username="cash_collector", manager=self.manager
+        )
+        now = datetime.now()
+        # (amount, due in days, priority)
+        self.tasks = [
+            Task.objects.create(
+                assigned_to=self.cash_collector_obj,
+                name=f"test-{i}",
+                amount=amount,
+                due_date=now + timedelta(days=due_in),
+                priority=priority,
+            )
+            for i, (amount, due_in, priority) in enumerate(
+                [(100, 3, 0), (300, 1, 0), (200, -2, 0), (50, 5, 9)]
+            )
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.cash_collector_obj)
+
+    def next_task_id(self):
+        return self.client.get(reverse("get-next-tasks")).json()["id"]
+
+    def test_default_ordering(self):
+        self.assertEqual(self.next_task_id(), self.tasks[0].id)
+
+    @override_settings(NEXT_TASK_ORDERING="due_date")
+    def test_due_date_ordering(self):
+        self.assertEqual(self.next_task_id(), self.tasks[2].id)
+
+    @override_settings(NEXT_TASK_ORDERING="amount")
+    def test_amount_ordering(self):
+        self.assertEqual(self.next_task_id(), self.tasks[1].id)
+
+    @override_settings(NEXT_TASK_ORDERING="priority")
+    def test_priority_ordering(self):
+        self.assertEqual(self.next_task_id(), self.tasks[3].id)
+
+    def test_manager_override(self):
+        self.assertEqual(self.next_task_id(), self.tasks[0].id)
+        self.manager.next_task_ordering = "amount"
+        self.manager.save()
+        self.assertEqual(self.next_task_id(), self.tasks[1].id)
+
+    def test_manager_override_expires(self):
+        cache.clear()
+        self.assertEqual(self.next_task_id(), self.tasks[0].id)
+        # changed by another worker, whose invalidation this process does not see
+        User.objects.filter(pk=self.manager.pk).update(next_task_ordering="amount")
+        self.assertEqual(self.next_task_id(), self.tasks[0].id)
+        cache.clear()
+        with override_settings(POLICY_CACHE_TIMEOUT=0):
+            self.assertEqual(self.next_task_id(), self.tasks[1].id)
+            User.objects.filter(pk=self.manager.pk).update(next_task_ordering="")
+            self.assertEqual(self.next_task_id(), self.tasks[0].id)
+
+    @override_settings(NEXT_TASK_ORDERING="newest")
+    def test_invalid_ordering_fails_check(self):
+        errors = check_next_task_ordering(None)
+        self.assertEqual([error.id for error in errors], ["app.E001"])
+
+    def test_collect_follows_ordering(self):
+        self.manager.next_task_ordering = "due_date"
+        self.manager.save()
+        self.client.put(reverse("collect-tasks"))
+        self.assertEqual(Task.objects.get(pk=self.tasks[2].id).is_collected, True)
+
+
+class ShardingTest(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        reset_throttles()
+        cache.clear()
+        self.manager = User.objects.create_superuser(
+            "manager", "manager@example.com", "12345678"
+        )
+        self.cash_collector_obj = User.objects.create(
+            username="cash_collector", manager=self.manager
+        )
+        for i in range(6):
+            Task.objects.create(
+                assigned_to=self.cash_collector_obj,
+                name=f"test-{i}",
+                amount=1000,
+                remaining_amount=1000,
+                due_date=datetime.now(),
+            )
+        place_team(self.manager.pk, "shard_1")
+        self.client = APIClient()
+
+    def tearDown(self):
+        cache.clear()
+
+    def authenticate(self, user):
+        token = RefreshToken.for_user(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_place_team_moves_users_and_tasks(self):
+        self.assertEqual(Task.objects.using("default").count(), 0)
+        self.assertEqual(Task.objects.using("shard_1").count(), 6)
+        self.assertEqual(
+            User.objects.using("shard_1").get(pk=self.cash_collector_obj.pk).manager_id,
+            self.manager.pk,
+        )
+        self.assertEqual(get_shard(self.cash_collector_obj.pk), "shard_1")
+
+    @override_settings(
+        CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "shared": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "shared",
+            },
+        },
+        SHARD_CACHE="shared",
+    )
+    def test_move_reaches_other_processes(self):
+        self.addCleanup(caches["shared"].clear)
+        self.assertEqual(get_shard(self.cash_collector_obj.pk), "shard_1")
+        # another worker, with its own memory, moves the team
+        other_worker = {
+            "default": LocMemCache("other-worker", {}),
+            "shared": caches["shared"],
+        }
+        with patch("app.sharding.caches", other_worker):
+            place_team(self.manager.pk, "shard_2")
+        self.assertEqual(get_shard(self.cash_collector_obj.pk), "shard_2")
+
+    @override_settings(SHARD_CACHE="default")
+    def test_per_process_shard_cache_warns(self):
+        errors = check_shard_cache(None)
+        self.assertEqual([error.id for error in errors], ["app.W001"])
+
+    def test_admin_tasks_on_collector_shard(self):
+        self.client.force_login(self.manager)
+        data = {
+            "name": "admin",
+            "description": "from the admin",
+            "amount": 500,
+            "due_date_0": "2024-01-01",
+            "due_date_1": "10:00:00",
+            "priority": 0,
+            "assigned_to": self.cash_collector_obj.pk,
+        }
+        response = self.client.post(reverse("admin:app_task_add"), data)
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertFalse(Task.objects.using("default").filter(name="admin").exists())
+        task = Task.objects.using("shard_1").get(name="admin")
+
+        response = self.client.get(reverse("admin:app_task_changelist"))
+        self.assertNotContains(response, "admin</a>")
+        response = self.client.get(
+            reverse("admin:app_task_changelist"), {"shard": "shard_1"}
+        )
+        self.assertContains(response, "shard_1 (7)")
+
+        # back to the pool, on default, with its id
+        response = self.client.get(reverse("admin:app_task_change", args=[task.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(
+            reverse("admin:app_task_change", args=[task.pk]),
+            {**data, "assigned_to": ""},
+        )
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertFalse(Task.objects.using("shard_1").filter(pk=task.pk).exists())
+        self.assertIsNone(Task.objects.using("default").get(pk=task.pk).assigned_to_id)
+
+    def test_admin_task_publishes_shard_state(self):
+        User.objects.using("shard_1").filter(pk=self.cash_collector_obj.pk).update(
+            collected=1500
+        )
+        task = Task.objects.using("shard_1").filter(name="test-0").get()
+        task.priority = 5
+        broker = Mock(spec=Broker)
+        with patch("app.push.get_broker", return_value=broker):
+            with self.captureOnCommitCallbacks(execute=True, using="shard_1"):
+                save_task(task)
+        (call,) = broker.publish.call_args_list
+        state = json.loads(call.args[1])
+        self.assertEqual(state["collected"], 1500)
+        self.assertEqual(state["next_task"]["id"], task.pk)
+
+    def test_assign_pool_to_sharded_team(self):
+        task = Task.objects.using("default").create(
+            name="pool", amount=100, remaining_amount=100, due_date=datetime.now()
+        )
+        with use_shard("shard_1"):
+            manager = User.objects.get(pk=self.manager.pk)
+            results = assign_tasks(manager)
+        self.assertEqual([result["tasks"] for result in results], [1])
+        self.assertFalse(Task.objects.using("default").exists())
+        self.assertEqual(
+            Task.objects.using("shard_1").get(pk=task.pk).assigned_to_id,
+            self.cash_collector_obj.pk,
+        )
+
+    def test_task_ids_kept_across_moves(self):
+        ids = set(Task.objects.using("shard_1").values_list("id", flat=True))
+        place_team(self.manager.pk, "shard_2")
+        self.assertEqual(
+            set(Task.objects.using("shard_2").values_list("id", flat=True)), ids
+        )
+        other = User.objects.create(username="other", manager=self.manager)
+        with use_shard("default"):
+            task = Task.objects.create(
+                assigned_to=other,
+                name="other",
+                amount=1000,
+                remaining_amount=1000,
+                due_date=datetime.now(),
+            )
+        self.assertNotIn(task.pk, ids)
+
+    def test_collect_and_pay_on_shard(self):
+        self.authenticate(self.cash_collector_obj)
+        response = self.client.get(reverse("get-next-tasks"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for _ in range(2):
+            response = self.client.put(reverse("collect-tasks"))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(
+            reverse("pay-some"), data={"collected": 1500}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            Task.objects.using("shard_1").filter(is_collected=True).count(), 2
+        )
+        collector = User.objects.using("shard_1").get(pk=self.cash_collector_obj.pk)
+        self.assertEqual(collector.collected, 500)
+        # the directory copy on default is not touched by the hot path
+        self.assertEqual(
+            User.objects.using("default").get(pk=self.cash_collector_obj.pk).collected,
+            0,
+        )
+        # the payment ledger moves with the team
+        place_team(self.manager.pk, "shard_2")
+        self.assertEqual(Payment.objects.using("shard_1").count(), 0)
+        self.assertEqual(Payment.objects.using("shard_2").get().amount, 1500)
+
+    def test_team_report_reads_manager_shard(self):
+        self.authenticate(self.manager)
+        response = self.client.get(reverse("team-report"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        res_json = response.json()
+        self.assertEqual(res_json["count"], 1)
+        self.assertEqual(res_json["results"][0]["open_count"], 6)
+        self.assertEqual(res_json["results"][0]["open_amount"], 6000)
+
+    def test_fan_out(self):
+        counts = fan_out(lambda shard: Task.objects.count())
+        self.assertEqual(counts, {"default": 0, "shard_1": 6, "shard_2": 0})
+
+    def test_place_team_back_keeps_state(self):
+        self.authenticate(self.cash_collector_obj)
+        self.client.put(reverse("collect-tasks"))
+        place_team(self.manager.pk, "default")
+        self.assertEqual(Task.objects.using("shard_1").count(), 0)
+        self.assertEqual(User.objects.using("shard_1").count(), 0)
+        self.assertEqual(Task.objects.using("default").count(), 6)
+        self.assertEqual(
+            User.objects.using("default").get(pk=self.cash_collector_obj.pk).collected,
+            1000,
+        )
+        self.assertEqual(get_shard(self.cash_collector_obj.pk), "default")
+
+    def test_directory_edits_reach_shard(self):
+        self.authenticate(self.cash_collector_obj)
+        collector = User.objects.using("default").get(pk=self.cash_collector_obj.pk)
+        collector.is_active = False
+        collector.save()
+        response = self.client.get(reverse("check-status"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_manager_override_reaches_shard(self):
+        manager = User.objects.using("default").get(pk=self.manager.pk)
+        manager.threshold = 1000
+        manager.save(update_fields=["threshold"])
+        with use_shard("shard_1"):
+            collector = User.objects.get(pk=self.cash_collector_obj.pk)
+            self.assertEqual(get_threshold_policy(collector).amount, 1000)
+
+    def test_place_team_back_keeps_directory_edits(self):
+        self.authenticate(self.cash_collector_obj)
+        self.client.put(reverse("collect-tasks"))
+        collector = User.objects.using("default").get(pk=self.cash_collector_obj.pk)
+        collector.set_password("changed-password")
+        collector.save()
+        place_team(self.manager.pk, "default")
+        collector = User.objects.using("default").get(pk=self.cash_collector_obj.pk)
+        self.assertTrue(collector.check_password("changed-password"))
+        self.assertEqual(collector.collected, 1000)
+
+    def test_new_collector_joins_team_shard(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            collector = User.objects.create(
+                username="new_collector", manager=self.manager
+            )
+        self.assertEqual(get_shard(collector.pk), "shard_1")
+        self.assertTrue(User.objects.using("shard_1").filter(pk=collector.pk).exists())
+
+    def test_collector_follows_new_manager(self):
+        other_manager = User.objects.create_superuser(
+            "other_manager", "other@example.com", "12345678"
+        )
+        self.authenticate(self.cash_collector_obj)
+        self.client.put(reverse("collect-tasks"))
+        collector = User.objects.using("default").get(pk=self.cash_collector_obj.pk)
+        collector.manager = other_manager
+        with self.captureOnCommitCallbacks(using="default", execute=True):
+            collector.save()
+        self.assertEqual(get_shard(collector.pk), "default")
+        self.assertEqual(
+            User.objects.using("shard_1").filter(pk=collector.pk).count(), 0
+        )
+        self.assertEqual(Task.objects.using("default").count(), 6)
+        collector.refresh_from_db()
+        self.assertEqual(collector.collected, 1000)
+
+    def test_rebalance_command(self):
+        other_manager = User.objects.create_superuser(
+            "other_manager", "other@example.com", "12345678"
+        )
+        other_collector = User.objects.create(
+            username="other_collector", manager=other_manager
+        )
+        Task.objects.create(
+            assigned_to=other_collector,
+            name="other",
+            amount=10,
+            due_date=datetime.now(),
+        )
+        out = StringIO()
+        call_command("rebalance_shards", stdout=out)
+        shards = {get_shard(self.manager.pk), get_shard(other_manager.pk)}
+        self.assertEqual(len(shards), 2)
+        self.assertEqual(sum(fan_out(lambda shard: Task.objects.count()).values()), 7)
+        out = StringIO()
+        call_command("shard_report", stdout=out)
+        self.assertIn("shard_2", out.getvalue())
+
+
+class ArchiveTasksTest(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        reset_throttles()
+        self.cash_collector_obj = User.objects.create(username="cash_collector")
+        old = datetime.now() - timedelta(days=100)
+        recent = datetime.now() - timedelta(days=1)
+        # (collected_at, remaining_amount)
+        self.tasks = [
+            Task.objects.create(
+                assigned_to=self.cash_collector_obj,
+                name=f"test-{i}",
+                amount=1000,
+                remaining_amount=remaining_amount,
+                due_date=datetime.now(),
+                is_collected=collected_at is not None,
+                collected_at=collected_at,
+            )
+            for i, (collected_at, remaining_amount) in enumerate(
+                [(old, 0), (old, 0), (old, 0), (old, 500), (recent, 0), (None, 1000)]
+            )
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.cash_collector_obj)
+
+    def test_archive_moves_old_settled_tasks(self):
+        out = StringIO()
+        call_command("archive_tasks", "--days=30", "--sleep=0", stdout=out)
+        self.assertIn("default: archived 3 tasks", out.getvalue())
+        self.assertEqual(
+            list(Task.objects.values_list("id", flat=True).order_by("id")),
+            [task.id for task in self.tasks[3:]],
+        )
+        self.assertEqual(
+            sorted(ArchivedTask.objects.values_list("task_id", flat=True)),
+            [task.id for task in self.tasks[:3]],
+        )
+
+    def test_archive_is_resumable(self):
+        call_command(
+            "archive_tasks",
+            "--days=30",
+            "--sleep=0",
+            "--batch-size=2",
+            "--max-batches=1",
+            stdout=StringIO(),
+        )
+        self.assertEqual(ArchivedTask.objects.count(), 2)
+        call_command("archive_tasks", "--days=30", "--sleep=0", stdout=StringIO())
+        self.assertEqual(ArchivedTask.objects.count(), 3)
+
+    def test_done_tasks_read_through_archive(self):
+        call_command("archive_tasks", "--days=30", "--sleep=0", stdout=StringIO())
+        response = self.client.get(reverse("get-tasks"))
+        res_json = response.json()
+        self.assertEqual(res_json["count"], 5)
+        self.assertEqual(
+            [task["id"] for task in res_json["results"]],
+            [task.id for task in self.tasks[:5]],
+        )
+        self.assertEqual(res_json["results"][0]["amount"], 1000)
+
+    def test_team_moved_with_archive(self):
+        manager = User.objects.create_superuser(
+            "manager", "manager@example.com", "12345678"
+        )
+        self.cash_collector_obj.manager = manager
+        self.cash_collector_obj.save()
+        call_command("archive_tasks", "--days=30", "--sleep=0", stdout=StringIO())
+        place_team(manager.pk, "shard_1")
+        self.assertEqual(
+            sorted(Task.objects.using("shard_1").values_list("id", flat=True)),
+            [task.id for task in self.tasks[3:]],
+        )
+        with use_shard("shard_1"):
+            done = list(
+                get_done_tasks(self.cash_collector_obj).values_list("id", flat=True)
+            )
+        self.assertEqual(done, [task.id for task in self.tasks[:5]])
+
+
+class StaticSchemaTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            OPENAPI_SCHEMA_PATH=Path(self.tmp_dir.name) / "openapi.json"
+        )
+        self.settings_override.enable()
+        load_schema.cache_clear()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp_dir.cleanup()
+        load_schema.cache_clear()
+
+    def test_schema_not_built(self):
+        response = self.client.get(reverse("static-schema"))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_build_and_serve_schema(self):
+        call_command("build_schema", stdout=StringIO())
+        response = self.client.get(reverse("static-schema"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        schema = json.loads(response.content)
+        self.assertIn("/api/v1/next-task/", schema["paths"])
+        self.assertEqual(
+            schema["components"]["securitySchemes"]["jwtAuth"]["scheme"], "bearer"
+        )
+        self.assertIn(
+            {"jwtAuth": []}, schema["paths"]["/api/v1/next-task/"]["get"]["security"]
+        )
+
+        response = self.client.get(
+            reverse("static-schema"), HTTP_ACCEPT_ENCODING="gzip, br"
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(response.content)), schema)
+
+        response = self.client.get(
+            reverse("static-schema"), HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class WebhookStub(ThreadingHTTPServer):
+    """
+    Local stand-in for the manager webhook, records bodies and answers `status_code`.
+    """
+
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.received = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                stub.received.append(json.loads(self.rfile.read(length)))
+                self.send_response(stub.status_code)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/hook"
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class OutboxTest(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        reset_throttles()
+        self.manager = User.objects.create_superuser(
+            "manager", "manager@example.com", "12345678"
+        )
+        self.cash_collector_obj = User.objects.create(
+            username="cash_collector", manager=self.manager
+        )
+        for i in range(6):
+            Task.objects.create(
+                assigned_to=self.cash_collector_obj,
+                name=f"test-{i}",
+                amount=1000,
+                remaining_amount=1000,
+                due_date=datetime.now(),
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.cash_collector_obj)
+        self.stub = WebhookStub()
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def dispatch(self, *args):
+        call_command(
+            "dispatch_outbox",
+            "--once",
+            f"--url={self.stub.url}",
+            *args,
+            stdout=StringIO(),
+        )
+
+    def test_limit_reached_schedules_freeze(self):
+        for _ in range(5):
+            self.client.put(reverse("collect-tasks"))
+        events = list(OutboxEvent.objects.order_by("id"))
+        self.assertEqual([event.kind for event in events], ["limit_reached", "frozen"])
+        self.assertEqual(events[0].payload["manager_id"], self.manager.pk)
+        self.assertGreater(events[1].deliver_after, datetime.now() + timedelta(days=1))
+
+        self.dispatch()
+        self.assertEqual(
+            [body["kind"] for body in self.stub.received], ["limit_reached"]
+        )
+        self.assertEqual(self.stub.received[0]["collected"], 5000)
+        self.assertIsNotNone(OutboxEvent.objects.get(pk=events[0].pk).delivered_at)
+
+    def test_payment_cancels_freeze(self):
+        for _ in range(5):
+            self.client.put(reverse("collect-tasks"))
+        self.client.post(reverse("pay-some"), data={"collected": 1000}, format="json")
+        self.assertEqual(
+            list(OutboxEvent.objects.values_list("kind", flat=True).order_by("id")),
+            ["limit_reached", "payment"],
+        )
+        self.client.post(reverse("pay-all"))
+        # one request at a time so the stub receives them in order
+        self.dispatch("--concurrency=1")
+        self.assertEqual(
+            [(body["kind"], body.get("paid")) for body in self.stub.received],
+            [("limit_reached", None), ("payment", 1000), ("payment", 4000)],
+        )
+
+    def test_payment_reschedules_freeze(self):
+        self.cash_collector_obj.threshold = 1000
+        self.cash_collector_obj.save()
+        for _ in range(2):
+            self.client.put(reverse("collect-tasks"))
+        # still over the limit, now counted from the second task
+        self.client.post(reverse("pay-some"), data={"collected": 500}, format="json")
+        user = User.objects.get(pk=self.cash_collector_obj.pk)
+        self.assertEqual(
+            user.reached_limit_date, Task.objects.get(name="test-1").collected_at
+        )
+        frozen = OutboxEvent.objects.get(kind="frozen")
+        self.assertEqual(
+            frozen.deliver_after, user.reached_limit_date + timedelta(days=2)
+        )
+
+    def test_payment_over_the_limit_cancels_stale_freeze(self):
+        for _ in range(6):
+            self.client.put(reverse("collect-tasks"))
+        self.client.post(reverse("pay-some"), data={"collected": 500}, format="json")
+        user = User.objects.get(pk=self.cash_collector_obj.pk)
+        self.assertEqual(user.collected, 5500)
+        self.assertIsNone(user.reached_limit_date)
+        self.assertFalse(OutboxEvent.objects.filter(kind="frozen").exists())
+
+    def test_failed_delivery_is_retried_with_backoff(self):
+        self.stub.status_code = 500
+        self.client.post(reverse("pay-all"))
+        self.dispatch()
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.attempts, 1)
+        self.assertIsNone(event.delivered_at)
+        self.assertIn("500", event.last_error)
+        self.assertGreater(event.deliver_after, datetime.now())
+
+        OutboxEvent.objects.update(deliver_after=datetime.now())
+        self.stub.status_code = 200
+        self.dispatch()
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.attempts, 2)
+        self.assertIsNotNone(event.delivered_at)
+
+    def test_delivery_gives_up_after_max_attempts(self):
+        self.stub.status_code = 500
+        self.client.post(reverse("pay-all"))
+        self.dispatch("--max-attempts=1")
+        self.assertIsNotNone(OutboxEvent.objects.get().failed_at)
+
+    def test_rejected_collect_writes_no_event(self):
+        self.cash_collector_obj.reached_limit_date = datetime.now() - timedelta(days=2)
+        self.client.put(reverse("collect-tasks"))
+        self.assertEqual(OutboxEvent.objects.count(), 0)
+
+
+class OverdueTest(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        reset_throttles()
+        self.manager = User.objects.create_superuser(
+            "manager", "manager@example.com", "12345678"
+        )
+        other_manager = User.objects.create_superuser(
+            "other", "other@example.com", "12345678"
+        )
+        self.first = User.objects.create(username="first", manager=self.manager)
+        self.second = User.objects.create(username="second", manager=self.manager)
+        self.other = User.objects.create(
+            username="other_collector", manager=other_manager
+        )
+        now = datetime.now()
+        self.overdue = [
+            self.create_task(self.first, now - timedelta(days=3)),
+            self.create_task(self.second, now - timedelta(days=2)),
+            self.create_task(self.first, now - timedelta(days=1)),
+        ]
+        self.create_task(self.first, now + timedelta(days=1))
+        self.create_task(self.other, now - timedelta(days=5))
+        Task.objects.filter(pk=self.create_task(self.first, now).pk).update(
+            is_collected=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def create_task(self, user, due_date):
+        return Task.objects.create(
+            assigned_to=user,
+            name="task",
+            amount=100,
+            remaining_amount=100,
+            due_date=due_date,
+        )
+
+    def team_counts(self):
+        response = self.client.get(reverse("team-report"))
+        return {
+            member["id"]: member["overdue_count"]
+            for member in response.json()["results"]
+        }
+
+    def test_overdue_feed(self):
+        response = self.client.get(reverse("overdue-tasks"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [task["id"] for task in response.json()["results"]],
+            [task.id for task in self.overdue],
+        )
+
+    def test_overdue_feed_filters(self):
+        response = self.client.get(
+            reverse("overdue-tasks"), {"collector": self.second.id}
+        )
+        self.assertEqual(
+            [task["id"] for task in response.json()["results"]], [self.overdue[1].id]
+        )
+        response = self.client.get(
+            reverse("overdue-tasks"), {"manager": self.other.manager_id}
+        )
+        self.assertEqual(len(response.json()["results"]), 1)
+
+    def test_overdue_feed_keyset_pages(self):
+        for days in range(10, 22):
+            self.overdue.insert(
+                0, self.create_task(self.second, datetime.now() - timedelta(days=days))
+            )
+        ids, url = [], reverse("overdue-tasks")
+        while url:
+            res_json = self.client.get(url).json()
+            ids += [task["id"] for task in res_json["results"]]
+            url = res_json["next"]
+        self.assertEqual(ids, [task.id for task in self.overdue])
+
+    def test_overdue_feed_is_manager_only(self):
+        self.client.force_authenticate(self.first)
+        response = self.client.get(reverse("overdue-tasks"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_overdue_counts(self):
+        self.assertEqual(self.team_counts(), {self.first.id: 0, self.second.id: 0})
+        call_command("refresh_overdue_counts", stdout=StringIO())
+        self.assertEqual(self.team_counts(), {self.first.id: 2, self.second.id: 1})
+
+        # created already overdue, then collected
+        self.create_task(self.second, datetime.now() - timedelta(days=4))
+        self.assertEqual(self.team_counts()[self.second.id], 2)
+        self.second.refresh_from_db()
+        self.client.force_authenticate(self.second)
+        self.client.put(reverse("collect-tasks"))
+        self.client.force_authenticate(self.manager)
+        self.assertEqual(self.team_counts()[self.second.id], 1)
+
+    def test_overdue_count_kept_by_bulk_create(self):
+        call_command("refresh_overdue_counts", stdout=StringIO())
+        now = datetime.now()
+        Task.objects.bulk_create(
+            Task(
+                assigned_to=self.second,
+                name="task",
+                amount=100,
+                remaining_amount=100,
+                due_date=now + timedelta(days=days),
+            )
+            for days in (-4, -3, 1)
+        )
+        self.assertEqual(self.team_counts(), {self.first.id: 2, self.second.id: 3})
+
+    def test_overdue_count_kept_by_reassign_and_reschedule(self):
+        call_command("refresh_overdue_counts", stdout=StringIO())
+        # e.g. from the admin
+        task = Task.objects.get(pk=self.overdue[0].pk)
+        task.assigned_to = self.second
+        task.save()
+        self.assertEqual(self.team_counts(), {self.first.id: 1, self.second.id: 2})
+        task.due_date = datetime.now() + timedelta(days=1)
+        task.save()
+        self.assertEqual(self.team_counts(), {self.first.id: 1, self.second.id: 1})
+
+    def test_overdue_count_kept_by_collect_and_pay(self):
+        call_command("refresh_overdue_counts", stdout=StringIO())
+        self.second.refresh_from_db()
+        # counted while the collector's request holds the user
+        self.create_task(self.second, datetime.now() - timedelta(days=4))
+        collect_next_task(self.overdue[1], self.second)
+        self.assertEqual(User.objects.get(pk=self.second.pk).overdue_count, 1)
+
+        self.create_task(self.second, datetime.now() - timedelta(days=5))
+        self.client.force_authenticate(self.second)
+        response = self.client.post(
+            reverse("pay-some"), data={"collected": 50}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(User.objects.get(pk=self.second.pk).overdue_count, 2)
+
+
+class PushTest(TestCase):
+    def setUp(self):
+        reset_throttles()
+        self.cash_collector_obj = User.objects.create(username="cash_collector")
+        self.tasks = [
+            Task.objects.create(
+                assigned_to=self.cash_collector_obj,
+                name=f"test-{i}",
+                amount=1000,
+                remaining_amount=1000,
+                due_date=datetime.now(),
+            )
+            for i in range(2)
+        ]
+        self.token = str(RefreshToken.for_user(self.cash_collector_obj).access_token)
+
+    def collect(self):
+        client = APIClient()
+        client.force_authenticate(self.cash_collector_obj)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.put(reverse("collect-tasks"))
+
+    async def read_state(self, events):
+        event = await asyncio.wait_for(anext(events), 5)
+        name, data = event.decode().strip().split("\n")
+        self.assertEqual(name, "event: state")
+        return json.loads(data.removeprefix("data: "))
+
+    async def test_stream_pushes_state_changes(self):
+        response = await self.async_client.get(
+            reverse("state-stream"), {"token": self.token}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = aiter(response.streaming_content)
+        state = await self.read_state(events)
+        self.assertEqual(state["collected"], 0)
+        self.assertFalse(state["is_frozen"])
+        self.assertEqual(state["next_task"]["id"], self.tasks[0].id)
+
+        await sync_to_async(self.collect)()
+        state = await self.read_state(events)
+        self.assertEqual(state["collected"], 1000)
+        self.assertEqual(state["next_task"]["id"], self.tasks[1].id)
+
+    async def test_local_broker_keeps_latest_message(self):
+        broker = LocalBroker()
+        with broker.subscribe("channel") as subscription:
+            self.assertTrue(broker.wants("channel"))
+            # published from another thread, like the sync views do
+            await sync_to_async(broker.publish, thread_sensitive=False)("channel", "1")
+            await sync_to_async(broker.publish, thread_sensitive=False)("channel", "2")
+            self.assertEqual(await asyncio.wait_for(subscription.get(), 5), "2")
+        self.assertFalse(broker.wants("channel"))
+
+    async def test_stream_requires_token(self):
+        response = await self.async_client.get(reverse("state-stream"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = await self.async_client.get(
+            reverse("state-stream"), {"token": "invalid"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_nothing_read_without_streams(self):
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(0):
+            publish_state([self.cash_collector_obj.pk])
+
+    def test_task_write_publishes_collectors(self):
+        other = User.objects.create(username="other")
+        broker = Mock(spec=Broker)
+        with patch("app.push.get_broker", return_value=broker):
+            with self.captureOnCommitCallbacks(execute=True):
+                # e.g. reassigned from the admin
+                task = Task.objects.get(pk=self.tasks[0].pk)
+                task.assigned_to = other
+                task.save()
+        channels = [call.args[0] for call in broker.publish.call_args_list]
+        self.assertCountEqual(
+            channels, [f"user:{self.cash_collector_obj.pk}", f"user:{other.pk}"]
+        )
+
+
+class PayloadTest(TestCase):
+    def setUp(self):
+        reset_throttles()
+        self.cash_collector_obj = User.objects.create(username="cash_collector")
+        for i in range(12):
+            Task.objects.create(
+                assigned_to=self.cash_collector_obj,
+                name=f"test-{i}",
+                description="long description " * 50,
+                amount=1000,
+                remaining_amount=1000,
+                due_date=datetime.now(),
+                is_collected=i < 10,
+                collected_at=datetime.now() if i < 10 else None,
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.cash_collector_obj)
+
+    def test_sparse_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("get-tasks"), {"fields": "id,amount"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.json()["results"][0]), {"id", "amount"})
+        self.assertNotIn("description", queries.captured_queries[-1]["sql"])
+
+        response = self.client.get(reverse("get-next-tasks"), {"fields": "id,due_date"})
+        self.assertEqual(set(response.json()), {"id", "due_date"})
+
+    def test_unknown_sparse_field(self):
+        response = self.client.get(reverse("get-tasks"), {"fields": "id,secret"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("secret", response.json()["fields"])
+
+    def test_gzip(self):
+        response = self.client.get(reverse("get-tasks"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(json.loads(gzip.decompress(response.content))["count"], 10)
+
+    @skipUnless(brotli, "brotli is not installed")
+    def test_brotli_preferred(self):
+        response = self.client.get(
+            reverse("get-tasks"), HTTP_ACCEPT_ENCODING="gzip, br"
+        )
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(json.loads(brotli.decompress(response.content))["count"], 10)
+
+    def test_small_or_refused_responses_not_compressed(self):
+        response = self.client.get(
+            reverse("check-status"), HTTP_ACCEPT_ENCODING="gzip, br"
+        )
+        self.assertFalse(response.has_header("Content-Encoding"))
+        response = self.client.get(
+            reverse("get-tasks"), HTTP_ACCEPT_ENCODING="gzip;q=0, identity"
+        )
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_html_not_compressed(self):
+        # carries the CSRF token
+        response = self.client.get(
+            reverse("admin:login"), HTTP_ACCEPT_ENCODING="gzip, br"
+        )
+        self.assertGreater(len(response.content), settings.COMPRESSION_MIN_SIZE)
+        self.assertContains(response, "csrfmiddlewaretoken")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+
+class HomeScreenTest(TestCase):
+    def setUp(self):
+        reset_throttles()
+        cache.clear()
+        self.manager = User.objects.create_superuser(
+            "manager", "manager@example.com", "12345678"
+        )
+        self.cash_collector_obj = User.objects.create(
+            username="cash_collector", manager=self.manager, collected=2000
+        )
+        self.tasks = [
+            Task.objects.create(
+                assigned_to=self.cash_collector_obj,
+                name=f"test-{i}",
+                amount=1000,
+                remaining_amount=1000,
+                due_date=datetime.now(),
+                is_collected=i < 8,
+                collected_at=datetime.now() if i < 8 else None,
+            )
+            for i in range(10)
+        ]
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.cash_collector_obj).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_home_screen(self):
+        response = self.client.get(reverse("home-screen"), {"recent": 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        res_json = response.json()
+        self.assertFalse(res_json["is_frozen"])
+        self.assertEqual(res_json["collected"], 2000)
+        self.assertEqual(res_json["next_task"]["id"], self.tasks[8].id)
+        self.assertEqual(
+            [task["id"] for task in res_json["recent_tasks"]],
+            [task.id for task in self.tasks[7:4:-1]],
+        )
+        self.assertEqual(response["ETag"], f'"{res_json["version"]}"')
+
+    def test_recent_tasks_latest_collected_first(self):
+        # collected offline and synced out of order
+        for i, task in enumerate(self.tasks[:8]):
+            task.collected_at = datetime.now() - timedelta(hours=i)
+            task.save()
+        response = self.client.get(reverse("home-screen"), {"recent": 3})
+        self.assertEqual(
+            [task["id"] for task in response.json()["recent_tasks"]],
+            [task.id for task in self.tasks[:3]],
+        )
+
+    def test_home_screen_query_budget(self):
+        # warm the shard and next task ordering caches
+        self.client.get(reverse("home-screen"))
+        # user load, next task, latest collected tasks
+        for recent in (1, 5, 50):
+            with self.assertNumQueries(3):
+                self.client.get(reverse("home-screen"), {"recent": recent})
+
+    def test_home_screen_version(self):
+        version = self.client.get(reverse("home-screen")).json()["version"]
+        response = self.client.get(
+            reverse("home-screen"), HTTP_IF_NONE_MATCH=f'"{version}"'
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.put(reverse("collect-tasks"))
+        response = self.client.get(
+            reverse("home-screen"), HTTP_IF_NONE_MATCH=f'"{version}"'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.json()["version"], version)
+
+
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        reset_throttles()
+        self.cash_collector_obj = User.objects.create(username="cash_collector")
+        self.tasks = [
+            Task.objects.create(
+                assigned_to=self.cash_collector_obj,
+                name=f"test-{i}",
+                amount=1000,
+                remaining_amount=1000,
+                due_date=datetime.now(),
+                is_collected=i < 8,
+                collected_at=datetime.now() if i < 8 else None,
+            )
+            for i in range(10)
+        ]
+        token = RefreshToken.for_user(self.cash_collector_obj).access_token
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.factory = AsyncRequestFactory()
+
+    async def compare(self, view, name, params=None):
+        """
+        Call the async view and its sync counterpart, return the async response.
+        """
+        request = self.factory.get(reverse(name), params, headers=self.headers)
+        response = await view.as_view()(request)
+        reset_throttles()
+        sync_response = await sync_to_async(self.client.get)(
+            reverse(name), params, headers=self.headers
+        )
+        self.assertEqual(response.status_code, sync_response.status_code)
+        self.assertEqual(response.content, sync_response.content)
+        return response
+
+    async def test_done_tasks(self):
+        response = await self.compare(
+            AsyncGetDoneTasks, "get-tasks", {"limit": 3, "offset": 2}
+        )
+        self.assertEqual(json.loads(response.content)["count"], 8)
+        await self.compare(AsyncGetDoneTasks, "get-tasks", {"fields": "id,amount"})
+
+    async def test_next_task(self):
+        response = await self.compare(AsyncGetNextTask, "get-next-tasks")
+        self.assertEqual(json.loads(response.content)["id"], self.tasks[8].id)
+        await self.compare(AsyncGetNextTask, "get-next-tasks", {"fields": "id"})
+
+    async def test_status(self):
+        await self.compare(AsyncCheckStatus, "check-status")
+
+    async def test_status_with_manager_policy(self):
+        manager = await User.objects.acreate(username="manager", threshold_days=1)
+        self.cash_collector_obj.manager = manager
+        self.cash_collector_obj.reached_limit_date = datetime.now() - timedelta(
+            hours=36
+        )
+        await self.cash_collector_obj.asave()
+        # the manager's overrides are not cached yet
+        await sync_to_async(invalidate_threshold_policies)()
+        response = await self.compare(AsyncCheckStatus, "check-status")
+        self.assertTrue(json.loads(response.content)["is_frozen"])
+
+    async def test_errors(self):
+        await Task.objects.filter(is_collected=False).aupdate(is_collected=True)
+        response = await self.compare(AsyncGetNextTask, "get-next-tasks")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        await self.compare(AsyncGetDoneTasks, "get-tasks", {"fields": "secret"})
+
+        self.headers = {}
+        response = await self.compare(AsyncCheckStatus, "check-status")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertTrue(response.has_header("WWW-Authenticate"))
+
+
+class ReportTest(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        reset_throttles()
+        self.manager = User.objects.create_superuser(
+            "manager", "manager@example.com", "12345678"
+        )
+        self.first = User.objects.create(username="first", manager=self.manager)
+        self.second = User.objects.create(username="second", manager=self.manager)
+        self.start = date(2024, 1, 30)
+        self.end = date(2024, 2, 2)
+        self.collect(self.first, 3000, datetime(2024, 1, 29, 10))
+        self.collect(self.first, 3000, datetime(2024, 1, 30, 10))
+        self.collect(self.second, 500, datetime(2024, 1, 31, 10))
+        ArchivedTask.objects.create(
+            task_id=1000,
+            assigned_to=self.first,
+            name="archived",
+            amount=1000,
+            due_date=datetime(2024, 2, 1),
+            collected_at=datetime(2024, 2, 1, 10),
+        )
+        Payment.objects.create(
+            user=self.first, amount=2000, created_at=datetime(2024, 2, 2, 10)
+        )
+        self.output = Path(tempfile.mkdtemp())
+
+    def collect(self, user, amount, collected_at):
+        Task.objects.create(
+            assigned_to=user,
+            name="collected",
+            amount=amount,
+            remaining_amount=amount,
+            due_date=collected_at,
+            is_collected=True,
+            collected_at=collected_at,
+        )
+
+    def read(self, name):
+        with open(self.output / name) as f:
+            return {
+                row.get("collector_id", row["manager_id"]): row
+                for row in csv.DictReader(f)
+            }
+
+    def test_daily_report(self):
+        generate_reports(self.start, self.end, self.output, periods=(DAILY,))
+        first = self.read("daily/collectors-2024-01-30.csv")[str(self.first.id)]
+        self.assertEqual(float(first["collected"]), 3000)
+        self.assertEqual(int(first["collected_count"]), 1)
+        self.assertEqual(float(first["outstanding"]), 6000)
+        self.assertEqual(int(first["frozen_days"]), 0)
+        first = self.read("daily/collectors-2024-02-01.csv")[str(self.first.id)]
+        self.assertEqual(float(first["collected"]), 1000)
+        self.assertEqual(int(first["frozen_days"]), 1)
+        managers = self.read("daily/managers-2024-01-31.csv")
+        self.assertEqual(int(managers[str(self.manager.id)]["collectors"]), 2)
+        self.assertEqual(float(managers[str(self.manager.id)]["outstanding"]), 6500)
+
+    def test_monthly_report(self):
+        generate_reports(
+            self.start,
+            self.end,
+            self.output,
+            periods=(MONTHLY,),
+            formats=(CSV, COLUMNAR),
+        )
+        january = self.read("monthly/managers-2024-01.csv")[str(self.manager.id)]
+        self.assertEqual(float(january["collected"]), 3500)
+        self.assertEqual(int(january["collected_count"]), 2)
+        self.assertEqual(float(january["outstanding"]), 6500)
+        first = self.read("monthly/collectors-2024-02.csv")[str(self.first.id)]
+        self.assertEqual(float(first["collected"]), 1000)
+        self.assertEqual(float(first["paid"]), 2000)
+        self.assertEqual(float(first["outstanding"]), 5000)
+        self.assertEqual(int(first["frozen_days"]), 2)
+        columns = np.load(self.output / "monthly/collectors-2024-02.npz")
+        self.assertEqual(
+            sorted(columns["collector_id"]), [self.first.id, self.second.id]
+        )
+
+    def test_incremental_rewrites_changed_days_only(self):
+        generate_reports(self.start, self.end, self.output, periods=(DAILY,))
+        self.assertEqual(
+            generate_reports(
+                self.start, self.end, self.output, periods=(DAILY,), incremental=True
+            ),
+            [],
+        )
+        self.collect(self.second, 100, datetime(2024, 2, 1, 12))
+        written = generate_reports(
+            self.start, self.end, self.output, periods=(DAILY,), incremental=True
+        )
+        self.assertEqual(
+            sorted(path.name for path in written),
+            [
+                "collectors-2024-02-01.csv",
+                "collectors-2024-02-02.csv",
+                "managers-2024-02-01.csv",
+                "managers-2024-02-02.csv",
+            ],
+        )
+        second = self.read("daily/collectors-2024-02-02.csv")[str(self.second.id)]
+        self.assertEqual(float(second["outstanding"]), 600)
+
+    def test_incremental_sliding_window(self):
+        generate_reports(self.start, self.end, self.output)
+        written = generate_reports(
+            self.start + timedelta(days=1),
+            self.end + timedelta(days=1),
+            self.output,
+            incremental=True,
+        )
+        # the new day, its month, and January which now starts a day later
+        self.assertEqual(
+            sorted(path.name for path in written),
+            [
+                "collectors-2024-01.csv",
+                "collectors-2024-02-03.csv",
+                "collectors-2024-02.csv",
+                "managers-2024-01.csv",
+                "managers-2024-02-03.csv",
+                "managers-2024-02.csv",
+            ],
+        )
+        january = self.read("monthly/managers-2024-01.csv")[str(self.manager.id)]
+        self.assertEqual(float(january["collected"]), 500)
+        first = self.read("daily/collectors-2024-02-03.csv")[str(self.first.id)]
+        self.assertEqual(float(first["outstanding"]), 5000)
+
+    def test_payments_backfilled_from_outbox(self):
+        migration = import_module("app.migrations.0013_payment_ledger")
+        Payment.objects.all().delete()
+        event = OutboxEvent.objects.create(
+            kind="payment",
+            user=self.first,
+            payload={"paid": 2000, "collected": 5000},
+            deliver_after=datetime.now(),
+        )
+        OutboxEvent.objects.filter(pk=event.pk).update(
+            created_at=datetime(2024, 2, 2, 10)
+        )
+        migration.backfill_payments(apps, SimpleNamespace(connection=connection))
+        # the ledger no longer needs the event
+        OutboxEvent.objects.all().delete()
+        generate_reports(self.start, self.end, self.output, periods=(DAILY,))
+        first = self.read("daily/collectors-2024-02-02.csv")[str(self.first.id)]
+        self.assertEqual(float(first["paid"]), 2000)
+
+    def test_command(self):
+        out = StringIO()
+        call_command(
+            "collection_report",
+            "--start=2024-01-30",
+            "--end=2024-02-02",
+            f"--output={self.output}",
+            stdout=out,
+        )
+        # 4 days and 2 months, one collectors and one managers file each
+        self.assertIn("wrote 12 files", out.getvalue())
+
+
+class ThresholdPolicyTest(TestCase):
+    def setUp(self):
+        reset_throttles()
+        cache.clear()
+        self.manager = User.objects.create_superuser(
+            "manager", "manager@example.com", "12345678"
+        )
+        self.cash_collector_obj = User.objects.create(
+            username="cash_collector", manager=self.manager
+        )
+        Task.objects.bulk_create(
+            Task(
+                assigned_to=self.cash_collector_obj,
+                name=f"test-{i}",
+                amount=1000,
+                remaining_amount=1000,
+                due_date=datetime.now(),
+            )
+            for i in range(3)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.cash_collector_obj)
+
+    def collect(self):
+        self.client.put(reverse("collect-tasks"))
+        self.cash_collector_obj.refresh_from_db()
+
+    def test_default_policy(self):
+        policy = get_threshold_policy(self.cash_collector_obj)
+        self.assertEqual(policy, (settings.THRESHOLD, settings.THRESHOLD_DAYS))
+        self.assertIsInstance(policy.amount, float)
+
+    @override_settings(THRESHOLD=1000.0, THRESHOLD_DAYS=0)
+    def test_settings_policy(self):
+        self.collect()
+        self.assertIsNotNone(self.cash_collector_obj.reached_limit_date)
+        self.assertTrue(is_frozen(self.cash_collector_obj))
+
+    def test_manager_override(self):
+        self.manager.threshold = 2000
+        self.manager.save()
+        self.collect()
+        self.assertIsNone(self.cash_collector_obj.reached_limit_date)
+        self.collect()
+        self.assertIsNotNone(self.cash_collector_obj.reached_limit_date)
+        self.assertFalse(is_frozen(self.cash_collector_obj))
+
+    def test_collector_override(self):
+        self.manager.threshold = 2000
+        self.manager.threshold_days = 5
+        self.manager.save()
+        self.cash_collector_obj.threshold = 1000
+        self.cash_collector_obj.threshold_days = 0
+        self.cash_collector_obj.save()
+        self.assertEqual(get_threshold_policy(self.cash_collector_obj), (1000, 0))
+        self.collect()
+        self.assertTrue(is_frozen(self.cash_collector_obj))
+
+    def test_fields_fall_back_separately(self):
+        self.manager.threshold_days = 0
+        self.manager.save()
+        self.cash_collector_obj.threshold = 1000
+        self.assertEqual(get_threshold_policy(self.cash_collector_obj), (1000, 0))
+
+    def test_manager_overrides_cached(self):
+        get_threshold_policy(self.cash_collector_obj)
+        with self.assertNumQueries(0):
+            get_threshold_policy(self.cash_collector_obj)
+        self.manager.threshold = 2000
+        self.manager.save()
+        with self.assertNumQueries(1):
+            policy = get_threshold_policy(self.cash_collector_obj)
+        self.assertEqual(policy.amount, 2000)
+
+    def test_manager_overrides_expire(self):
+        get_threshold_policy(self.cash_collector_obj)
+        # changed by another worker, whose version bump this process does not see
+        User.objects.filter(pk=self.manager.pk).update(threshold=2000)
+        self.assertEqual(
+            get_threshold_policy(self.cash_collector_obj).amount, settings.THRESHOLD
+        )
+        with override_settings(POLICY_CACHE_TIMEOUT=0):
+            policy = get_threshold_policy(self.cash_collector_obj)
+        self.assertEqual(policy.amount, 2000)
+
+
+class ProfilingTest(TestCase):
+    def setUp(self):
+        reset_throttles()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        profiling_settings = override_settings(
+            PROFILING=True, PROFILE_DIR=self.directory, PROFILE_SAMPLE_RATE=0
+        )
+        profiling_settings.enable()
+        self.addCleanup(profiling_settings.disable)
+        self.cash_collector_obj = User.objects.create(username="cash_collector")
+        Task.objects.create(
+            assigned_to=self.cash_collector_obj,
+            name="test",
+            amount=1000,
+            remaining_amount=1000,
+            due_date=datetime.now(),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.cash_collector_obj)
+
+    def collect(self, **headers):
+        response = self.client.put(reverse("collect-tasks"), headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def files(self):
+        return sorted(path.name for path in self.directory.iterdir())
+
+    def test_not_profiled(self):
+        response = self.collect()
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertEqual(self.files(), [])
+
+    def test_invalid_token(self):
+        self.collect(X_PROFILE="cash_collector:forged:signature")
+        self.assertEqual(self.files(), [])
+
+    def test_profiled_with_token(self):
+        response = self.collect(X_PROFILE=make_token("cash_collector"))
+        name = response["X-Profile-Id"]
+        self.assertIn("cash_collector", name)
+        self.assertEqual(self.files(), [f"{name}.folded", f"{name}.sql"])
+        queries = (self.directory / f"{name}.sql").read_text()
+        self.assertIn('UPDATE "app_task"', queries)
+        self.assertIn("queries", queries.splitlines()[-1])
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_sampled(self):
+        response = self.client.get(reverse("get-tasks"))
+        self.assertIn("sampled", response["X-Profile-Id"])
+
+    @override_settings(PROFILER="cprofile")
+    def test_deterministic_profiler(self):
+        name = self.collect(X_PROFILE=make_token())["X-Profile-Id"]
+        stats = pstats.Stats(str(self.directory / f"{name}.prof"))
+        self.assertTrue(
+            any(function == "collect_next_task" for _, _, function in stats.stats)
+        )
+
+    @override_settings(PROFILE_MAX_FILES=2, PROFILE_SAMPLE_RATE=1)
+    def test_rotation(self):
+        names = [
+            self.client.get(reverse("get-tasks"))["X-Profile-Id"] for _ in range(3)
+        ]
+        self.assertEqual(
+            self.files(),
+            sorted(
+                f"{name}{suffix}"
+                for name in names[1:]
+                for suffix in (".folded", ".sql")
+            ),
+        )
+
+    @override_settings(PROFILING=False)
+    def test_disabled(self):
+        response = self.collect(X_PROFILE=make_token())
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertEqual(self.files(), [])
+
+
+class SettlementTest(TestCase):
+    def setUp(self):
+        reset_throttles()
+        self.manager = User.objects.create_superuser(
+            "manager", "manager@example.com", "12345678"
+        )
+        self.collectors = [
+            User.objects.create(
+                username=f"collector-{i}",
+                manager=self.manager,
+                collected=3000,
+                reached_limit_date=datetime.now(),
+            )
+            for i in range(2)
+        ]
+        for collector in self.collectors:
+            Task.objects.bulk_create(
+                Task(
+                    assigned_to=collector,
+                    name=f"{collector.username}-{i}",
+                    amount=1000,
+                    remaining_amount=1000,
+                    due_date=datetime.now(),
+                    is_collected=True,
+                )
+                for i in range(3)
+            )
+        self.other = User.objects.create(username="other", collected=1000)
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def settle(self, data):
+        return self.client.post(reverse("settle-team"), data=data, format="json")
+
+    def remaining(self, collector):
+        return list(
+            Task.objects.filter(assigned_to=collector)
+            .order_by("id")
+            .values_list("remaining_amount", flat=True)
+        )
+
+    def test_settle_all(self):
+        response = self.settle({"all": True})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([result["paid"] for result in response.json()], [3000, 3000])
+        for collector in self.collectors:
+            collector.refresh_from_db()
+            self.assertEqual(collector.collected, 0)
+            self.assertIsNone(collector.reached_limit_date)
+            self.assertEqual(self.remaining(collector), [0, 0, 0])
+        self.assertEqual(
+            OutboxEvent.objects.filter(kind="payment").count(), len(self.collectors)
+        )
+        self.assertEqual(Payment.objects.aggregate(total=Sum("amount"))["total"], 6000)
+
+    def test_settle_some(self):
+        first, second = self.collectors
+        response = self.settle(
+            {
+                "payments": [
+                    {"collector": first.pk, "amount": 1500},
+                    {"collector": second.pk, "amount": 3000},
+                ]
+            }
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first.refresh_from_db()
+        self.assertEqual(first.collected, 1500)
+        self.assertIsNone(first.reached_limit_date)
+        self.assertEqual(self.remaining(first), [0, 500, 1000])
+        self.assertEqual(self.remaining(second), [0, 0, 0])
+        self.assertEqual(
+            response.json()[0],
+            {
+                "id": first.pk,
+                "username": first.username,
+                "paid": 1500,
+                "collected": 1500,
+                "reached_limit_date": None,
+            },
+        )
+
+    def test_payment_matches_pay_some(self):
+        # 2 of 5 tasks collected, paying the whole balance leaves the others open
+        collectors = []
+        for name in ("settled", "paid-some"):
+            collector = User.objects.create(
+                username=name, manager=self.manager, collected=2000
+            )
+            Task.objects.bulk_create(
+                Task(
+                    assigned_to=collector,
+                    name=f"{name}-{i}",
+                    amount=1000,
+                    remaining_amount=1000,
+                    due_date=datetime.now(),
+                    is_collected=i < 2,
+                )
+                for i in range(5)
+            )
+            collectors.append(collector)
+        settled, paid_some = collectors
+        self.settle({"payments": [{"collector": settled.pk, "amount": 2000}]})
+        self.client.force_authenticate(paid_some)
+        self.client.post(reverse("pay-some"), data={"collected": 2000}, format="json")
+        self.assertEqual(self.remaining(settled), [0, 0, 1000, 1000, 1000])
+        self.assertEqual(self.remaining(settled), self.remaining(paid_some))
+        settled.refresh_from_db()
+        paid_some.refresh_from_db()
+        self.assertEqual(settled.collected, paid_some.collected)
+
+    @override_settings(THRESHOLD=1000.0)
+    def test_limit_kept_above_threshold(self):
+        self.settle(
+            {"payments": [{"collector": self.collectors[0].pk, "amount": 1000}]}
+        )
+        self.collectors[0].refresh_from_db()
+        self.assertIsNotNone(self.collectors[0].reached_limit_date)
+
+    def test_invalid_payments_pay_nothing(self):
+        response = self.settle(
+            {
+                "payments": [
+                    {"collector": self.collectors[0].pk, "amount": 1000},
+                    {"collector": self.collectors[1].pk, "amount": 5000},
+                    {"collector": self.other.pk, "amount": 100},
+                ]
+            }
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            set(response.json()), {str(self.collectors[1].pk), str(self.other.pk)}
+        )
+        self.assertEqual(
+            set(
+                User.objects.filter(manager=self.manager).values_list(
+                    "collected", flat=True
+                )
+            ),
+            {3000},
+        )
+
+    def test_all_or_payments(self):
+        self.assertEqual(self.settle({}).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.settle(
+            {"all": True, "payments": [{"collector": self.other.pk, "amount": 1}]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_managers_only(self):
+        self.client.force_authenticate(self.collectors[0])
+        response = self.settle({"all": True})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_queries_independent_of_team_size(self):
+        # the manager's threshold overrides are cached on first use
+        get_threshold_policy(self.collectors[0])
+        for extra in (0, 50):
+            collectors = User.objects.bulk_create(
+                User(username=f"extra-{extra}-{i}", manager=self.manager)
+                for i in range(extra)
+            )
+            Task.objects.bulk_create(
+                Task(
+                    assigned_to=collector,
+                    name=f"{collector.username}-{i}",
+                    amount=1000,
+                    due_date=datetime.now(),
+                    is_collected=True,
+                )
+                for collector in collectors
+                for i in range(3)
+            )
+            team = User.objects.filter(manager=self.manager)
+            team.update(collected=3000, reached_limit_date=datetime.now())
+            Task.objects.update(remaining_amount=1000)
+            payments = [
+                {"collector": pk, "amount": 1500}
+                for pk in team.values_list("pk", flat=True)
+            ]
+            # savepoint, lock, open balances, paid and partly paid tasks, users,
+            # freeze cancellations, payments, outbox events, release
+            with self.assertNumQueries(10):
+                response = self.settle({"payments": payments})
+            self.assertEqual(len(response.json()), extra + 2)
+            # no open balances to read, every task is paid
+            with self.assertNumQueries(8):
+                self.settle({"all": True})
+
+    def test_command(self):
+        out = StringIO()
+        call_command("settle_team", "manager", "--pay", "collector-0=1000", stdout=out)
+        self.assertIn("Settled 1 collectors", out.getvalue())
+        self.assertEqual(User.objects.get(username="collector-0").collected, 2000)
+
+    def test_command_errors(self):
+        with self.assertRaisesMessage(CommandError, "Manager nobody does not exist"):
+            call_command("settle_team", "nobody", stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, "Not collectors of manager: other"):
+            call_command("settle_team", "manager", "--pay", "other=100")
+        with self.assertRaisesMessage(CommandError, "Invalid collected amount"):
+            call_command("settle_team", "manager", "--pay", "collector-0=0")
+        self.assertEqual(User.objects.get(username="collector-0").collected, 3000)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_positive_amounts_only(self):
+        for amount in (0, -100):
+            response = self.settle(
+                {"payments": [{"collector": self.collectors[0].pk, "amount": amount}]}
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(OutboxEvent.objects.exists())
@@ -0,0 +1,160 @@
+"""
+Threshold policy
+
+How much cash a collector can hold (`amount`) and how many days after reaching it
+they get frozen (`days`). The deployment default is parsed once from the settings
+(`THRESHOLD`, `THRESHOLD_DAYS`), a manager can override it for their team and a
+collector for themselves, each blank field falls back to the next level up.
+
+A collector's own override comes with the user row every request already loads.
+Manager overrides are kept in a process-local dict tagged with a version read from
+the `POLICY_CACHE` cache, so the collect path stays free of policy queries. Saving a
+manager bumps the version: when that cache is shared every process reloads on its
+next lookup, otherwise only the process that saved does and the others reload once
+their entries are `POLICY_CACHE_TIMEOUT` seconds old.
+"""
+
+import time
+import uuid
+from datetime import timedelta
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from app.models import User
+
+VERSION_KEY = "threshold_policy:version"
+
+# {manager_id: (version, loaded at, (amount, days))}, overrides as stored, None when
+# blank
+_manager_overrides = {}
+
+
+class ThresholdPolicy(NamedTuple):
+    amount: float
+    days: int
+
+    @property
+    def freeze_delay(self) -> timedelta:
+        return timedelta(days=self.days)
+
+
+def get_cache():
+    return caches[settings.POLICY_CACHE]
+
+
+def get_cached_overrides(manager_id: int, version: str):
+    cached = _manager_overrides.get(manager_id)
+    if (
+        cached is not None
+        and cached[0] == version
+        and time.monotonic() - cached[1] < settings.POLICY_CACHE_TIMEOUT
+    ):
+        return cached[2]
+    return None
+
+
+def get_version() -> str:
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # a lost key must not revive entries loaded before it was evicted
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+async def aget_version() -> str:
+    """
+    Async `get_version`.
+    """
+    cache = get_cache()
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, uuid.uuid4().hex, None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def invalidate_threshold_policies() -> None:
+    """
+    Make the processes sharing the `POLICY_CACHE` cache reload the manager overrides on
+    their next lookup.
+    """
+    get_cache().set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def get_manager_overrides(manager_id: int) -> tuple:
+    """
+    Retrieve a manager's (amount, days) overrides, cached per process.
+    """
+    version = get_version()
+    overrides = get_cached_overrides(manager_id, version)
+    if overrides is not None:
+        return overrides
+    overrides = User.objects.filter(pk=manager_id).values_list(
+        "threshold", "threshold_days"
+    ).first() or (None, None)
+    _manager_overrides[manager_id] = (version, time.monotonic(), overrides)
+    return overrides
+
+
+async def aget_manager_overrides(manager_id: int) -> tuple:
+    """
+    Async `get_manager_overrides`.
+    """
+    version = await aget_version()
+    overrides = get_cached_overrides(manager_id, version)
+    if overrides is not None:
+        return overrides
+    overrides = await User.objects.filter(pk=manager_id).values_list(
+        "threshold", "threshold_days"
+    ).afirst() or (None, None)
+    _manager_overrides[manager_id] = (version, time.monotonic(), overrides)
+    return overrides
+
+
+def needs_manager_overrides(user: User) -> bool:
+    return (user.threshold is None or user.threshold_days is None) and bool(
+        user.manager_id
+    )
+
+
+def resolve_threshold_policy(user: User, manager_overrides: tuple) -> ThresholdPolicy:
+    amount, days = user.threshold, user.threshold_days
+    manager_amount, manager_days = manager_overrides
+    amount = manager_amount if amount is None else amount
+    days = manager_days if days is None else days
+    return ThresholdPolicy(
+        settings.THRESHOLD if amount is None else amount,
+        settings.THRESHOLD_DAYS if days is None else days,
+    )
+
+
+def get_threshold_policy(user: User) -> ThresholdPolicy:
+    """
+    Resolve the threshold policy of a user: their overrides, then their manager's,
+    then the deployment default.
+
+    Args:
+        user (User): The collector, loaded with `threshold`, `threshold_days` and
+            `manager_id`.
+
+    Returns:
+        ThresholdPolicy: The typed `amount` and `days`.
+    """
+    overrides = (None, None)
+    if needs_manager_overrides(user):
+        overrides = get_manager_overrides(user.manager_id)
+    return resolve_threshold_policy(user, overrides)
+
+
+async def aget_threshold_policy(user: User) -> ThresholdPolicy:
+    """
+    Async `get_threshold_policy`.
+    """
+    overrides = (None, None)
+    if needs_manager_overrides(user):
+        overrides = await aget_manager_overrides(user.manager_id)
+    return resolve_threshold_policy(user, overrides)
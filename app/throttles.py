@@ -0,0 +1,193 @@
+"""
+Throttles for the collector endpoints
+
+Token buckets keyed by user id, with separate budgets for read and write
+requests so an app polling `/status/` can not starve its own collects.
+"""
+
+import math
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+# process-local buckets {cache_key: (tokens, last_refill, full_at)}, used when no
+# shared cache is configured
+_local_buckets = {}
+# process-local {cache_key: retry_at} so a throttled client is rejected
+# without touching the buckets or the shared cache again
+_blocked_until = {}
+# seconds between sweeps of the idle entries out of the dicts above
+SWEEP_INTERVAL = 60
+_next_sweep = 0.0
+
+
+def reset_throttles() -> None:
+    """
+    Forget every process-local bucket (tests reuse user ids between cases).
+    """
+    global _next_sweep
+    _local_buckets.clear()
+    _blocked_until.clear()
+    _next_sweep = 0.0
+
+
+def sweep_throttles(now: float) -> None:
+    """
+    Drop the buckets that refilled completely and the blocks that expired, a missing
+    entry behaves the same, so the dicts only hold the clients seen recently.
+    """
+    global _next_sweep
+    if now < _next_sweep:
+        return
+    _next_sweep = now + SWEEP_INTERVAL
+    # list() copies without releasing the GIL, other threads may write meanwhile
+    for key, (_, _, full_at) in list(_local_buckets.items()):
+        if full_at <= now:
+            _local_buckets.pop(key, None)
+    for key, retry_at in list(_blocked_until.items()):
+        if retry_at <= now:
+            _blocked_until.pop(key, None)
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Token bucket throttle, `num_requests` tokens refilled evenly over `duration`.
+
+    Bucket state lives in a process-local dict, idle buckets are swept out of it.
+    Plain dict reads and writes are atomic under the GIL so the local path takes
+    no lock, the worst case of a race is one extra request getting through.
+
+    When `settings.THROTTLE_CACHE` names a cache every worker shares the same budget.
+    A bucket read and written back from several workers would let them overspend it,
+    so the shared path counts requests instead (see `allow_shared_request`).
+    """
+
+    safe_methods = True
+
+    def get_rate(self):
+        # read the rates on every instantiation so override_settings is honoured
+        try:
+            return api_settings.DEFAULT_THROTTLE_RATES[self.scope]
+        except KeyError:
+            raise ImproperlyConfigured(
+                "No default throttle rate set for '%s' scope" % self.scope
+            )
+
+    def get_cache_key(self, request, view):
+        if (request.method in SAFE_METHODS) != self.safe_methods:
+            return None
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+    @staticmethod
+    def get_shared_cache():
+        alias = getattr(settings, "THROTTLE_CACHE", None)
+        return caches[alias] if alias else None
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        self.retry_after = None
+        retry_at = _blocked_until.get(self.key)
+        if retry_at is not None:
+            if self.now < retry_at:
+                self.retry_after = retry_at - self.now
+                return False
+            _blocked_until.pop(self.key, None)
+
+        sweep_throttles(self.now)
+        shared_cache = self.get_shared_cache()
+        if shared_cache is not None:
+            allowed = self.allow_shared_request(shared_cache)
+        else:
+            allowed = self.allow_local_request()
+        if not allowed:
+            _blocked_until[self.key] = self.now + self.retry_after
+        return allowed
+
+    def allow_local_request(self) -> bool:
+        tokens, last_refill, _ = _local_buckets.get(
+            self.key, (self.num_requests, self.now, None)
+        )
+        # refill the bucket for the time elapsed since the last request
+        refill_rate = self.num_requests / self.duration
+        tokens = min(self.num_requests, tokens + (self.now - last_refill) * refill_rate)
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        else:
+            # seconds until one full token is back
+            self.retry_after = (1 - tokens) / refill_rate
+        full_at = self.now + (self.num_requests - tokens) / refill_rate
+        _local_buckets[self.key] = (tokens, self.now, full_at)
+        return allowed
+
+    def allow_shared_request(self, shared_cache) -> bool:
+        """
+        Sliding window counter in the shared cache: the requests of the current
+        `duration` window plus the previous window's, weighted by how much of it still
+        overlaps the last `duration` seconds, must stay within `num_requests`.
+
+        Counters are only changed with `add`, `incr` and `decr`, which are atomic in
+        the shared backends, so concurrent workers never overspend the budget. A
+        rejected request hands its count back.
+        """
+        window, elapsed = divmod(self.now, self.duration)
+        current_key = f"{self.key}:{int(window)}"
+        previous = shared_cache.get(f"{self.key}:{int(window) - 1}", 0)
+        shared_cache.add(current_key, 0, 2 * self.duration)
+        try:
+            used = shared_cache.incr(current_key)
+        except ValueError:
+            # evicted between the two calls
+            shared_cache.add(current_key, 1, 2 * self.duration)
+            used = 1
+        overlap = 1 - elapsed / self.duration
+        if previous * overlap + used <= self.num_requests:
+            return True
+        shared_cache.decr(current_key)
+        if used > self.num_requests or not previous:
+            # not before the next window
+            self.retry_after = self.duration - elapsed
+        else:
+            # until enough of the previous window slid out
+            self.retry_after = (
+                self.duration * (1 - (self.num_requests - used) / previous) - elapsed
+            )
+        self.retry_after = max(math.ceil(self.retry_after), 1)
+        return False
+
+    def wait(self):
+        return self.retry_after
+
+
+class ReadRateThrottle(TokenBucketThrottle):
+    """
+    Budget for safe (GET/HEAD/OPTIONS) requests, e.g. `/status/` and `/next-task/`.
+    """
+
+    scope = "read"
+    safe_methods = True
+
+
+class WriteRateThrottle(TokenBucketThrottle):
+    """
+    Budget for unsafe requests, e.g. collects and payments.
+    """
+
+    scope = "write"
+    safe_methods = False
@@ -1,20 +1,42 @@
+from django.conf import settings
 from django.urls import path
+from .push import state_stream
 from .apis import (
     GetDoneTasks,
     GetNextTask,
     CollectTask,
     CustomCollectTask,
+    SyncCollectedTasks,
     CheckStatus,
     PayAllCollected,
     PaySomeOfCollected,
+    AssignTasks,
+    SettleTeam,
+    TeamReport,
+    HomeScreen,
+    OverdueTasks,
 )
 
+if settings.ASYNC_VIEWS:
+    from .async_apis import (
+        AsyncCheckStatus as CheckStatus,
+        AsyncGetDoneTasks as GetDoneTasks,
+        AsyncGetNextTask as GetNextTask,
+    )
+
 urlpatterns = [
     path("tasks/", GetDoneTasks.as_view(), name="get-tasks"),
     path("next-task/", GetNextTask.as_view(), name="get-next-tasks"),
     path("collect/", CollectTask.as_view(), name="collect-tasks"),
     path("custom/collect/", CustomCollectTask.as_view(), name="custom-collect-tasks"),
+    path("sync/collect/", SyncCollectedTasks.as_view(), name="sync-collect-tasks"),
     path("status/", CheckStatus.as_view(), name="check-status"),
+    path("home/", HomeScreen.as_view(), name="home-screen"),
+    path("events/", state_stream, name="state-stream"),
     path("pay/all/", PayAllCollected.as_view(), name="pay-all"),
     path("pay/some/", PaySomeOfCollected.as_view(), name="pay-some"),
+    path("manager/assign/", AssignTasks.as_view(), name="assign-tasks"),
+    path("manager/team/", TeamReport.as_view(), name="team-report"),
+    path("manager/settle/", SettleTeam.as_view(), name="settle-team"),
+    path("manager/overdue/", OverdueTasks.as_view(), name="overdue-tasks"),
 ]
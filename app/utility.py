@@ -3,16 +3,35 @@ Utility file to write methods
 
 Writing any method that can be used twice
 """
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import router, transaction
+from django.db.models import Count, Q, QuerySet, Sum
+from django.db.models.functions import Coalesce
 from datetime import datetime, timedelta
-import os
 
 from rest_framework.exceptions import ValidationError
 
-from app.models import Task
+from app import geo, outbox, overdue
+from app.archive import ARCHIVED_FIELDS
+from app.models import ArchivedTask, Task
+from app.ordering import aget_ordering, get_ordering
+from app.thresholds import aget_threshold_policy, get_threshold_policy
 
 User = get_user_model()
 
+# results of replaying one offline collection
+SYNC_COLLECTED = "collected"
+SYNC_ALREADY_COLLECTED = "already_collected"
+SYNC_NOT_FOUND = "not_found"
+SYNC_FROZEN = "frozen"
+SYNC_STALE = "stale"
+
+# square radii (in grid cells) searched for the nearest task, ~1 km up to ~280 km
+NEAREST_RADII = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+
 
 def is_frozen(user: User, raise_exception=False) -> bool:
     """
@@ -25,10 +44,10 @@ def is_frozen(user: User, raise_exception=False) -> bool:
     Returns:
         bool: True if the user is frozen, False otherwise.
     """
-    thresholds_days = os.environ.get("THRESHOLD_DAYS", 2)
     if (
         user.reached_limit_date
-        and user.reached_limit_date + timedelta(days=thresholds_days) <= datetime.now()
+        and user.reached_limit_date + get_threshold_policy(user).freeze_delay
+        <= datetime.now()
     ):
         if raise_exception:
             raise ValidationError("You are frozen and can not collect any tasks")
@@ -36,6 +55,16 @@ def is_frozen(user: User, raise_exception=False) -> bool:
     return False
 
 
+async def ais_frozen(user: User) -> bool:
+    """
+    Async `is_frozen`, the threshold policy may need the manager's overrides.
+    """
+    if not user.reached_limit_date:
+        return False
+    policy = await aget_threshold_policy(user)
+    return user.reached_limit_date + policy.freeze_delay <= datetime.now()
+
+
 def collect_next_task(obj: Task, user: User, collect_date=None) -> None:
     """
     Collect the next task for a user and update user and task status.
@@ -54,15 +83,20 @@ def collect_next_task(obj: Task, user: User, collect_date=None) -> None:
     # but it should be implemented outside so mocks can work correctly
     collect_date = collect_date if collect_date else datetime.now()
     is_frozen(user, raise_exception=True)
-    obj.is_collected = True
-    obj.collected_at = collect_date
-    obj.save(update_fields=["is_collected", "collected_at"])
-    user.collected += obj.amount
-    if not user.reached_limit_date and user.collected >= os.environ.get(
-        "THRESHOLD", 5000
-    ):
-        user.reached_limit_date = collect_date
-    user.save()
+    with transaction.atomic(using=router.db_for_write(User, instance=user)):
+        obj.is_collected = True
+        obj.collected_at = collect_date
+        obj.save(update_fields=["is_collected", "collected_at"])
+        if overdue.is_counted(obj, user):
+            overdue.uncount_collected_task(user)
+        user.collected += obj.amount
+        if (
+            not user.reached_limit_date
+            and user.collected >= get_threshold_policy(user).amount
+        ):
+            user.reached_limit_date = collect_date
+            outbox.schedule_freeze(user)
+        user.save(update_fields=["collected", "reached_limit_date"])
 
 
 def get_task(user: User, is_collected=False) -> Task:
@@ -79,12 +113,101 @@ def get_task(user: User, is_collected=False) -> Task:
     return Task.objects.filter(assigned_to=user, is_collected=is_collected)
 
 
-def get_next_task(user: User) -> Task:
+def get_done_tasks(user: User, fields=None) -> QuerySet:
+    """
+    Retrieve the tasks collected by a user, live and archived.
+
+    Args:
+        user (User): The user for whom to retrieve tasks.
+        fields (list, optional): Only read these columns (default: all), `id` is
+            always read.
+
+    Returns:
+        QuerySet: Task values, oldest first, read through `Task` and `ArchivedTask`.
+    """
+    # union columns are matched by position, the archive's task_id is read as id
+    fields = [
+        field
+        for field in ARCHIVED_FIELDS
+        if field != "assigned_to_id" and (fields is None or field in fields)
+    ]
+    live = get_task(user, is_collected=True).values("id", *fields)
+    archived = ArchivedTask.objects.filter(assigned_to=user).values("task_id", *fields)
+    return live.union(archived, all=True).order_by("id")
+
+
+def get_home_screen(user: User, recent: int) -> dict:
+    """
+    Retrieve what the app's home screen shows in one go.
+
+    Two queries whatever `recent` is: the next task and the latest collected tasks.
+
+    Args:
+        user (User): The user opening the app.
+        recent (int): Number of latest collected tasks to return.
+
+    Returns:
+        dict: `is_frozen`, `collected`, `next_task` (None when nothing is assigned)
+            and `recent_tasks`, latest first.
+    """
+    return {
+        "is_frozen": is_frozen(user),
+        "collected": user.collected,
+        "next_task": get_task(user).order_by(*get_ordering(user)).first(),
+        "recent_tasks": list(
+            get_done_tasks(user).order_by("-collected_at", "-id")[:recent]
+        ),
+    }
+
+
+def get_nearest_task(user: User, latitude: float, longitude: float):
+    """
+    Retrieve the uncollected task closest to a position, using the task grid cells.
+
+    Squares of cells around the position are searched with growing radius, each one a
+    handful of index range scans, until the nearest task found is provably closer
+    than anything outside the square.
+
+    Args:
+        user (User): The user for whom to retrieve the task.
+        latitude (float): The user's current latitude.
+        longitude (float): The user's current longitude.
+
+    Returns:
+        Task: The nearest task, or None if no located task is within the largest of
+            `NEAREST_RADII`.
+    """
+    nearest, nearest_key = None, None
+    for radius in NEAREST_RADII:
+        cells = Q()
+        for first, last in geo.square_ranges(latitude, longitude, radius):
+            cells |= Q(grid_cell__range=(first, last))
+        for task in get_task(user).filter(cells):
+            # ties go to the lowest id, same as the default ordering
+            key = (
+                geo.distance(latitude, longitude, task.latitude, task.longitude),
+                task.id,
+            )
+            if nearest is None or key < nearest_key:
+                nearest, nearest_key = task, key
+        if nearest is not None and nearest_key[0] <= geo.square_min_distance(
+            latitude, radius
+        ):
+            break
+    return nearest
+
+
+def get_next_task(user: User, location: dict = None, fields=None) -> Task:
     """
     Retrieve the next task assigned to a user.
 
     Args:
         user (User): The user for whom to retrieve the next task.
+        location (dict, optional): `latitude` and `longitude` of the user, when given
+            the nearest located task is returned (default: None, the first task in the
+            user's next task ordering, see `app.ordering`).
+        fields (list, optional): Only load these fields of the task picked by
+            ordering (default: all).
 
     Returns:
         Task: The next task assigned to the user.
@@ -92,7 +215,151 @@ def get_next_task(user: User) -> Task:
     Raises:
         ValidationError: If no tasks are assigned to the user.
     """
-    next_task = get_task(user).order_by("id")[:1]
+    if location:
+        nearest_task = get_nearest_task(
+            user, location["latitude"], location["longitude"]
+        )
+        if nearest_task:
+            return nearest_task
+    next_task = get_task(user).order_by(*get_ordering(user))
+    if fields is not None:
+        next_task = next_task.only(*fields)
+    next_task = next_task[:1]
     if next_task.exists():
         return next_task[0]
     raise ValidationError("No assigned tasks")
+
+
+async def aget_next_task(user: User, location: dict = None, fields=None) -> Task:
+    """
+    Async `get_next_task`, one query when no location is sent.
+
+    `get_task` does no I/O, async code calls it as it is and awaits the queryset.
+
+    Raises:
+        ValidationError: If no tasks are assigned to the user.
+    """
+    if location:
+        nearest_task = await sync_to_async(get_nearest_task)(
+            user, location["latitude"], location["longitude"]
+        )
+        if nearest_task:
+            return nearest_task
+    next_task = get_task(user).order_by(*await aget_ordering(user))
+    if fields is not None:
+        next_task = next_task.only(*fields)
+    next_task = await next_task.afirst()
+    if next_task is None:
+        raise ValidationError("No assigned tasks")
+    return next_task
+
+
+def sync_collected_tasks(user: User, events: list) -> list:
+    """
+    Replay tasks collected offline, in chronological order and in one transaction.
+
+    Every event goes through the same threshold/freeze rules as `collect_next_task`,
+    except the freeze is checked against the event's own collect date, so a collector
+    who got frozen half way through the offline session only loses the later events.
+
+    As the collect dates come from the device they are bounded: dates in the future
+    are taken as now, dates older than `SYNC_MAX_AGE_HOURS` or than the latest event
+    of a previous sync (`synced_until`) are refused, so back dating can not slip
+    collects in before a freeze.
+
+    Args:
+        user (User): The user who collected the tasks.
+        events (list): Dicts with `task` (task id) and `collect_date` (datetime).
+
+    Returns:
+        list: One `{"task": id, "result": ...}` dict per event, in chronological order,
+            where result is one of `SYNC_COLLECTED`, `SYNC_ALREADY_COLLECTED`,
+            `SYNC_NOT_FOUND`, `SYNC_FROZEN` or `SYNC_STALE`.
+    """
+    now = datetime.now()
+    events = sorted(
+        (
+            {**event, "collect_date": min(event["collect_date"], now)}
+            for event in events
+        ),
+        key=lambda event: event["collect_date"],
+    )
+    policy = get_threshold_policy(user)
+    results = []
+    with transaction.atomic(using=router.db_for_write(User, instance=user)):
+        # lock the user row so an online collect or payment can not interleave
+        locked_user = (
+            User.objects.select_for_update()
+            .only(
+                "collected",
+                "reached_limit_date",
+                "overdue_count",
+                "overdue_as_of",
+                "synced_until",
+            )
+            .get(pk=user.pk)
+        )
+        user.collected = locked_user.collected
+        user.reached_limit_date = locked_user.reached_limit_date
+        user.overdue_count = locked_user.overdue_count
+        user.overdue_as_of = locked_user.overdue_as_of
+        user.synced_until = locked_user.synced_until
+        oldest = now - timedelta(hours=settings.SYNC_MAX_AGE_HOURS)
+        if user.synced_until and user.synced_until > oldest:
+            oldest = user.synced_until
+        tasks = (
+            Task.objects.select_for_update()
+            .filter(assigned_to=user, pk__in={event["task"] for event in events})
+            .only("id", "amount", "due_date", "is_collected", "collected_at")
+            .in_bulk()
+        )
+        collected_tasks = []
+        for event in events:
+            task = tasks.get(event["task"])
+            collect_date = event["collect_date"]
+            if task is None:
+                result = SYNC_NOT_FOUND
+            elif collect_date < oldest:
+                result = SYNC_STALE
+            elif task.is_collected:
+                result = SYNC_ALREADY_COLLECTED
+            elif (
+                user.reached_limit_date
+                and user.reached_limit_date + policy.freeze_delay <= collect_date
+            ):
+                result = SYNC_FROZEN
+            else:
+                task.is_collected = True
+                task.collected_at = collect_date
+                collected_tasks.append(task)
+                if overdue.is_counted(task, user):
+                    user.overdue_count -= 1
+                user.collected += task.amount
+                if not user.reached_limit_date and user.collected >= policy.amount:
+                    user.reached_limit_date = collect_date
+                    outbox.schedule_freeze(user)
+                user.synced_until = collect_date
+                result = SYNC_COLLECTED
+            results.append({"task": event["task"], "result": result})
+        if collected_tasks:
+            Task.objects.bulk_update(collected_tasks, ["is_collected", "collected_at"])
+            user.save(
+                update_fields=[
+                    "collected",
+                    "reached_limit_date",
+                    "overdue_count",
+                    "synced_until",
+                ]
+            )
+    return results
+
+
+def with_open_tasks(users: QuerySet) -> QuerySet:
+    """
+    Annotate users with the `open_amount` and `open_count` of their uncollected tasks.
+    """
+    open_tasks = Q(tasks__is_collected=False)
+    return users.annotate(
+        open_amount=Coalesce(Sum("tasks__amount", filter=open_tasks), 0.0),
+        open_count=Count("tasks", filter=open_tasks),
+    )
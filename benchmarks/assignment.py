@@ -0,0 +1,60 @@
+"""
+Assignment engine throughput
+
+Assigns a pool of 100k tasks across 1k collectors of one manager.
+"""
+
+import random
+import sys
+from datetime import datetime
+
+from benchmarks.common import setup, test_database, timed
+
+setup()
+
+from app.assignment import assign_tasks  # noqa: E402
+from app.models import Task, User  # noqa: E402
+
+COLLECTORS = 1_000
+TASKS = 100_000
+
+
+def populate(collectors, tasks):
+    manager = User.objects.create_superuser("manager", "manager@example.com", "x")
+    User.objects.bulk_create(
+        User(username=f"collector-{i}", manager=manager) for i in range(collectors)
+    )
+    now = datetime.now()
+    Task.objects.bulk_create(
+        (
+            Task(name=f"task-{i}", amount=random.randint(10, 1000), due_date=now)
+            for i in range(tasks)
+        ),
+        batch_size=5000,
+    )
+    return manager
+
+
+def main():
+    collectors = int(sys.argv[1]) if len(sys.argv) > 1 else COLLECTORS
+    tasks = int(sys.argv[2]) if len(sys.argv) > 2 else TASKS
+    random.seed(0)
+    with test_database():
+        manager = populate(collectors, tasks)
+        timed(
+            f"assign {tasks} tasks across {collectors} collectors",
+            lambda: assign_tasks(manager),
+        )
+        per_collector = {}
+        for collector_id, amount in Task.objects.values_list(
+            "assigned_to_id", "amount"
+        ):
+            per_collector[collector_id] = per_collector.get(collector_id, 0) + amount
+        print(
+            f"load spread: min {min(per_collector.values()):.0f}, "
+            f"max {max(per_collector.values()):.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
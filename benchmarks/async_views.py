@@ -0,0 +1,114 @@
+"""
+Async (ASGI) against sync (WSGI) read endpoints under concurrent clients
+
+Each run is a fresh interpreter: the WSGI one serves `/next-task/` with the DRF views
+from a thread per concurrent client, the ASGI one with the async views
+(ASYNC_VIEWS=1) from coroutines on one event loop. Reports requests per second and
+the peak resident memory added per concurrent client.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+CONCURRENCY = (10, 100, 500)
+REQUESTS = 4000
+
+CHILD = """
+import asyncio, json, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from benchmarks.common import setup, test_database
+setup()
+
+from django.test import AsyncClient, Client
+from rest_framework_simplejwt.tokens import RefreshToken
+from app.models import Task, User
+
+mode, concurrency, requests = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+per_client = requests // concurrency
+
+
+def rss_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1])
+
+
+with test_database():
+    collector = User.objects.create(username="collector")
+    Task.objects.bulk_create(
+        Task(assigned_to=collector, name=f"task-{i}", amount=i, due_date=datetime.now())
+        for i in range(1000)
+    )
+    headers = {"Authorization": f"Bearer {RefreshToken.for_user(collector).access_token}"}
+    Client().get("/api/v1/next-task/", headers=headers)
+    before = rss_kb("VmRSS")
+    start = time.perf_counter()
+    if mode == "asgi":
+        async def client():
+            session = AsyncClient()
+            for _ in range(per_client):
+                response = await session.get("/api/v1/next-task/", headers=headers)
+                assert response.status_code == 200, response.status_code
+
+        async def main():
+            await asyncio.gather(*(client() for _ in range(concurrency)))
+
+        asyncio.run(main())
+    else:
+        def client():
+            session = Client()
+            for _ in range(per_client):
+                response = session.get("/api/v1/next-task/", headers=headers)
+                assert response.status_code == 200, response.status_code
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            for future in [executor.submit(client) for _ in range(concurrency)]:
+                future.result()
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "rps": per_client * concurrency / elapsed,
+        "kb_per_client": (rss_kb("VmHWM") - before) / concurrency,
+    }))
+"""
+
+
+def run(mode: str, concurrency: int) -> dict:
+    env = {
+        **os.environ,
+        "DJANGO_SETTINGS_MODULE": "cash_collector.settings",
+        "THROTTLE_READ_RATE": "1000000/s",
+        "SHARD_COUNT": "0",
+    }
+    if mode == "asgi":
+        env["ASYNC_VIEWS"] = "1"
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, mode, str(concurrency), str(REQUESTS)],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    for concurrency in CONCURRENCY:
+        print(f"{concurrency} concurrent clients, {REQUESTS} requests")
+        for mode in ("wsgi", "asgi"):
+            result = run(mode, concurrency)
+            print(
+                f"  {mode}: {result['rps']:8.0f} req/s"
+                f" {result['kb_per_client']:8.1f} KB peak RSS per client"
+            )
+
+
+if __name__ == "__main__":
+    main()
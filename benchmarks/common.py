@@ -0,0 +1,68 @@
+"""
+Shared helpers for the benchmark scripts
+
+Run a benchmark from the project root, e.g. `python -m benchmarks.throttle`.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+import django
+
+
+def setup() -> None:
+    """
+    Configure Django so the benchmark can import models and views.
+    """
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cash_collector.settings")
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """
+    Run the block against a fresh, migrated test database that is dropped afterwards.
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+@contextmanager
+def no_queries():
+    """
+    Fail loudly if the block touches the database.
+    """
+    from django.db import connection
+
+    def blocker(*args):
+        raise AssertionError("benchmarked code issued a database query")
+
+    with connection.execute_wrapper(blocker):
+        yield
+
+
+def timed(label: str, func, number: int = 1) -> float:
+    """
+    Call `func` `number` times and print the mean duration per call.
+
+    Returns:
+        float: Mean seconds per call.
+    """
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    per_call = (time.perf_counter() - start) / number
+    if per_call < 1e-3:
+        print(f"{label:<50} {per_call * 1e6:10.2f} us/call")
+    else:
+        print(f"{label:<50} {per_call * 1e3:10.2f} ms/call")
+    return per_call
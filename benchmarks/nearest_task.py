@@ -0,0 +1,90 @@
+"""
+Nearest next task lookup
+
+Collectors holding thousands of open tasks spread over a city, the grid lookup is
+compared with scanning every open task of the collector.
+"""
+
+import random
+from datetime import datetime
+
+from benchmarks.common import setup, test_database, timed
+
+setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+
+from app import geo  # noqa: E402
+from app.models import Task, User  # noqa: E402
+from app.utility import get_nearest_task, get_task  # noqa: E402
+
+COLLECTORS = 20
+TASKS_PER_COLLECTOR = 5_000
+# ~30 km box around Riyadh
+LATITUDE, LONGITUDE, SPREAD = 24.7136, 46.6753, 0.15
+
+
+def random_point():
+    return (
+        LATITUDE + random.uniform(-SPREAD, SPREAD),
+        LONGITUDE + random.uniform(-SPREAD, SPREAD),
+    )
+
+
+def populate():
+    collectors = User.objects.bulk_create(
+        User(username=f"collector-{i}") for i in range(COLLECTORS)
+    )
+    now = datetime.now()
+    tasks = []
+    for collector in collectors:
+        for i in range(TASKS_PER_COLLECTOR):
+            latitude, longitude = random_point()
+            tasks.append(
+                Task(
+                    assigned_to=collector,
+                    name=f"task-{i}",
+                    amount=100,
+                    due_date=now,
+                    latitude=latitude,
+                    longitude=longitude,
+                    grid_cell=geo.grid_cell(latitude, longitude),
+                )
+            )
+    Task.objects.bulk_create(tasks, batch_size=5000)
+    return collectors
+
+
+def full_scan(user, latitude, longitude):
+    return min(
+        get_task(user),
+        key=lambda task: (
+            geo.distance(latitude, longitude, task.latitude, task.longitude),
+            task.id,
+        ),
+    )
+
+
+def main():
+    random.seed(0)
+    with test_database():
+        collectors = populate()
+        points = [(random.choice(collectors), *random_point()) for _ in range(200)]
+        for user, latitude, longitude in points:
+            assert get_nearest_task(user, latitude, longitude) == full_scan(
+                user, latitude, longitude
+            )
+        print(f"{COLLECTORS} collectors x {TASKS_PER_COLLECTOR} open tasks")
+        for label, lookup in (
+            ("grid index lookup", get_nearest_task),
+            ("full scan of open tasks", full_scan),
+        ):
+            iterator = iter(points * 10)
+            with CaptureQueriesContext(connection) as queries:
+                timed(label, lambda: lookup(*next(iterator)), 50)
+            print(f"{'':<50} {len(queries) / 50:10.2f} queries/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Next task lookup per ordering policy
+
+The lookup should cost the same whatever the size of the collector's backlog, as
+every policy is served by an index seek instead of a sort.
+"""
+
+import random
+from datetime import datetime, timedelta
+
+from benchmarks.common import setup, test_database, timed
+
+setup()
+
+from django.db import connection  # noqa: E402
+from django.test import override_settings  # noqa: E402
+
+from app.models import NextTaskOrdering, Task, User  # noqa: E402
+from app.utility import get_next_task, get_task  # noqa: E402
+from app.ordering import get_ordering  # noqa: E402
+
+BACKLOGS = (1_000, 10_000, 100_000)
+
+
+def populate(size):
+    collector = User.objects.create(username=f"collector-{size}")
+    now = datetime.now()
+    Task.objects.bulk_create(
+        (
+            Task(
+                assigned_to=collector,
+                name=f"task-{i}",
+                amount=random.randint(10, 1000),
+                due_date=now + timedelta(minutes=random.randint(-10_000, 10_000)),
+                priority=random.randint(0, 10),
+                is_collected=i % 4 == 0,
+            )
+            for i in range(size)
+        ),
+        batch_size=5000,
+    )
+    return collector
+
+
+def query_plan(collector):
+    sql, params = (
+        get_task(collector)
+        .order_by(*get_ordering(collector))[:1]
+        .query.sql_with_params()
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return " / ".join(row[-1] for row in cursor.fetchall())
+
+
+def main():
+    random.seed(0)
+    with test_database():
+        collectors = [populate(size) for size in BACKLOGS]
+        for ordering in NextTaskOrdering.values:
+            with override_settings(NEXT_TASK_ORDERING=ordering):
+                print(f"{ordering}: {query_plan(collectors[0])}")
+                for size, collector in zip(BACKLOGS, collectors):
+                    timed(
+                        f"  backlog of {size} tasks",
+                        lambda: get_next_task(collector),
+                        2000,
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Task list page payload size and serialization time
+
+Compares full pages with a sparse fieldset (`?fields=`), and the bytes on the wire
+once gzipped or brotli compressed by `CompressionMiddleware`.
+"""
+
+import gzip
+import random
+from datetime import datetime, timedelta
+
+from benchmarks.common import setup, test_database, timed
+
+setup()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from app.middleware import BROTLI_QUALITY, GZIP_LEVEL, brotli  # noqa: E402
+from app.models import Task, User  # noqa: E402
+from app.serializers import ReadTaskSerializer  # noqa: E402
+from app.utility import get_done_tasks  # noqa: E402
+
+TASKS = 10_000
+PAGE_SIZES = (10, 100)
+FIELDSETS = {
+    "all fields": None,
+    "id,amount,due_date,collected_at": ["id", "amount", "due_date", "collected_at"],
+}
+WORDS = "cash collection customer invoice overdue balance street building floor".split()
+
+
+def populate():
+    collector = User.objects.create(username="collector")
+    now = datetime.now()
+    Task.objects.bulk_create(
+        (
+            Task(
+                assigned_to=collector,
+                name=f"task-{i}",
+                description=" ".join(random.choices(WORDS, k=random.randint(20, 120))),
+                amount=random.randint(10, 1000),
+                remaining_amount=0,
+                due_date=now - timedelta(days=random.randint(0, 90)),
+                is_collected=True,
+                collected_at=now - timedelta(minutes=random.randint(0, 100_000)),
+                latitude=random.uniform(29.9, 30.1),
+                longitude=random.uniform(31.1, 31.3),
+            )
+            for i in range(TASKS)
+        ),
+        batch_size=5000,
+    )
+    return collector
+
+
+def render_page(collector, size, fields):
+    page = get_done_tasks(collector, fields)[:size]
+    data = ReadTaskSerializer(page, many=True, fields=fields).data
+    return JSONRenderer().render({"count": TASKS, "results": data})
+
+
+def main():
+    random.seed(0)
+    with test_database():
+        collector = populate()
+        for size in PAGE_SIZES:
+            print(f"page of {size} tasks")
+            for label, fields in FIELDSETS.items():
+                body = render_page(collector, size, fields)
+                sizes = f"{len(body)} B, gzip {len(gzip.compress(body, GZIP_LEVEL))} B"
+                if brotli is not None:
+                    sizes += (
+                        f", br {len(brotli.compress(body, quality=BROTLI_QUALITY))} B"
+                    )
+                print(f"  {label}: {sizes}")
+                timed(
+                    "    query + serialize + render",
+                    lambda: render_page(collector, size, fields),
+                    200,
+                )
+                timed(
+                    "    gzip",
+                    lambda: gzip.compress(body, GZIP_LEVEL),
+                    200,
+                )
+                if brotli is not None:
+                    timed(
+                        "    brotli",
+                        lambda: brotli.compress(body, quality=BROTLI_QUALITY),
+                        200,
+                    )
+
+
+if __name__ == "__main__":
+    main()
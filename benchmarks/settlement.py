@@ -0,0 +1,85 @@
+"""
+Bulk settlement against paying collectors one by one
+
+Settles a team of 500 collectors holding 10 partly paid tasks each, once with
+`settle` and once through `PaySomeOfCollected` per collector.
+"""
+
+import sys
+from datetime import datetime
+
+from benchmarks.common import setup, test_database, timed
+
+setup()
+
+from rest_framework.test import APIRequestFactory, force_authenticate  # noqa: E402
+
+from app.apis import PaySomeOfCollected  # noqa: E402
+from app.models import OutboxEvent, Task, User  # noqa: E402
+from app.settlement import settle  # noqa: E402
+
+COLLECTORS = 500
+TASKS = 10
+
+
+def populate(manager, collectors, tasks):
+    User.objects.bulk_create(
+        User(username=f"collector-{i}", manager=manager, collected=tasks * 100)
+        for i in range(collectors)
+    )
+    now = datetime.now()
+    Task.objects.bulk_create(
+        (
+            Task(
+                assigned_to=collector,
+                name=f"task-{i}",
+                amount=100,
+                remaining_amount=100,
+                due_date=now,
+                is_collected=True,
+            )
+            for collector in User.objects.filter(manager=manager)
+            for i in range(tasks)
+        ),
+        batch_size=5000,
+    )
+    return list(User.objects.filter(manager=manager).order_by("id"))
+
+
+def reset(manager, tasks):
+    User.objects.filter(manager=manager).update(collected=tasks * 100)
+    Task.objects.update(remaining_amount=100)
+    OutboxEvent.objects.all().delete()
+    return list(User.objects.filter(manager=manager).order_by("id"))
+
+
+def pay_one_by_one(collectors, amount):
+    view = PaySomeOfCollected.as_view()
+    factory = APIRequestFactory()
+    for collector in collectors:
+        request = factory.post("/", {"collected": amount}, format="json")
+        force_authenticate(request, collector)
+        view(request)
+
+
+def main():
+    collectors = int(sys.argv[1]) if len(sys.argv) > 1 else COLLECTORS
+    amount = TASKS * 100 / 2 + 50
+    with test_database():
+        manager = User.objects.create_superuser("manager", "manager@example.com", "x")
+        team = populate(manager, collectors, TASKS)
+        timed(
+            f"PaySomeOfCollected x {collectors} collectors",
+            lambda: pay_one_by_one(team, amount),
+        )
+        team = reset(manager, TASKS)
+        timed(
+            f"settle {collectors} collectors",
+            lambda: settle(manager, {collector.pk: amount for collector in team}),
+        )
+        reset(manager, TASKS)
+        timed(f"settle all of {collectors} collectors", lambda: settle(manager))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Cold worker startup and first request latency
+
+Each run is a fresh interpreter, comparing the default (dev) settings with
+DJANGO_PRODUCTION=1 which serves the prebuilt schema and drops the dev-only apps.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RUNS = 5
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+imported = time.perf_counter()
+from django.test import Client
+client = Client(SERVER_NAME="localhost")
+response = client.get("/api/schema/", HTTP_ACCEPT_ENCODING="gzip")
+assert response.status_code == 200, response.status_code
+schema = time.perf_counter()
+schema_bytes = len(response.content)
+response = client.get("/api/v1/status/")
+assert response.status_code == 401, response.status_code
+status = time.perf_counter()
+import sys
+print(json.dumps({
+    "import": imported - start,
+    "schema": schema - imported,
+    "status": status - schema,
+    "bytes": schema_bytes,
+    "modules": len(sys.modules),
+}))
+"""
+
+
+def run(production: bool) -> dict:
+    env = {
+        **os.environ,
+        "DJANGO_SETTINGS_MODULE": "cash_collector.settings",
+        "ALLOWED_HOSTS": "localhost",
+    }
+    if production:
+        env["DJANGO_PRODUCTION"] = "1"
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output)
+
+
+def main():
+    subprocess.run(
+        [sys.executable, "manage.py", "build_schema"],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+    )
+    for label, production in (("dev settings", False), ("production", True)):
+        runs = [run(production) for _ in range(RUNS)]
+        median = {key: statistics.median(r[key] for r in runs) for key in runs[0]}
+        print(f"{label} (median of {RUNS} cold workers)")
+        print(f"  import + url conf            {median['import'] * 1e3:8.1f} ms")
+        print(f"  first /api/schema/           {median['schema'] * 1e3:8.1f} ms")
+        print(f"  first /api/v1/status/        {median['status'] * 1e3:8.1f} ms")
+        print(f"  schema response              {median['bytes']:8.0f} bytes")
+        print(f"  modules loaded               {median['modules']:8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Cost of the throttle check per request
+
+Shows the token bucket adds microseconds and never a database query.
+"""
+
+from benchmarks.common import setup, no_queries, timed
+
+setup()
+
+from django.conf import settings  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from rest_framework.request import Request  # noqa: E402
+from rest_framework.test import APIRequestFactory, force_authenticate  # noqa: E402
+
+from app.models import User  # noqa: E402
+from app.throttles import (
+    ReadRateThrottle,
+    WriteRateThrottle,
+    reset_throttles,
+)  # noqa: E402
+
+NUMBER = 100_000
+
+
+def make_request(method, user):
+    factory = APIRequestFactory()
+    request = getattr(factory, method)("/api/v1/status/")
+    force_authenticate(request, user=user)
+    request = Request(request)
+    request.user = user
+    return request
+
+
+def check(throttle_class, request):
+    def run():
+        throttle_class().allow_request(request, None)
+
+    return run
+
+
+def main():
+    rest_framework = {
+        **settings.REST_FRAMEWORK,
+        "DEFAULT_THROTTLE_RATES": {"read": "1000000/s", "write": "1000000/s"},
+    }
+    user = User(pk=1, username="bench")
+    with override_settings(REST_FRAMEWORK=rest_framework), no_queries():
+        reset_throttles()
+        timed(
+            "read throttle, local bucket",
+            check(ReadRateThrottle, make_request("get", user)),
+            NUMBER,
+        )
+        timed(
+            "write throttle, local bucket",
+            check(WriteRateThrottle, make_request("put", user)),
+            NUMBER,
+        )
+        timed(
+            "write throttle on a read (skipped)",
+            check(WriteRateThrottle, make_request("get", user)),
+            NUMBER,
+        )
+        with override_settings(THROTTLE_CACHE="default"):
+            reset_throttles()
+            timed(
+                "read throttle, shared locmem cache",
+                check(ReadRateThrottle, make_request("get", user)),
+                NUMBER,
+            )
+
+    rest_framework["DEFAULT_THROTTLE_RATES"] = {"read": "1/day", "write": "1/day"}
+    with override_settings(REST_FRAMEWORK=rest_framework), no_queries():
+        reset_throttles()
+        request = make_request("get", user)
+        ReadRateThrottle().allow_request(request, None)
+        timed(
+            "read throttle, already throttled fast path",
+            check(ReadRateThrottle, request),
+            NUMBER,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from datetime import timedelta
 from pathlib import Path
 
@@ -48,12 +49,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "app.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "app.middleware.ShardMiddleware",
+    # calls the view itself, keep it last
+    "app.middleware.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "cash_collector.urls"
@@ -87,6 +92,22 @@ DATABASES = {
     }
 }
 
+# Sharding, manager teams are placed on "default" or one of SHARD_COUNT extra
+# databases (see app/sharding.py), cash_collector/test_settings.py adds two for the tests
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT", 0))
+for shard in range(1, SHARD_COUNT + 1):
+    DATABASES[f"shard_{shard}"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / f"db_shard_{shard}.sqlite3",
+    }
+SHARDS = list(DATABASES)
+DATABASE_ROUTERS = ["app.sharding.ShardRouter"]
+# cache alias holding the map of users to shards, with shards it must be shared by all
+# workers (e.g. redis) as a rebalance only clears the moved users' entries there
+# (checked by `manage.py check`)
+SHARD_CACHE = os.environ.get("SHARD_CACHE", "default")
+SHARD_CACHE_TIMEOUT = int(os.environ.get("SHARD_CACHE_TIMEOUT", 300))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -135,19 +156,77 @@ AUTH_USER_MODEL = "app.User"
 # Default pagination size will be 10
 # auth will be using JWT
 # set swagger schema settings
+# throttle per user with separate read/write token buckets
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
-    "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
-    ),
+    "DEFAULT_AUTHENTICATION_CLASSES": ("app.authentication.ShardedJWTAuthentication",),
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
     "PAGE_SIZE": 10,
     "DEFAULT_RENDERER_CLASSES": (
         "rest_framework.renderers.JSONRenderer",
         "rest_framework.renderers.BrowsableAPIRenderer",
     ),
+    "DEFAULT_THROTTLE_CLASSES": (
+        "app.throttles.ReadRateThrottle",
+        "app.throttles.WriteRateThrottle",
+    ),
+    "DEFAULT_THROTTLE_RATES": {
+        "read": os.environ.get("THROTTLE_READ_RATE", "60/min"),
+        "write": os.environ.get("THROTTLE_WRITE_RATE", "30/min"),
+    },
 }
 
+# collected cash at which a collector reaches the limit, and days after which they
+# are frozen, managers and collectors can override both (see app.thresholds)
+THRESHOLD = float(os.environ.get("THRESHOLD", 5000))
+THRESHOLD_DAYS = int(os.environ.get("THRESHOLD_DAYS", 2))
+
+# offline collects older than this many hours are refused by the sync endpoint
+SYNC_MAX_AGE_HOURS = int(os.environ.get("SYNC_MAX_AGE_HOURS", 72))
+
+# order in which a collector's next task is picked, one of
+# "id", "due_date", "amount" or "priority" (checked by `manage.py check`),
+# managers can override it
+NEXT_TASK_ORDERING = os.environ.get("NEXT_TASK_ORDERING", "id")
+
+# cache alias holding the threshold and next task ordering overrides of managers, it must
+# be shared by all workers (e.g. redis) for a change to reach every worker at once, with
+# the default per process cache the other workers pick it up within POLICY_CACHE_TIMEOUT
+# seconds
+POLICY_CACHE = os.environ.get("POLICY_CACHE", "default")
+POLICY_CACHE_TIMEOUT = int(os.environ.get("POLICY_CACHE_TIMEOUT", 300))
+
+# cache alias holding the throttle buckets so all workers share one budget,
+# when unset every worker keeps its own buckets in memory
+THROTTLE_CACHE = os.environ.get("THROTTLE_CACHE")
+
+# serve the read endpoints (tasks, next task, status) with native async views, for
+# ASGI deployments (cash_collector.asgi)
+ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS") == "1"
+
+# JSON responses smaller than this many bytes are sent uncompressed, HTML never is
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+
+# broker carrying the collectors' state changes to their /events/ streams, the
+# default in-process one only reaches streams held by the same worker
+PUSH_BROKER = os.environ.get("PUSH_BROKER", "app.push.LocalBroker")
+# seconds between keepalive comments on idle streams
+PUSH_KEEPALIVE_SECONDS = int(os.environ.get("PUSH_KEEPALIVE_SECONDS", 15))
+
+# profile the views of requests sent with an `X-Profile` token (manage.py
+# profile_token) and of a sampled share of all requests, see app.profiling
+PROFILING = os.environ.get("PROFILING") == "1"
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+# "sample" (flame graph stacks) or "cprofile" (deterministic, slower)
+PROFILER = os.environ.get("PROFILER", "sample")
+# seconds between samples, a busy view holds the GIL for the interpreter's switch
+# interval (5 ms) so going lower does not add samples
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", 0.005))
+PROFILE_TOKEN_MAX_AGE = int(os.environ.get("PROFILE_TOKEN_MAX_AGE", 3600))
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", BASE_DIR / "profiles"))
+# profiled requests kept in PROFILE_DIR, older ones are removed
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", 200))
+
 # JWT configurations
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
@@ -166,3 +245,19 @@ SPECTACULAR_SETTINGS = {
     "DESCRIPTION": "Project to collect cash from customers",
     "SERVE_INCLUDE_SCHEMA": False,
 }
+
+
+# prebuilt OpenAPI schema, written by `manage.py build_schema`
+OPENAPI_SCHEMA_PATH = BASE_DIR / "openapi.json"
+
+# Production mode, DJANGO_PRODUCTION=1 drops the dev-only apps and renderers so workers
+# never import them, the schema is then served from OPENAPI_SCHEMA_PATH
+PRODUCTION = os.environ.get("DJANGO_PRODUCTION") == "1"
+if PRODUCTION:
+    DEBUG = False
+    ALLOWED_HOSTS = os.environ.get("ALLOWED_HOSTS", "").split(",")
+    INSTALLED_APPS.remove("drf_spectacular")
+    del REST_FRAMEWORK["DEFAULT_SCHEMA_CLASS"]
+    REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"] = (
+        "rest_framework.renderers.JSONRenderer",
+    )
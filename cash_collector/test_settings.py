@@ -0,0 +1,20 @@
+"""
+Settings of the test suite, run it with
+`python manage.py test --settings=cash_collector.test_settings` (`make test`).
+"""
+
+import os
+
+from cash_collector.settings import *  # noqa: F401, F403
+from cash_collector.settings import BASE_DIR, DATABASES
+
+# the sharding tests move teams between shard_1 and shard_2
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT", 2))
+for shard in range(1, SHARD_COUNT + 1):
+    DATABASES[f"shard_{shard}"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / f"db_shard_{shard}.sqlite3",
+    }
+SHARDS = list(DATABASES)
+# the test runner is a single process
+SILENCED_SYSTEM_CHECKS = ["app.W001"]
@@ -15,13 +15,14 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
-from drf_spectacular.views import SpectacularSwaggerView, SpectacularAPIView
+from app.schema import StaticSchemaView
 
 
 auth_urls = [
@@ -29,10 +30,17 @@ auth_urls = [
     path("api/v1/refresh/", TokenRefreshView.as_view(), name="refresh-v1"),
 ]
 
-drf_urls = [
-    path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
-    path("api/docs/", SpectacularSwaggerView.as_view(), name="docs"),
-]
+if settings.PRODUCTION:
+    # prebuilt by `manage.py build_schema`, no drf_spectacular in production
+    drf_urls = [path("api/schema/", StaticSchemaView.as_view(), name="schema")]
+else:
+    from drf_spectacular.views import SpectacularSwaggerView, SpectacularAPIView
+
+    drf_urls = [
+        path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
+        path("api/schema/static/", StaticSchemaView.as_view(), name="static-schema"),
+        path("api/docs/", SpectacularSwaggerView.as_view(), name="docs"),
+    ]
 
 urlpatterns = [path("admin/", admin.site.urls), path("api/v1/", include("app.urls"))]
 